@@ -0,0 +1,86 @@
+import operator
+from usefulFunctions import *
+from callGraph import CallGraph
+from controlFlow import ControlFlowGraph
+
+__all__ = ['PROCEDURE_ANALYSES', 'FILE_ANALYSES', 'AnalysisManager']
+
+# Analyses of a single procedure by name, each computed from the array of the procedure's instructions:
+PROCEDURE_ANALYSES = {
+    'liveness': getFreeMasks,           # Bitmasks of units free to clobber before every instruction
+    'dependencies': DependencyGraph,    # Order constraints between the instructions
+    'controlFlow': ControlFlowGraph,    # Basic blocks and natural loops
+}
+
+# Analyses of an entire file by name, each computed from the 'FileData' object:
+FILE_ANALYSES = {
+    'callGraph': CallGraph,
+}
+
+
+def sameInstructions(instructions, otherInstructions) -> bool:
+    # Utility function checking whether two arrays hold the very same (immutable) instructions in the same order
+    return instructions is otherInstructions or (len(instructions) == len(otherInstructions) and
+                                                 all(map(operator.is_, instructions, otherInstructions)))
+
+
+class AnalysisManager:
+    """
+        Cache of analysis results shared by the techniques applied to a file (see 'Techniques.applyTo').
+        A result of a procedure analysis is reused as long as the procedure's instructions are the ones it was-
+        computed from: instructions are immutable, so a procedure a technique left unchanged (same instructions-
+        in the same order) keeps its results, while any change invalidates them.
+        Results of file analyses are kept for the same 'FileData' object until a technique that doesn't preserve-
+        them is applied (see 'Techniques.TECHNIQUE_ANALYSES' and 'invalidate').
+    """
+
+    def __init__(self):
+        self.procedureResults = dict()  # Dictionary mapping (analysis, procedure) to (instructions, result)
+        self.fileResults = dict()       # Dictionary mapping analyses to ('FileData' object, result)
+        self.hits = 0
+        self.misses = 0
+
+    def procedure(self, name: str, procName: str, instructions):
+        # Result of the procedure analysis 'name' of procedure 'procName' made of 'instructions'
+        entry = self.procedureResults.get((name, procName))
+        if entry is not None and sameInstructions(entry[0], instructions):
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        result = PROCEDURE_ANALYSES[name](instructions)
+        self.procedureResults[(name, procName)] = (instructions, result)
+        return result
+
+    def file(self, name: str, fd: FileData):
+        # Result of the file analysis 'name' of 'fd'
+        entry = self.fileResults.get(name)
+        if entry is not None and entry[0] is fd:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        result = FILE_ANALYSES[name](fd)
+        self.fileResults[name] = (fd, result)
+        return result
+
+    def provide(self, name: str, fd: FileData, result):
+        # Stores 'result' (computed elsewhere) as the result of the file analysis 'name' of 'fd'
+        self.fileResults[name] = (fd, result)
+
+    def invalidate(self, preserved=()):
+        # Drops the results of all file analyses but 'preserved' (called after a technique is applied)
+        for name in list(self.fileResults):
+            if name not in preserved:
+                del self.fileResults[name]
+
+    def retain(self, fd: FileData):
+        # Drops the results of procedure analyses that are out of date in 'fd' (so they can be freed)
+        for (name, procName), (instructions, _) in list(self.procedureResults.items()):
+            segmentIdx = fd.functions.get(procName)
+            current = fd.textSegments[segmentIdx].processes.get(procName) if segmentIdx is not None else None
+            if current is None or not sameInstructions(instructions, current):
+                del self.procedureResults[(name, procName)]
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,253 @@
+import argparse
+import collections
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from techniques import *
+
+# Names accepted on the command line for each technique:
+TECHNIQUE_NAMES = {
+    'inline': Techniques.TECHNIQUE_FUNCTION_INLINING,
+    'junk': Techniques.TECHNIQUE_JUNK_CODE,
+    'permute': Techniques.TECHNIQUE_PERMUTE_LINES,
+}
+
+DEFAULT_PIPELINE = 'junk,inline,permute,junk,inline,permute'    # Same order as the default of 'Techniques'
+
+
+def collectFiles(patterns: [str]) -> [(str, str)]:
+    """
+        Utility function for expanding the given paths, globs and directories into a sorted list of '.asm' files.
+        Directories are searched recursively.
+
+        returns: array of (file, relative path) where the relative path of a file found in a directory is its path-
+                 within the directory (so results mirror the tree) and that of any other file is its name
+    """
+
+    files = dict()      # Dictionary mapping normalized paths of files to (file, relative path)
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for path in glob.glob(os.path.join(pattern, '**', '*.asm'), recursive=True):
+                files.setdefault(os.path.normpath(path), (path, os.path.relpath(path, pattern)))
+        else:
+            for path in glob.glob(pattern, recursive=True):
+                if os.path.isfile(path):
+                    files.setdefault(os.path.normpath(path), (path, os.path.basename(path)))
+
+    return sorted(files.values())
+
+
+def outputLocation(relativePath: str, outDir: str, suffix: str) -> str:
+    # Utility function for naming the obfuscated copy of the file of 'relativePath' (same convention as the GUI).
+    filename = os.path.splitext(relativePath)[0]
+    return os.path.join(outDir, filename + suffix + '.asm')
+
+
+def processFile(job):
+    """
+        Worker function applying the techniques to a single file.
+        The 'Techniques' object is built inside the worker since its technique functions can't be pickled.
+
+        arg 'job': tuple of (file, newLocation, techniqueArgs, fused, procedureWorkers, metricsArgs, cacheArgs,-
+               incrementalState, irLocation) where 'techniqueArgs', 'metricsArgs' and 'cacheArgs' are the 'Techniques',-
+               'Metrics' and 'OutputCache' constructor kwargs (the latter two None if unused)-
+               and the rest are passed to 'applyTechniques'
+
+        returns: tuple of (file, newLocation, error message or None, elapsed seconds, array of metrics records)
+    """
+
+    file, newLocation, techniqueArgs, fused, procedureWorkers, metricsArgs, cacheArgs, incrementalState, \
+        irLocation = job
+    metrics = Metrics(**metricsArgs) if metricsArgs is not None else None
+    cache = OutputCache(**cacheArgs) if cacheArgs is not None else None
+    records = metrics.records if metrics is not None else []
+    start = time.perf_counter()
+    try:
+        applyTechniques(file, newLocation, Techniques(**techniqueArgs), fused, procedureWorkers, metrics, cache,
+                        incrementalState, irLocation)
+    except Exception as e:
+        return file, newLocation, '{}: {}'.format(type(e).__name__, e), time.perf_counter() - start, records
+
+    return file, newLocation, None, time.perf_counter() - start, records
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(
+        description='Apply the Nudnik anti disassembly techniques to many .asm files in parallel.')
+    parser.add_argument('inputs', nargs='+', help='.asm files, globs or directories (searched recursively)')
+    parser.add_argument('-o', '--output', default='.', help='directory to which to save the resulting files')
+    parser.add_argument('--suffix', default='_nudnik', help='suffix appended to the name of each resulting file')
+    parser.add_argument('--inline', action='store_true', help='apply function inlining')
+    parser.add_argument('--junk', action='store_true', help='apply junk code')
+    parser.add_argument('--permute', action='store_true', help='apply line permutation')
+    parser.add_argument('--pipeline', default=DEFAULT_PIPELINE,
+                        help='comma separated order in which to apply the techniques (default: %(default)s)')
+    parser.add_argument('--junk-size', type=int, default=2, help='maximal amount of junk lines per instruction')
+    parser.add_argument('--junk-loop-scale', type=float, default=1.0,
+                        help='fraction of the junk lines per instruction kept per level of loop nesting, '
+                             'e.g. 0.5 halves them in loops and quarters them in nested ones (default: %(default)s)')
+    parser.add_argument('--junk-skip-innermost-loops', action='store_true',
+                        help='inject no junk code into innermost loops')
+    parser.add_argument('--seed', type=int,
+                        help='seed making the results reproducible (derived per file, procedure and technique)')
+    parser.add_argument('--max-lines', type=int, help='maximal number of text segment lines per resulting file')
+    parser.add_argument('--max-bytes', type=int, help='maximal size in bytes of each resulting file')
+    parser.add_argument('--max-procedure-lines', type=int, help='maximal number of lines per resulting procedure')
+    parser.add_argument('--max-overhead', type=float,
+                        help='maximal estimated slowdown of every procedure in percent, junk code and inlining '
+                             'that would exceed it are skipped')
+    parser.add_argument('--staged', action='store_true',
+                        help='apply every technique to the entire file before the next one (same result, slower)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--procedure-workers', type=int, default=1,
+                        help='number of worker processes sharing the procedures of each file (for few large files), '
+                             'files are then processed one at a time (default: %(default)s)')
+    parser.add_argument('--metrics', help='file to which to write the metrics of every stage as JSON lines')
+    parser.add_argument('--metrics-procedures', action='store_true',
+                        help='include the instruction counts of every procedure in the metrics')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='include the peak memory of every file in the metrics (slow)')
+    parser.add_argument('--metrics-cycles', action='store_true',
+                        help='include the estimated cycles before and after every stage in the metrics')
+    parser.add_argument('--cache', help='directory of a cache of results to reuse (only used with --seed)')
+    parser.add_argument('--cache-size', type=int, default=OutputCache.DEFAULT_MAX_BYTES >> 20,
+                        help='maximal size of the cache in MiB (default: %(default)s)')
+    parser.add_argument('--incremental',
+                        help='directory of the states of previous runs (one per resulting file), only procedures '
+                             'changed since the previous run are transformed again (only used with --seed)')
+    parser.add_argument('--ir',
+                        help='directory of the parsed and analyzed inputs in binary form, reused by later runs '
+                             'while the inputs are unchanged (skipping parsing)')
+    args = parser.parse_args(argv)
+
+    try:
+        args.pipeline = [TECHNIQUE_NAMES[name.strip()] for name in args.pipeline.split(',') if name.strip()]
+    except KeyError as e:
+        parser.error('unknown technique {} in --pipeline (expected one of: {})'.format(
+            e, ', '.join(TECHNIQUE_NAMES)))
+
+    if args.junk_size < 0:
+        parser.error('--junk-size must not be negative')
+
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    if args.procedure_workers < 1:
+        parser.error('--procedure-workers must be at least 1')
+
+    if args.max_overhead is not None and args.max_overhead < 0:
+        parser.error('--max-overhead must not be negative')
+
+    if not 0 <= args.junk_loop_scale <= 1:
+        parser.error('--junk-loop-scale must be between 0 and 1')
+
+    if args.cache is not None and args.seed is None:
+        parser.error('--cache requires --seed (results are random otherwise)')
+
+    if args.incremental is not None and args.seed is None:
+        parser.error('--incremental requires --seed (results are random otherwise)')
+
+    if not (args.inline or args.junk or args.permute):
+        parser.error('no technique selected (use --inline, --junk and/or --permute)')
+
+    return args
+
+
+def main(argv=None) -> int:
+    """
+        Command line entry point. Returns the exit code: 0 if every file was processed successfully, 1 otherwise.
+    """
+
+    args = parseArguments(argv)
+
+    files = collectFiles(args.inputs)
+    if len(files) == 0:
+        print('No .asm files found', file=sys.stderr)
+        return 1
+
+    outputs = [outputLocation(relativePath, args.output, args.suffix) for _, relativePath in files]
+    collisions = collections.defaultdict(list)      # Dictionary mapping resulting files to their inputs
+    for (file, _), newLocation in zip(files, outputs):
+        collisions[os.path.normcase(os.path.normpath(newLocation))].append(file)
+    collisions = [inputs for inputs in collisions.values() if len(inputs) > 1]
+    if len(collisions) != 0:
+        for inputs in collisions:
+            print('Inputs {} would be saved to the same file'.format(', '.join(inputs)), file=sys.stderr)
+        return 1
+
+    budget = None
+    if args.max_lines is not None or args.max_bytes is not None or args.max_procedure_lines is not None:
+        budget = GrowthBudget(args.max_lines, args.max_bytes, args.max_procedure_lines)
+
+    techniqueArgs = dict(applies_functionInlining=args.inline, applies_junkCode=args.junk,
+                         applies_permuteLines=args.permute, junkSize=args.junk_size, pipeline=args.pipeline,
+                         budget=budget, seed=args.seed, maxOverhead=args.max_overhead,
+                         junkLoopScale=args.junk_loop_scale, junkSkipsInnermostLoops=args.junk_skip_innermost_loops)
+    metricsArgs = None
+    metricsFile = None
+    if args.metrics is not None:
+        metricsArgs = dict(perProcedure=args.metrics_procedures, traceMemory=args.trace_memory,
+                           estimateCycles=args.metrics_cycles)
+        metricsFile = open(args.metrics, 'w')
+
+    cacheArgs = dict(directory=args.cache, maxBytes=args.cache_size << 20) if args.cache is not None else None
+
+    # States and IR mirror the resulting files and the inputs respectively, so they're as distinct:
+    def stateLocation(newLocation):
+        if args.incremental is None:
+            return None
+        return os.path.join(args.incremental, os.path.relpath(newLocation, args.output) + '.json')
+
+    def irLocation(relativePath):
+        if args.ir is None:
+            return None
+        return os.path.join(args.ir, relativePath + IR_SUFFIX)
+
+    jobs = [(file, newLocation, techniqueArgs, not args.staged, args.procedure_workers, metricsArgs, cacheArgs,
+             stateLocation(newLocation), irLocation(relativePath))
+            for (file, relativePath), newLocation in zip(files, outputs)]
+
+    for job in jobs:
+        for location in (job[1], job[7], job[8]):
+            if location is not None:
+                os.makedirs(os.path.dirname(location) or '.', exist_ok=True)
+
+    numFailed = 0
+    start = time.perf_counter()
+
+    def report(result):
+        nonlocal numFailed
+        file, newLocation, error, elapsed, records = result
+        if metricsFile is not None:
+            metricsFile.writelines(json.dumps(record) + '\n' for record in records)
+        if error is None:
+            print('ok     {} -> {} ({:.2f}s)'.format(file, newLocation, elapsed))
+        else:
+            numFailed += 1
+            print('FAILED {}: {}'.format(file, error), file=sys.stderr)
+
+    # Pool workers can't start pools of their own, so files sharded by procedure are processed one at a time:
+    workers = min(args.workers, len(jobs)) if args.procedure_workers == 1 else 1
+    if workers == 1:
+        for job in jobs:
+            report(processFile(job))
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            for result in pool.imap_unordered(processFile, jobs):
+                report(result)
+
+    print('{} file(s) processed, {} failed, in {:.2f}s using {} worker(s)'.format(
+        len(jobs), numFailed, time.perf_counter() - start, workers))
+
+    if metricsFile is not None:
+        metricsFile.close()
+
+    return 1 if numFailed != 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+# Benchmarks of the anti disassembly techniques. Run from the repository root, e.g.:
+#   python -m benchmarks.runBenchmarks run -o results.json
+#   python -m benchmarks.runBenchmarks compare baseline.json results.json
+#   python -m benchmarks.listingGenerator listing.asm --procedures 100
+#   python -m benchmarks.permuteLinesScaling
@@ -0,0 +1,178 @@
+import argparse
+import random
+from fileData import *
+
+# Weighted templates of the (compiler-like) instructions procedures are made of,
+# '{r}' / '{s}' are replaced by random registers, '{local}' by a local variable and '{global}' by a global one:
+INSTRUCTION_TEMPLATES = [
+    (30, 'mov {r}, {s}'),
+    (15, 'mov {r}, DWORD PTR {local}[ebp]'),
+    (8,  'mov DWORD PTR {local}[ebp], {r}'),
+    (12, 'add {r}, {s}'),
+    (6,  'sub {r}, 4'),
+    (5,  'xor {r}, {r}'),
+    (5,  'cmp {r}, 10'),
+    (4,  'lea {r}, DWORD PTR [{s}+{s}*2]'),
+    (4,  'push {r}'),
+    (4,  'pop {r}'),
+    (3,  'inc {r}'),
+    (3,  'mov {r}, DWORD PTR {global}'),
+    (1,  'cdq'),
+]
+
+REGISTERS = ['eax', 'ecx', 'edx', 'ebx', 'esi', 'edi']     # In order of preference of the compiler
+
+CONDITIONAL_JUMPS = ['je', 'jne', 'jl', 'jle', 'jg', 'jge']
+
+LISTING_HEADER = '''; Listing generated by Microsoft (R) Optimizing Compiler Version 19.00.23506.0
+
+	TITLE	C:\\work\\generated.c
+	.686P
+	.XMM
+	include listing.inc
+	.model	flat
+
+INCLUDELIB LIBCMT
+INCLUDELIB OLDNAMES
+
+'''
+
+
+class ListingParameters:
+    """
+        Parameters of a generated listing.
+
+        arg 'procedures': number of procedures
+        arg 'instructions': number of body instructions per procedure (besides prologue and epilogue)
+        arg 'callDensity': probability of every body instruction being a call (to another generated procedure)
+        arg 'callDepth': maximal length of call chains (bounds the growth of inlining)
+        arg 'registerPressure': number of registers the code uses (1 to 6)
+        arg 'branchDensity': probability of every body instruction being a conditional jump to a label
+        arg 'globals': number of global variables in the data segment
+        arg 'locals': number of local variables (and arguments) per procedure
+    """
+
+    def __init__(self, procedures: int = 50, instructions: int = 200, callDensity: float = 0.01, callDepth: int = 2,
+                 registerPressure: int = 6, branchDensity: float = 0.05, globals: int = 16, locals: int = 4):
+        self.procedures = procedures
+        self.instructions = instructions
+        self.callDensity = callDensity
+        self.callDepth = callDepth
+        self.registerPressure = registerPressure
+        self.branchDensity = branchDensity
+        self.globals = globals
+        self.locals = locals
+
+
+def generateInstructionLines(numInstructions: int, rng: random.Random, registers=REGISTERS,
+                             localNames=('_x$',), globalNames=('_g0',)) -> [str]:
+    # Utility function for generating 'numInstructions' random straight-line instructions (as lines of text)
+    weights = [weight for weight, _ in INSTRUCTION_TEMPLATES]
+    templates = [template for _, template in INSTRUCTION_TEMPLATES]
+    return [template.format(r=rng.choice(registers), s=rng.choice(registers),
+                            local=rng.choice(localNames), **{'global': rng.choice(globalNames)})
+            for template in rng.choices(templates, weights, k=numInstructions)]
+
+
+def generateProcedure(numInstructions: int, rng: random.Random, registers=REGISTERS) \
+        -> [FileData.TextSegment.Instruction]:
+    # Utility function for generating a procedure of 'numInstructions' random straight-line instructions
+    return [FileData.TextSegment.Instruction(line.split())
+            for line in generateInstructionLines(numInstructions, rng, registers)]
+
+
+def generateListing(params: ListingParameters, rng: random.Random) -> str:
+    """
+        Generates an MSVC style listing: a data segment of globals and a text segment per procedure,
+        with the arguments and locals of the procedure, a standard prologue and epilogue, labels, branches (forward-
+        and backward) and calls to other procedures.
+
+        Procedures are split into 'callDepth' + 1 levels, procedures only call procedures of lower levels.
+
+    returns: the text of the listing
+    """
+
+    registers = REGISTERS[:max(1, min(params.registerPressure, len(REGISTERS)))]
+    globalNames = ['_g{}'.format(idx) for idx in range(max(1, params.globals))]
+    procNames = ['_f{}'.format(idx) for idx in range(params.procedures)]
+    numLevels = params.callDepth + 1
+
+    parts = [LISTING_HEADER, '_DATA\tSEGMENT\n']
+    parts.extend('{}\tDD\t0{:x}H\n'.format(name, idx) for idx, name in enumerate(globalNames))
+    parts.append('_DATA\tENDS\n')
+    parts.extend('PUBLIC\t{}\n'.format(name) for name in procNames)
+
+    for procIdx, procName in enumerate(procNames):
+        level = procIdx % numLevels
+        callees = [name for idx, name in enumerate(procNames[:procIdx]) if idx % numLevels < level]
+
+        localNames = ['_a{}$'.format(idx) for idx in range(max(1, params.locals))]
+        parts.append('; Function compile flags: /Odtp\n_TEXT\tSEGMENT\n')
+        parts.extend('{} = {}\t\t\t\t\t\t; size = 4\n'.format(name, 8 + 4 * idx) for idx, name in enumerate(localNames))
+        parts.append('{}\tPROC\n\tpush\tebp\n\tmov\tebp, esp\n'.format(procName))
+
+        numLabels = 0
+        pendingLabel = None     # Countdown of instructions until the label a forward jump targets
+        body = generateInstructionLines(params.instructions, rng, registers, localNames, globalNames)
+        for line in body:
+            roll = rng.random()
+            if roll < params.callDensity and len(callees) != 0:
+                parts.append('\tpush\t{}\n\tcall\t{}\n\tadd\tesp, 4\n'.format(rng.choice(registers),
+                                                                            rng.choice(callees)))
+            elif roll < params.callDensity + params.branchDensity:
+                # Either a loop back to the last label or a jump forward to the next one
+                if pendingLabel is None and (numLabels == 0 or rng.random() < 0.5):
+                    target = numLabels
+                    pendingLabel = rng.randint(1, 8)
+                else:
+                    target = max(0, numLabels - 1)
+                parts.append('\tcmp\t{}, {}\n\t{}\tSHORT $LN{}@{}\n'.format(
+                    rng.choice(registers), rng.randint(0, 100), rng.choice(CONDITIONAL_JUMPS), target, procName[1:]))
+
+            parts.append('\t' + line.replace(' ', '\t', 1) + '\n')
+
+            if pendingLabel is not None:
+                pendingLabel -= 1
+                if pendingLabel == 0:
+                    parts.append('$LN{}@{}:\n'.format(numLabels, procName[1:]))
+                    numLabels += 1
+                    pendingLabel = None
+
+        if pendingLabel is not None:
+            parts.append('$LN{}@{}:\n'.format(numLabels, procName[1:]))
+
+        parts.append('\tpop\tebp\n\tret\t0\n{}\tENDP\n_TEXT\tENDS\n'.format(procName))
+
+    parts.append('END\n')
+    return ''.join(parts)
+
+
+def writeListing(location: str, params: ListingParameters, seed: int = 0):
+    # Utility function for generating a listing and saving it to 'location'
+    with open(location, 'w', newline='\n') as f:
+        f.write(generateListing(params, random.Random(seed)))
+
+
+def main(argv=None):
+    defaults = ListingParameters()
+    parser = argparse.ArgumentParser(description='Generate a synthetic MSVC style .asm listing.')
+    parser.add_argument('output', help='location to which to save the listing')
+    parser.add_argument('--procedures', type=int, default=defaults.procedures)
+    parser.add_argument('--instructions', type=int, default=defaults.instructions,
+                        help='instructions per procedure (default: %(default)s)')
+    parser.add_argument('--call-density', type=float, default=defaults.callDensity)
+    parser.add_argument('--call-depth', type=int, default=defaults.callDepth)
+    parser.add_argument('--register-pressure', type=int, default=defaults.registerPressure)
+    parser.add_argument('--branch-density', type=float, default=defaults.branchDensity)
+    parser.add_argument('--globals', type=int, default=defaults.globals)
+    parser.add_argument('--locals', type=int, default=defaults.locals)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    writeListing(args.output, ListingParameters(args.procedures, args.instructions, args.call_density,
+                                                args.call_depth, args.register_pressure, args.branch_density,
+                                                args.globals, args.locals), args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import random
+import time
+from techniques import *
+from benchmarks.listingGenerator import generateProcedure
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scaling of the dependency DAG scheduler of permuteLines.')
+    parser.add_argument('--sizes', default='10000,25000,50000,100000',
+                        help='comma separated procedure sizes in instructions (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per size, the best is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    print('{:>12} {:>10} {:>10} {:>10} {:>12} {:>12}'.format(
+        'instructions', 'nodes', 'edges', 'build [s]', 'schedule [s]', 'us/instr'))
+
+    for size in [int(size) for size in args.sizes.split(',')]:
+        procedure = generateProcedure(size, rng)
+        bestBuild = bestSchedule = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            graph = DependencyGraph(procedure)
+            built = time.perf_counter()
+            graph.randomTopologicalOrder()
+            done = time.perf_counter()
+            bestBuild = min(bestBuild, built - start)
+            bestSchedule = min(bestSchedule, done - built)
+
+        print('{:>12} {:>10} {:>10} {:>10.3f} {:>12.3f} {:>12.2f}'.format(
+            size, graph.numNodes, graph.numEdges(), bestBuild, bestSchedule,
+            (bestBuild + bestSchedule) / size * 1e6))
+
+
+if __name__ == '__main__':
+    main()
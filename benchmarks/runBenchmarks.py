@@ -0,0 +1,178 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from techniques import *
+from binaryIR import saveIR, loadIR
+from benchmarks.listingGenerator import ListingParameters, writeListing
+
+# Generated listings the benchmarks run on:
+BENCHMARK_CASES = {
+    'small': ListingParameters(procedures=20, instructions=100),
+    'medium': ListingParameters(procedures=100, instructions=300, callDensity=0.003),
+    'callHeavy': ListingParameters(procedures=60, instructions=100, callDensity=0.03, callDepth=3),
+    'lowPressure': ListingParameters(procedures=100, instructions=300, callDensity=0.003, registerPressure=2),
+    'large': ListingParameters(procedures=200, instructions=1000, callDensity=0.001),
+}
+
+DEFAULT_CASES = 'small,medium,callHeavy,lowPressure'
+
+# Timed stages (every technique is timed separately on a freshly parsed file):
+STAGES = ['parse', 'loadIR', 'functionInlining', 'junkCode', 'permuteLines', 'pipeline', 'saveFile']
+
+RESULTS_VERSION = 1
+
+REGRESSION_THRESHOLD = 0.10     # Relative slowdown flagged as a regression
+NOISE_FLOOR = 0.002             # Slowdowns of less seconds than this are never flagged
+
+
+def timeStages(location: str, seed: int, outLocation: str) -> dict:
+    # Utility function timing every stage once on the listing at 'location', returns a dictionary of seconds per stage
+
+    times = dict()
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        times[stage] = time.perf_counter() - start
+        return result
+
+    irLocation = outLocation + '.nir'
+    saveIR(timed('parse', FileData, location), irLocation)
+    timed('loadIR', loadIR, irLocation)
+    timed('functionInlining', functionInlining, FileData(location))
+    # Every technique draws from its own generator seeded by 'seed', so the measured work is the same every run:
+    timed('junkCode', getJunkCodeFunction(), FileData(location), random.Random(seed))
+    timed('permuteLines', permuteLines, FileData(location), random.Random(seed))
+    result = timed('pipeline', Techniques(True, True, True, seed=seed).applyTo, FileData(location))
+    timed('saveFile', result.saveFile, outLocation)
+
+    return times
+
+
+def runBenchmarks(cases: [str], repeat: int = 3, seed: int = 0) -> dict:
+    """
+        Generates the listing of every case and times every stage on it.
+
+    returns: dictionary of results (as saved to JSON), the best time of 'repeat' runs is kept per stage
+    """
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'seed': seed,
+        'cases': dict(),
+    }
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for case in cases:
+            params = BENCHMARK_CASES[case]
+            location = os.path.join(tmpDir, case + '.asm')
+            writeListing(location, params, seed)
+
+            best = dict()
+            for _ in range(repeat):
+                for stage, seconds in timeStages(location, seed, os.path.join(tmpDir, case + '_out.asm')).items():
+                    best[stage] = min(seconds, best.get(stage, seconds))
+
+            results['cases'][case] = {
+                'parameters': vars(params),
+                'bytes': os.path.getsize(location),
+                'stages': best,
+            }
+            print('{:<12} '.format(case) + ' '.join('{}={:.3f}s'.format(stage, best[stage]) for stage in STAGES),
+                  flush=True)
+
+    return results
+
+
+def compareResults(baseline: dict, current: dict, threshold: float = REGRESSION_THRESHOLD) -> [(str, str)]:
+    """
+        Prints the timing of every (case, stage) of 'current' relative to 'baseline'.
+
+    returns: array of the (case, stage) pairs that regressed by more than 'threshold'
+    """
+
+    regressions = []
+    print('{:<12} {:<17} {:>10} {:>10} {:>8}'.format('case', 'stage', 'baseline', 'current', 'ratio'))
+    for case, caseResults in current['cases'].items():
+        if case not in baseline['cases']:
+            continue
+        baselineStages = baseline['cases'][case]['stages']
+        for stage, seconds in caseResults['stages'].items():
+            if stage not in baselineStages:
+                continue
+            reference = baselineStages[stage]
+            ratio = seconds / reference if reference > 0 else float('inf')
+            regressed = ratio > 1 + threshold and seconds - reference > NOISE_FLOOR
+            if regressed:
+                regressions.append((case, stage))
+            print('{:<12} {:<17} {:>10.4f} {:>10.4f} {:>7.2f}x{}'.format(
+                case, stage, reference, seconds, ratio, '  REGRESSION' if regressed else ''))
+
+    return regressions
+
+
+def loadResults(location: str) -> dict:
+    with open(location) as f:
+        results = json.load(f)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError('{}: unsupported results version {}'.format(location, results.get('version')))
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks of parsing, the techniques and saving on generated listings.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    runParser = commands.add_parser('run', help='run the benchmarks and save the results as JSON')
+    runParser.add_argument('-o', '--output', default='benchmarkResults.json', help='location of the results')
+    runParser.add_argument('--cases', default=DEFAULT_CASES,
+                           help='comma separated cases out of: {} (default: %(default)s)'.format(
+                               ', '.join(BENCHMARK_CASES)))
+    runParser.add_argument('--repeat', type=int, default=3, help='runs per case, the best is kept per stage')
+    runParser.add_argument('--seed', type=int, default=0)
+    runParser.add_argument('--baseline', help='results to compare to once done (see the compare command)')
+    runParser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+
+    compareParser = commands.add_parser('compare', help='flag regressions of results relative to a baseline')
+    compareParser.add_argument('baseline', help='stored baseline results')
+    compareParser.add_argument('current', help='results to check')
+    compareParser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                               help='relative slowdown flagged as a regression (default: %(default)s)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        cases = [case.strip() for case in args.cases.split(',') if case.strip()]
+        unknown = [case for case in cases if case not in BENCHMARK_CASES]
+        if unknown:
+            parser.error('unknown case(s): {}'.format(', '.join(unknown)))
+
+        current = runBenchmarks(cases, args.repeat, args.seed)
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print('Results saved to {}'.format(args.output))
+
+        if args.baseline is None:
+            return 0
+        baseline = loadResults(args.baseline)
+    else:
+        baseline = loadResults(args.baseline)
+        current = loadResults(args.current)
+
+    regressions = compareResults(baseline, current, args.threshold)
+    print('{} regression(s)'.format(len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
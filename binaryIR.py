@@ -0,0 +1,267 @@
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from fileData import *
+
+__all__ = ['IR_VERSION', 'IR_SUFFIX', 'analysisDigest', 'saveIR', 'loadIR', 'readIR', 'parseWithIR']
+
+IR_VERSION = 1      # Bumped whenever the format (or the analysis of instructions) changes
+IR_MAGIC = b'NUDNIKIR'
+IR_SUFFIX = '.nir'
+
+# Header: magic, version, number of units, digest of the analysis tables, size and modification time (ns) of the-
+# source file, number of sections. Followed by an (offset, length) pair in bytes per section.
+HEADER_FORMAT = struct.Struct('<8sII32sQqI')
+SECTION_ENTRY_FORMAT = struct.Struct('<QQ')
+SECTION_ALIGNMENT = 8   # Sections start at multiples of this so they can be cast in place
+
+# Sections in order, all little-endian arrays of the given type code:
+SECTIONS = [
+    ('words', 'B'),         # Encoded distinct words of all lines and names
+    ('wordOffsets', 'I'),   # Offset of every word in 'words' (plus the end)
+    ('lineWords', 'I'),     # Word ids of every distinct instruction line
+    ('lineOffsets', 'I'),   # Offset of every line in 'lineWords' (plus the end)
+    ('uses', 'I'),          # Analysis of every distinct line (see 'FileData.TextSegment.Instruction')
+    ('changes', 'I'),
+    ('includes', 'I'),
+    ('instructions', 'I'),  # Line ids of the instructions of all processes
+    ('processes', 'I'),     # (name word, segment index, offset in 'instructions', count) per process
+    ('segments', 'I'),      # (offset in 'segmentData', count, offset in 'names', count) per text segment
+    ('segmentData', 'I'),   # (name word, value word) per data of all text segments
+    ('names', 'I'),         # Words of the labels of all text segments, then of the file
+    ('raw', 'B'),           # Bytes of the lines no technique alters
+    ('regions', 'Q'),       # (name word + 1 or 0, start, end in 'raw') per segment-less, data and misc region
+    ('meta', 'Q'),          # (offset of file labels in 'names', count, source path word + 1 or 0)
+]
+
+analysisDigestCache = []    # Digest of the analysis tables, computed once (see 'analysisDigest')
+
+
+def analysisDigest() -> bytes:
+    # Utility function hashing the tables instructions are analyzed by, so IR analyzed by other tables is rejected
+    if len(analysisDigestCache) == 0:
+        Instruction = FileData.TextSegment.Instruction
+        tables = (Instruction.NUM_UNITS, sorted(Instruction.SEMANTICS.items()),
+                  sorted(Instruction.CONTROL_FLOW_MNEMONICS), sorted(Instruction.registerNames.items()))
+        analysisDigestCache.append(hashlib.sha256(repr(tables).encode()).digest())
+    return analysisDigestCache[0]
+
+
+def littleEndian(view, typeCode: str):
+    # Utility function viewing the bytes 'view' as an array of 'typeCode' (copied only on big-endian platforms)
+    if sys.byteorder == 'little':
+        return view.cast(typeCode)
+    values = array(typeCode, bytes(view))
+    values.byteswap()
+    return values
+
+
+def saveIR(fd: FileData, location: str, sourceStat: os.stat_result = None):
+    """
+        Saves the parsed and analyzed 'fd' to 'location' in the binary IR format (see 'loadIR'), atomically.
+        Every distinct word and instruction line is stored once, along with the analysis of the line.
+
+    arg 'sourceStat': result of 'os.stat' of the source file, against which 'loadIR' checks the IR is up to date
+    """
+
+    Instruction = FileData.TextSegment.Instruction
+    if Instruction.NUM_UNITS > 32:
+        raise ValueError('masks of {} units don\'t fit the IR'.format(Instruction.NUM_UNITS))
+
+    wordIds = dict()
+
+    def wordId(word):
+        idx = wordIds.get(word)
+        if idx is None:
+            idx = wordIds[word] = len(wordIds)
+        return idx
+
+    arrays = {name: array(typeCode) for name, typeCode in SECTIONS}
+    lineIds = dict()
+    lineWords, lineOffsets = arrays['lineWords'], arrays['lineOffsets']
+    for segmentIdx, ts in enumerate(fd.textSegments):
+        for procName, procInstructions in ts.processes.items():
+            arrays['processes'].extend((wordId(procName), segmentIdx, len(arrays['instructions']),
+                                        len(procInstructions)))
+            for ins in procInstructions:
+                lineIdx = lineIds.get(ins.line)
+                if lineIdx is None:
+                    lineIdx = lineIds[ins.line] = len(lineIds)
+                    lineOffsets.append(len(lineWords))
+                    lineWords.extend(wordId(word) for word in ins.line)
+                    arrays['uses'].append(ins.uses)
+                    arrays['changes'].append(ins.changes)
+                    arrays['includes'].append(ins.includes)
+                arrays['instructions'].append(lineIdx)
+
+        arrays['segments'].extend((len(arrays['segmentData']) // 2, len(ts.data),
+                                   len(arrays['names']), len(ts.labels)))
+        for dataName, dataValue in ts.data.items():
+            arrays['segmentData'].extend((wordId(dataName), wordId(dataValue)))
+        arrays['names'].extend(wordId(label) for label in ts.labels)
+    lineOffsets.append(len(lineWords))
+
+    arrays['meta'].extend((len(arrays['names']), len(fd.labels),
+                           wordId(os.fspath(fd.sourcePath)) + 1 if fd.sourcePath is not None else 0))
+    arrays['names'].extend(wordId(label) for label in fd.labels)
+
+    # Regions of raw lines, stored as the bytes 'saveFile' writes for them:
+    raw = bytearray()
+    regions = [(None, fd.segmentlessLines), (None, fd.data)] + list(fd.miscSegments.items())
+    for name, lines in regions:
+        start = len(raw)
+        if isinstance(lines, RawLines):
+            view = memoryview(lines.buffer)
+            for spanStart, spanEnd in lines.spans:
+                raw += view[spanStart:spanEnd]
+        else:
+            raw += FileData.joinLines(lines)
+        arrays['regions'].extend((wordId(name) + 1 if name is not None else 0, start, len(raw)))
+    arrays['raw'] = array('B', raw)
+
+    encodedWords = [word.encode(FileData.ENCODING, FileData.ENCODING_ERRORS) for word in wordIds]
+    arrays['words'] = array('B', b''.join(encodedWords))
+    wordOffsets = arrays['wordOffsets']
+    offset = 0
+    for encoded in encodedWords:
+        wordOffsets.append(offset)
+        offset += len(encoded)
+    wordOffsets.append(offset)
+
+    # Laying out the sections after the header:
+    sections = []
+    position = HEADER_FORMAT.size + SECTION_ENTRY_FORMAT.size * len(SECTIONS)
+    for name, _ in SECTIONS:
+        values = arrays[name]
+        if sys.byteorder != 'little':
+            values.byteswap()
+        position += -position % SECTION_ALIGNMENT
+        sections.append((position, values))
+        position += len(values) * values.itemsize
+
+    sourceSize, sourceTime = (sourceStat.st_size, sourceStat.st_mtime_ns) if sourceStat is not None else (0, 0)
+    with atomicWrite(location, buffering=FileData.WRITE_BUFFER_SIZE) as f:
+        f.write(HEADER_FORMAT.pack(IR_MAGIC, IR_VERSION, Instruction.NUM_UNITS, analysisDigest(),
+                                   sourceSize, sourceTime, len(SECTIONS)))
+        for sectionStart, values in sections:
+            f.write(SECTION_ENTRY_FORMAT.pack(sectionStart, len(values) * values.itemsize))
+        for sectionStart, values in sections:
+            f.write(b'\0' * (sectionStart - f.tell()))
+            values.tofile(f)
+
+
+def loadIR(location: str, sourceStat: os.stat_result = None) -> FileData:
+    """
+        Loads a 'FileData' object saved by 'saveIR' without parsing or analyzing any line.
+        The file is memory mapped and its arrays are viewed in place (see 'readIR'), the mapping is closed once-
+        the object is built (raw lines are copied out of it).
+
+    arg 'sourceStat': result of 'os.stat' of the source file the IR must be up to date with (None to skip the check)
+
+    raises: 'ValueError' if the file isn't IR of the current version and analysis, or is out of date
+    """
+
+    with open(location, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        fd = readIR(buffer, location, sourceStat)
+        fd.detachRawLines()
+    finally:
+        buffer.close()
+
+    return fd
+
+
+def readIR(buffer, location: str, sourceStat: os.stat_result = None) -> FileData:
+    """
+        Builds a 'FileData' object from the IR contents 'buffer' of the file at 'location' (see 'loadIR').
+        Instructions of equal lines share a single (immutable) 'Instruction' object, raw lines are 'RawLines'-
+        over 'buffer'.
+    """
+
+    if len(buffer) < HEADER_FORMAT.size:
+        raise ValueError('{}: not an IR file'.format(location))
+    magic, version, numUnits, digest, sourceSize, sourceTime, numSections = HEADER_FORMAT.unpack_from(buffer)
+    if magic != IR_MAGIC:
+        raise ValueError('{}: not an IR file'.format(location))
+    if version != IR_VERSION or numUnits != FileData.TextSegment.Instruction.NUM_UNITS or \
+            digest != analysisDigest() or numSections != len(SECTIONS):
+        raise ValueError('{}: IR of another version'.format(location))
+    if sourceStat is not None and (sourceSize, sourceTime) != (sourceStat.st_size, sourceStat.st_mtime_ns):
+        raise ValueError('{}: IR out of date'.format(location))
+
+    view = memoryview(buffer)
+    sections = dict()
+    for idx, (name, typeCode) in enumerate(SECTIONS):
+        start, length = SECTION_ENTRY_FORMAT.unpack_from(buffer, HEADER_FORMAT.size + idx * SECTION_ENTRY_FORMAT.size)
+        sections[name] = (start, littleEndian(view[start:start + length], typeCode))
+
+    wordsStart, _ = sections['words']
+    wordOffsets = sections['wordOffsets'][1]
+    words = [str(buffer[wordsStart + wordOffsets[idx]:wordsStart + wordOffsets[idx + 1]],
+                 FileData.ENCODING, FileData.ENCODING_ERRORS) for idx in range(len(wordOffsets) - 1)]
+
+    fromAnalysis = FileData.TextSegment.Instruction.fromAnalysis
+    lineWords, lineOffsets = sections['lineWords'][1], sections['lineOffsets'][1]
+    uses, changes, includes = sections['uses'][1], sections['changes'][1], sections['includes'][1]
+    lines = [fromAnalysis(map(words.__getitem__, lineWords[lineOffsets[idx]:lineOffsets[idx + 1]]),
+                          uses[idx], changes[idx], includes[idx]) for idx in range(len(lineOffsets) - 1)]
+
+    fd = FileData()
+    names = sections['names'][1]
+    segments, segmentData = sections['segments'][1], sections['segmentData'][1]
+    for idx in range(0, len(segments), 4):
+        dataStart, dataCount, labelsStart, labelsCount = segments[idx:idx + 4]
+        ts = FileData.TextSegment()
+        ts.data = {words[segmentData[2 * dataIdx]]: words[segmentData[2 * dataIdx + 1]]
+                   for dataIdx in range(dataStart, dataStart + dataCount)}
+        ts.labels = Namespace(map(words.__getitem__, names[labelsStart:labelsStart + labelsCount]))
+        fd.textSegments.append(ts)
+
+    instructions, processes = sections['instructions'][1], sections['processes'][1]
+    for idx in range(0, len(processes), 4):
+        nameIdx, segmentIdx, start, count = processes[idx:idx + 4]
+        fd.textSegments[segmentIdx].processes[words[nameIdx]] = list(map(lines.__getitem__,
+                                                                         instructions[start:start + count]))
+        fd.functions[words[nameIdx]] = segmentIdx
+
+    rawStart, _ = sections['raw']
+    regions = sections['regions'][1]
+    for idx in range(0, len(regions), 3):
+        nameIdx, start, end = regions[idx:idx + 3]
+        rawLines = RawLines(buffer)
+        rawLines.addSpan(rawStart + start, rawStart + end)
+        if idx == 0:
+            fd.segmentlessLines = rawLines
+        elif idx == 3:
+            fd.data = rawLines
+        else:
+            fd.miscSegments[words[nameIdx - 1]] = rawLines
+
+    labelsStart, labelsCount, sourceIdx = sections['meta'][1]
+    fd.labels = Namespace(map(words.__getitem__, names[labelsStart:labelsStart + labelsCount]))
+    fd.sourcePath = words[sourceIdx - 1] if sourceIdx != 0 else None
+
+    return fd
+
+
+def parseWithIR(file: str, irLocation: str) -> FileData:
+    """
+        Parses 'file' through its IR at 'irLocation': the IR is loaded if it's up to date with the file (by size-
+        and modification time, like Python's bytecode cache), otherwise the file is parsed and its IR saved.
+    """
+
+    sourceStat = os.stat(file)
+    try:
+        fd = loadIR(irLocation, sourceStat)
+        if fd.sourcePath == file:
+            return fd
+    except (FileNotFoundError, ValueError):
+        pass
+
+    fd = FileData(file)
+    saveIR(fd, irLocation, sourceStat)
+    return fd
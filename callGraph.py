@@ -0,0 +1,106 @@
+from fileData import *
+
+
+class CallGraph:
+    """
+        Graph of the calls between the functions defined in a 'FileData' object (see 'FileData.functions').
+        Calls to functions defined elsewhere (e.g. library functions) aren't part of the graph.
+    """
+
+    def __init__(self, fd: FileData):
+        # Dictionary mapping function names to the names of the local functions they call (in order of first call)
+        self.callees: Dict[str, List[str]] = dict()
+
+        for funcName, segmentIdx in fd.functions.items():
+            callees = dict()    # Used as an ordered set
+            for ins in fd.textSegments[segmentIdx].processes[funcName]:
+                calleeName = CallGraph.getCallee(ins.line)
+                if calleeName is not None and calleeName in fd.functions:
+                    callees[calleeName] = None
+            self.callees[funcName] = list(callees)
+
+        # Array of the strongly connected components (arrays of function names) in reverse topological order-
+        # i.e. every component comes after all the components it calls.
+        self.components: List[List[str]] = CallGraph.stronglyConnectedComponents(self.callees)
+
+        # Dictionary mapping function names to the index of their component in 'components'
+        self.componentOf: Dict[str, int] = dict()
+        for idx, component in enumerate(self.components):
+            for funcName in component:
+                self.componentOf[funcName] = idx
+
+    @staticmethod
+    def getCallee(line):
+        # Utility function returning the name of the function called by 'line' (None if it isn't a call)
+        if len(line) >= 2 and line[0] == 'call':
+            return line[1]
+        return None
+
+    def isRecursive(self, funcName: str) -> bool:
+        # Whether the function is part of a cycle of calls (including calling itself)
+        component = self.components[self.componentOf[funcName]]
+        return len(component) > 1 or funcName in self.callees[funcName]
+
+    def isRecursiveCall(self, callerName: str, calleeName: str) -> bool:
+        # Whether a call from 'callerName' to 'calleeName' is part of a cycle of calls
+        return callerName in self.componentOf and calleeName in self.componentOf and \
+            self.componentOf[callerName] == self.componentOf[calleeName] and self.isRecursive(calleeName)
+
+    def bottomUpOrder(self) -> List[str]:
+        # Array of all functions such that every function comes after the functions it calls (outside its cycle)
+        return [funcName for component in self.components for funcName in component]
+
+    @staticmethod
+    def stronglyConnectedComponents(graph: Dict[str, List[str]]) -> List[List[str]]:
+        """
+            Tarjan's algorithm (iterative, so deep call chains don't hit the recursion limit).
+
+        arg 'graph': dictionary mapping every node to the array of nodes it points to
+
+        returns: array of the strongly connected components in reverse topological order
+        """
+
+        index = dict()          # Dictionary mapping nodes to their discovery index
+        lowLink = dict()        # Dictionary mapping nodes to the lowest index reachable from them
+        onStack = set()
+        stack = []
+        components = []
+
+        for root in graph:
+            if root in index:
+                continue
+
+            work = [(root, 0)]  # Stack of (node, index of next neighbor to visit)
+            while len(work) != 0:
+                node, neighborIdx = work.pop()
+                if neighborIdx == 0:        # First visit
+                    index[node] = lowLink[node] = len(index)
+                    stack.append(node)
+                    onStack.add(node)
+
+                neighbors = graph[node]
+                while neighborIdx < len(neighbors):
+                    neighbor = neighbors[neighborIdx]
+                    neighborIdx += 1
+                    if neighbor not in index:
+                        work.append((node, neighborIdx))
+                        work.append((neighbor, 0))
+                        break
+                    elif neighbor in onStack:
+                        lowLink[node] = min(lowLink[node], index[neighbor])
+                else:       # All neighbors visited
+                    if lowLink[node] == index[node]:    # Root of a component
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            onStack.remove(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+
+                    if len(work) != 0:      # Propagate to parent
+                        parent = work[-1][0]
+                        lowLink[parent] = min(lowLink[parent], lowLink[node])
+
+        return components
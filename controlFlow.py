@@ -0,0 +1,171 @@
+from fileData import *
+
+__all__ = ['JUMP_MNEMONICS', 'isLabel', 'isIndirectJump', 'ControlFlowGraph', 'loopDepths']
+
+# Mnemonics of jumps within a procedure (the targets of which are labels):
+JUMP_MNEMONICS = FileData.TextSegment.Instruction.CONTROL_FLOW_MNEMONICS - {'call', 'ret'}
+
+
+def isLabel(line) -> bool:
+    # Utility function checking whether 'line' defines a label (e.g. {$LN3@main:})
+    return len(line) == 1 and line[0][-1:] == ':'
+
+
+def isIndirectJump(line) -> bool:
+    # Utility function checking whether the target of jump 'line' is read from memory (e.g. a jump table)
+    return any('[' in word or word == 'PTR' for word in line[1:])
+
+
+class ControlFlowGraph:
+    """
+        Basic blocks of a procedure and the natural loops they form.
+        A block starts at the first line, at every label and after every jump or 'ret', and ends with the line-
+        before the next one starts. A block is followed by the block a jump at its end targets (any labeled one-
+        for an indirect jump, none for a jump out of the procedure) and, unless it ends with 'jmp' or 'ret', by the-
+        next block. Every edge to a block that dominates its source (back edge) closes a natural loop: the header-
+        (its target) along with the blocks that reach its source without passing the header. Loops with the same-
+        header are merged, irreducible cycles (no block of which dominates the rest) aren't taken for loops.
+
+        'depths' and 'innermost' describe the lines a technique may insert before every line: they join the block-
+        of that line, or the block before it if that line is a label (so lines inserted before the header of a-
+        loop run once per entry to the loop).
+    """
+
+    def __init__(self, instructions):
+        numLines = len(instructions)
+        self.starts = [0] if numLines != 0 else []     # Index of the first line of every block
+        labels = dict()         # Dictionary mapping the labels of the procedure to their block
+        for idx, ins in enumerate(instructions):
+            line = ins.line
+            if isLabel(line):
+                if self.starts[-1] != idx:
+                    self.starts.append(idx)
+                labels[line[0][:-1]] = len(self.starts) - 1
+            elif len(line) != 0 and (line[0] in JUMP_MNEMONICS or line[0] == 'ret') and idx + 1 < numLines:
+                self.starts.append(idx + 1)
+        numBlocks = len(self.starts)
+
+        self.successors = [[] for _ in range(numBlocks)]   # Array of the blocks that may follow every block
+        self.predecessors = [[] for _ in range(numBlocks)]
+        labeledBlocks = sorted(set(labels.values()))
+        for block in range(numBlocks):
+            end = self.starts[block + 1] if block + 1 < numBlocks else numLines
+            line = instructions[end - 1].line
+            successors = []
+            if len(line) >= 2 and line[0] in JUMP_MNEMONICS:
+                target = labels.get(line[-1])
+                if target is not None:
+                    successors.append(target)
+                elif isIndirectJump(line):
+                    successors.extend(labeledBlocks)
+            if block + 1 < numBlocks and (len(line) == 0 or line[0] not in ('jmp', 'ret')):
+                successors.append(block + 1)
+            for successor in dict.fromkeys(successors):
+                self.successors[block].append(successor)
+                self.predecessors[successor].append(block)
+
+        self.idoms = self.dominators()
+
+        # Dictionary mapping the header of every natural loop to the set of its blocks:
+        self.loops: Dict[int, set] = dict()
+        for block in range(numBlocks):
+            for successor in self.successors[block]:
+                if self.dominates(successor, block):
+                    body = self.loops.setdefault(successor, {successor})
+                    stack = [block]
+                    while len(stack) != 0:
+                        member = stack.pop()
+                        if member not in body:
+                            body.add(member)
+                            stack.extend(self.predecessors[member])
+
+        blockDepths = [0] * numBlocks           # Number of loops every block is part of
+        innermostBlocks = [False] * numBlocks   # Whether every block is part of a loop holding no other loop
+        for header, body in self.loops.items():
+            innermost = not any(member != header and member in self.loops for member in body)
+            for member in body:
+                blockDepths[member] += 1
+                innermostBlocks[member] = innermostBlocks[member] or innermost
+
+        self.depths = [0] * numLines        # Loop depth of the lines inserted before every line (see class doc)
+        self.innermost = [False] * numLines     # Whether they're part of an innermost loop
+        for block in range(numBlocks):
+            start = self.starts[block]
+            end = self.starts[block + 1] if block + 1 < numBlocks else numLines
+            self.depths[start:end] = [blockDepths[block]] * (end - start)
+            self.innermost[start:end] = [innermostBlocks[block]] * (end - start)
+            if block != 0 and isLabel(instructions[start].line):
+                self.depths[start] = blockDepths[block - 1]
+                self.innermost[start] = innermostBlocks[block - 1]
+
+    def dominators(self) -> [int]:
+        """
+            Immediate dominator of every block (by the iterative algorithm of Cooper, Harvey and Kennedy),-
+            the first block is its own and blocks unreachable from it have none (None).
+        """
+
+        numBlocks = len(self.starts)
+        if numBlocks == 0:
+            return []
+
+        # Reverse postorder of the reachable blocks by an iterative depth first search:
+        postorder = []
+        visited = [False] * numBlocks
+        visited[0] = True
+        work = [(0, 0)]     # Stack of (block, index of next successor to visit)
+        while len(work) != 0:
+            block, successorIdx = work.pop()
+            successors = self.successors[block]
+            while successorIdx < len(successors):
+                successor = successors[successorIdx]
+                successorIdx += 1
+                if not visited[successor]:
+                    visited[successor] = True
+                    work.append((block, successorIdx))
+                    work.append((successor, 0))
+                    break
+            else:
+                postorder.append(block)
+
+        orderOf = [None] * numBlocks    # Index of every block in the postorder
+        for idx, block in enumerate(postorder):
+            orderOf[block] = idx
+
+        idoms = [None] * numBlocks
+        idoms[0] = 0
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(postorder[:-1]):
+                newIdom = None
+                for predecessor in self.predecessors[block]:
+                    if idoms[predecessor] is None:
+                        continue
+                    if newIdom is None:
+                        newIdom = predecessor
+                        continue
+                    finger = predecessor    # Intersection of the dominators of 'predecessor' and 'newIdom'
+                    while finger != newIdom:
+                        while orderOf[finger] < orderOf[newIdom]:
+                            finger = idoms[finger]
+                        while orderOf[newIdom] < orderOf[finger]:
+                            newIdom = idoms[newIdom]
+                    newIdom = finger
+                if idoms[block] != newIdom:
+                    idoms[block] = newIdom
+                    changed = True
+
+        return idoms
+
+    def dominates(self, block: int, other: int) -> bool:
+        # Checks whether every path from the first block to block 'other' passes 'block'
+        if self.idoms[other] is None:
+            return False
+        while other != block and other != 0:
+            other = self.idoms[other]
+        return other == block
+
+
+def loopDepths(instructions) -> [int]:
+    # Utility function returning the loop depth of the lines inserted before every line (see 'ControlFlowGraph')
+    return ControlFlowGraph(instructions).depths
@@ -0,0 +1,290 @@
+from fileData import *
+from controlFlow import *
+from callGraph import CallGraph
+
+__all__ = ['INSTRUCTION_COSTS', 'LOOP_WEIGHT', 'instructionCosts', 'procedureCycles', 'CycleLimit', 'CycleTracker',
+           'CostModel']
+
+# Estimated (latency, reciprocal throughput) in cycles of every mnemonic with register or immediate operands-
+# on a recent x86 core. Memory operands add 'MEMORY_LATENCY' (see 'instructionCosts').
+INSTRUCTION_COSTS = {
+    **{mnemonic: (1, 0.5) for mnemonic in FileData.TextSegment.Instruction.CONTROL_FLOW_MNEMONICS},    # Jumps
+    'mov':      (1, 0.25),
+    'movzx':    (1, 0.25),
+    'movsx':    (1, 0.25),
+    'lea':      (1, 0.5),
+    'xchg':     (2, 1),
+    'push':     (3, 1),
+    'pop':      (2, 0.5),
+    'add':      (1, 0.25),
+    'sub':      (1, 0.25),
+    'and':      (1, 0.25),
+    'or':       (1, 0.25),
+    'xor':      (1, 0.25),
+    'cmp':      (1, 0.25),
+    'test':     (1, 0.25),
+    'inc':      (1, 0.25),
+    'dec':      (1, 0.25),
+    'neg':      (1, 0.25),
+    'not':      (1, 0.25),
+    'adc':      (1, 1),
+    'sbb':      (1, 1),
+    'shl':      (1, 0.5),
+    'sal':      (1, 0.5),
+    'shr':      (1, 0.5),
+    'sar':      (1, 0.5),
+    'rol':      (1, 0.5),
+    'ror':      (1, 0.5),
+    'imul':     (3, 1),
+    'mul':      (4, 1),
+    'div':      (26, 6),
+    'idiv':     (26, 6),
+    'cdq':      (1, 1),
+    'nop':      (0, 0.25),
+    'npad':     (0, 0.25),
+    'call':     (3, 3),     # Besides the cycles of the callee (see 'Schedule.issue')
+    'ret':      (2, 2),
+    'jmp':      (1, 1),
+    'loop':     (5, 5),
+    'loope':    (5, 5),
+    'loopne':   (5, 5),
+    'loopnz':   (5, 5),
+    'loopz':    (5, 5),
+}
+
+DEFAULT_COST = (3, 1)   # Cost of mnemonics missing from 'INSTRUCTION_COSTS'
+MEMORY_LATENCY = 4      # Cycles a memory operand adds to the latency of an instruction (a hit in the L1 cache)
+MEMORY_THROUGHPUT = 0.5 # Minimal reciprocal throughput of an instruction with a memory operand
+
+# Estimated number of iterations of every loop, instructions are weighted by its power of their loop depth-
+# (see 'ControlFlowGraph'):
+LOOP_WEIGHT = 10
+
+
+def costsCycles(line) -> bool:
+    # Utility function checking whether 'line' is executed (as opposed to empty lines and labels)
+    return len(line) != 0 and not isLabel(line)
+
+
+def instructionCosts(ins) -> (float, float):
+    # Utility function returning the estimated (latency, reciprocal throughput) of instruction 'ins'
+    line = ins.line
+    latency, throughput = INSTRUCTION_COSTS.get(line[0], DEFAULT_COST)
+    if line[0] != 'lea' and any('[' in word or word == 'PTR' for word in line[1:]):
+        return latency + MEMORY_LATENCY, max(throughput, MEMORY_THROUGHPUT)
+    return latency, throughput
+
+
+unitsCache = dict()     # Dictionary mapping bitmasks of units to the arrays of their units (see 'Schedule.issue')
+
+
+def unitsOfMask(mask: int) -> [int]:
+    units = unitsCache.get(mask)
+    if units is None:
+        units = unitsCache[mask] = FileData.TextSegment.Instruction.unitsOf(mask)
+    return units
+
+
+def calleeCyclesOf(line, calleeCycles: Dict[str, float], excluded=()) -> float:
+    # Utility function returning the cycles of the procedure 'line' calls (0 if it isn't a call to one of-
+    # 'calleeCycles' or the callee is 'excluded')
+    calleeName = CallGraph.getCallee(line)
+    if calleeCycles is None or calleeName is None or calleeName in excluded:
+        return 0
+    return calleeCycles.get(calleeName, 0)
+
+
+class Schedule:
+    """
+        Estimate of the cycles straight-line code takes on an in-order core: every instruction issues its-
+        reciprocal throughput after the previous one, or once the units it uses are ready if that's later-
+        (the units an instruction changes are ready its latency after it issues).
+        Inserting an instruction never makes the code faster by this estimate.
+    """
+
+    __slots__ = ('clock', 'ready')
+
+    def __init__(self):
+        self.clock = 0.0    # Time the last instruction issued at
+        self.ready = [0.0] * FileData.TextSegment.Instruction.NUM_UNITS     # Time every unit is ready at
+
+    def copy(self):
+        schedule = Schedule()
+        schedule.clock = self.clock
+        schedule.ready = list(self.ready)
+        return schedule
+
+    def issue(self, ins, calleeCycles: float = 0) -> float:
+        # Issues instruction 'ins' (which takes another 'calleeCycles' if it's a call), returns its cycles
+        latency, throughput = instructionCosts(ins)
+        ready = self.ready
+        start = self.clock + throughput
+        for unit in unitsOfMask(ins.uses):
+            if ready[unit] > start:
+                start = ready[unit]
+
+        start += calleeCycles
+        for unit in unitsOfMask(ins.changes):
+            ready[unit] = start + latency
+
+        cycles = start - self.clock
+        self.clock = start
+        return cycles
+
+
+def procedureCycles(instructions, calleeCycles: Dict[str, float] = None, excluded=(), depths=None) -> float:
+    """
+        Utility function estimating the cycles a procedure made of 'instructions' takes to run once (see-
+        'Schedule'). Every instruction is weighted by 'LOOP_WEIGHT' to the power of its loop depth (see 'loopDepths').
+
+    arg 'calleeCycles': dictionary mapping procedures to the cycles a call to them adds (see 'CostModel')
+    arg 'excluded': procedures calls to which are charged only the call instruction (e.g. recursive ones)
+    arg 'depths': loop depths of the instructions if already computed
+    """
+
+    cycles = 0.0
+    schedule = Schedule()
+    for ins, depth in zip(instructions, depths if depths is not None else loopDepths(instructions)):
+        line = ins.line
+        if costsCycles(line):
+            cycles += schedule.issue(ins, calleeCyclesOf(line, calleeCycles, excluded)) * LOOP_WEIGHT ** depth
+
+    return cycles
+
+
+# Lines inlining wraps a body with (see 'inlineBody'):
+INLINING_STUB = [FileData.TextSegment.Instruction(['sub', 'esp,', '4']),
+                 FileData.TextSegment.Instruction(['add', 'esp,', '4'])]
+
+
+class CycleLimit:
+    """
+        Limit on the estimated cycles of a procedure (see 'CostModel.limits'), enforced by the techniques that-
+        insert instructions so its slowdown stays within the budget.
+
+        arg 'maxCycles': maximal estimated cycles the procedure may take
+        arg 'calleeCycles': dictionary mapping procedures to the cycles a call to them adds (shared by a file)
+        arg 'excluded': procedures calls to which are charged only the call instruction (the recursive ones)
+    """
+
+    __slots__ = ('maxCycles', 'calleeCycles', 'excluded')
+
+    def __init__(self, maxCycles: float, calleeCycles: Dict[str, float], excluded=frozenset()):
+        self.maxCycles = maxCycles
+        self.calleeCycles = calleeCycles
+        self.excluded = excluded
+
+    def cyclesOf(self, instructions, depths=None) -> float:
+        # Estimated cycles of the procedure made of 'instructions' (of loop depths 'depths' if already computed)
+        return procedureCycles(instructions, self.calleeCycles, self.excluded, depths)
+
+    def inliningCycles(self, calleeName: str, bodyInstructions, numReturns: int) -> float:
+        # Estimated cycles inlining 'bodyInstructions' (the expanded body of 'calleeName') adds in place of a call-
+        # to it, every 'ret' of the body becomes a 'jmp'
+        callCycles = INSTRUCTION_COSTS['call'][1] + calleeCyclesOf(('call', calleeName), self.calleeCycles,
+                                                                   self.excluded)
+        bodyCycles = self.cyclesOf(INLINING_STUB[:1] + list(bodyInstructions) + INLINING_STUB[1:]) + \
+            numReturns * (INSTRUCTION_COSTS['jmp'][1] - INSTRUCTION_COSTS['ret'][1])
+        return bodyCycles - callCycles
+
+
+class CycleTracker:
+    """
+        Estimated cycles of a procedure while instructions are inserted into it (in order), every insertion is-
+        checked against the procedure's 'CycleLimit' (see 'junkCodeProcedure').
+        Intended usage: pass the original instructions to 'advance' as they are copied and every group of-
+        inserted instructions to 'insert' at its place, which inserts it unless it would exceed the limit.
+    """
+
+    def __init__(self, cycleLimit: CycleLimit, instructions, depths=None):
+        # arg 'depths': loop depths of 'instructions' if already computed
+        self.limit = cycleLimit
+        self.depths = depths if depths is not None else loopDepths(instructions)
+        self.cycles = cycleLimit.cyclesOf(instructions, self.depths)   # Estimated cycles of the procedure so far
+        self.schedule = Schedule()      # Schedule of the instructions copied and inserted so far
+
+    def advance(self, instructions):
+        # Adds original 'instructions' to the schedule
+        for ins in instructions:
+            if costsCycles(ins.line):
+                self.schedule.issue(ins, calleeCyclesOf(ins.line, self.limit.calleeCycles, self.limit.excluded))
+
+    def insert(self, instructions, idx: int, following) -> bool:
+        """
+            Estimates the cycles inserting 'instructions' (which make no calls) before the original line 'following'-
+            of index 'idx' adds and inserts them unless that would exceed the limit.
+            Besides their own cycles, 'following' may now wait for them. Returns whether they were inserted.
+        """
+
+        schedule = self.schedule.copy()
+        cycles = sum(schedule.issue(ins) for ins in instructions if costsCycles(ins.line))
+        if costsCycles(following.line):
+            calleeCycles = calleeCyclesOf(following.line, self.limit.calleeCycles, self.limit.excluded)
+            cycles += schedule.issue(following, calleeCycles) - self.schedule.copy().issue(following, calleeCycles)
+
+        cycles *= LOOP_WEIGHT ** self.depths[idx]
+        if self.cycles + cycles > self.limit.maxCycles:
+            return False
+
+        self.cycles += cycles
+        for ins in instructions:
+            if costsCycles(ins.line):
+                self.schedule.issue(ins)
+        return True
+
+
+class CostModel:
+    """
+        Static estimate of the cycles every procedure of a 'FileData' object takes to run once, including the-
+        procedures it calls (calls within a cycle of calls are charged only the call instruction).
+        Estimates are meant for comparing versions of the same code (e.g. before and after a technique)-
+        rather than predicting actual running times.
+        The estimate of a procedure is its own cycles plus those of its callees weighted by the loop depths of-
+        the calls, so the total of the file is the sum of the own cycles of procedures weighted by 'runs'.
+    """
+
+    def __init__(self, fd: FileData, graph: CallGraph = None):
+        # arg 'graph': call graph of 'fd' if already computed
+        graph = graph if graph is not None else CallGraph(fd)
+
+        self.cycles: Dict[str, float] = dict()     # Dictionary mapping procedures to their estimated cycles
+        self.ownCycles: Dict[str, float] = dict()  # Same, calls are charged only the call instruction
+        self.excluded: Dict[str, frozenset] = dict()   # Dictionary mapping procedures to their recursive callees
+        callWeights = dict()    # Dictionary mapping procedures to the weights of the calls to every callee
+        order = graph.bottomUpOrder()
+        for funcName in order:
+            instructions = fd.textSegments[fd.functions[funcName]].processes[funcName]
+            self.excluded[funcName] = excluded = frozenset(calleeName for calleeName in graph.callees[funcName]
+                                                           if graph.isRecursiveCall(funcName, calleeName))
+            depths = loopDepths(instructions)
+            self.cycles[funcName] = procedureCycles(instructions, self.cycles, excluded, depths)
+            self.ownCycles[funcName] = procedureCycles(instructions, depths=depths)
+
+            weights = callWeights[funcName] = dict()
+            for ins, depth in zip(instructions, depths):
+                calleeName = CallGraph.getCallee(ins.line)
+                if calleeName in graph.callees and calleeName not in excluded:
+                    weights[calleeName] = weights.get(calleeName, 0) + LOOP_WEIGHT ** depth
+
+        # Dictionary mapping procedures to the number of times they run when every procedure is run once:
+        self.runs: Dict[str, float] = {funcName: 1.0 for funcName in order}
+        for funcName in reversed(order):    # Callers before callees
+            for calleeName, weight in callWeights[funcName].items():
+                self.runs[calleeName] += self.runs[funcName] * weight
+
+    def total(self) -> float:
+        # Estimated cycles of running every procedure once
+        return sum(self.cycles.values())
+
+    def limits(self, maxOverhead: float) -> Dict[str, CycleLimit]:
+        """
+            Limits keeping the estimated slowdown of every procedure within 'maxOverhead' percent (see 'CycleLimit').
+            Callees are charged as if they had used up their own budgets (whatever techniques do to them), so-
+            every procedure may only slow down its own code by 'maxOverhead' percent and the slowdown including-
+            its callees stays within it too.
+        """
+
+        factor = 1 + maxOverhead / 100
+        calleeCycles = {procName: cycles * factor for procName, cycles in self.cycles.items()}
+        return {procName: CycleLimit(cycles * factor, calleeCycles, self.excluded[procName])
+                for procName, cycles in self.cycles.items()}
@@ -1,5 +1,195 @@
 from typing import List, Dict       # Used for type hinting
-import copy                         # Used for non reference copies (shallow & deep)
+import itertools                    # Used for building the instruction semantics table
+from collections import OrderedDict # Used for the LRU order of 'AnalysisCache'
+import contextlib                   # Used for 'atomicWrite'
+import io
+import mmap                         # Used for mapping parsed files instead of reading them
+import os
+import re                           # Used for finding segment boundaries
+
+
+@contextlib.contextmanager
+def atomicWrite(location, mode: str = 'wb', buffering: int = -1):
+    """
+        Utility function (context manager) opening a temporary file beside 'location' (unique per writing process)-
+        and renaming it into place once the block is done, so readers never see a partly written file.
+        If the block raises the temporary file is removed instead.
+        arg 'mode': Writing mode of the file ('wb' or 'w')
+        arg 'buffering': Buffering of the file (see 'open')
+    """
+
+    tmpPath = '{}.{}.tmp'.format(os.fspath(location), os.getpid())
+    try:
+        with open(tmpPath, mode, buffering=buffering) as file:
+            yield file
+        os.replace(tmpPath, location)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.unlink(tmpPath)
+        raise
+
+
+class AnalysisCache:
+    """
+        Bounded LRU cache mapping normalized lines (tuples of their words) to the analyzed (immutable) instruction.
+        Compiler generated code repeats identical lines constantly (e.g. {push ebp}), so every distinct line is-
+        analyzed once, and parsed occurrences of a cached line share its instruction (see 'Instruction.interned')-
+        keeping resident memory to about a reference per instruction.
+        The 'hits' and 'misses' counters are exposed for sizing the cache.
+    """
+
+    DEFAULT_MAX_SIZE = 1 << 16
+
+    def __init__(self, maxSize: int = DEFAULT_MAX_SIZE):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.results = OrderedDict()    # Ordered from least to most recently used
+
+    def get(self, key):
+        # Returns the cached result of 'key' (counting a hit) or None (counting a miss)
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.results.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        if self.maxSize <= 0:
+            return
+        self.results[key] = result
+        if len(self.results) > self.maxSize:
+            self.results.popitem(last=False)    # Evict least recently used
+
+    def resize(self, maxSize: int):
+        self.maxSize = maxSize
+        while len(self.results) > max(maxSize, 0):
+            self.results.popitem(last=False)
+
+    def clear(self):
+        self.results.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.results), 'maxSize': self.maxSize,
+                'hitRate': self.hits / lookups if lookups != 0 else 0.0}
+
+
+class RawLines:
+    """
+        Lines of a parsed file which no technique alters (segment-less lines, data and miscellaneous segments)-
+        kept as byte ranges of a buffer instead of being tokenized. Ranges of the memory mapped file are found-
+        while parsing and then copied out of it (see 'detach'), so the mapping is released once parsing is done.
+        Iterating yields the 'lines' (see 'FileData') for code that needs them,
+        while 'writeTo' copies the raw bytes straight through.
+    """
+
+    __slots__ = ('buffer', 'spans')
+
+    def __init__(self, buffer):
+        self.buffer = buffer    # Contents of the file (bytes or memory mapped file until detached)
+        self.spans = []         # Array of (start, end) byte ranges of 'buffer'
+
+    def addSpan(self, start: int, end: int):
+        if start >= end:
+            return
+        if len(self.spans) != 0 and self.spans[-1][1] == start:     # Adjacent ranges are merged
+            self.spans[-1] = (self.spans[-1][0], end)
+        else:
+            self.spans.append((start, end))
+
+    def detach(self):
+        # Copies the ranges out of 'buffer' into a buffer of their own, so 'buffer' may be closed
+        contents = bytearray()
+        spans = []
+        for start, end in self.spans:
+            spans.append((len(contents), len(contents) + end - start))
+            contents += self.buffer[start:end]
+        self.buffer = bytes(contents)
+        self.spans = spans
+
+    def __iter__(self):
+        for start, end in self.spans:
+            for rawLine in bytes(self.buffer[start:end]).decode(FileData.ENCODING, FileData.ENCODING_ERRORS).splitlines():
+                line = FileData.tokenizeLine(rawLine)
+                if line is not None:
+                    yield line
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def rawSize(self) -> int:
+        return sum(end - start for start, end in self.spans)
+
+    def writeTo(self, file):
+        # Writes the raw bytes to the binary stream 'file'
+        view = memoryview(self.buffer)
+        for start, end in self.spans:
+            file.write(view[start:end])
+
+
+class Namespace:
+    """
+        Ordered set of names (e.g. labels) with hashed membership and a monotonic generator of fresh names.
+        Supports the list operations previously used on arrays of names (append, indexing, iteration, len).
+    """
+
+    __slots__ = ('names', 'nameSet', 'counters')
+
+    def __init__(self, names=()):
+        self.names: List[str] = []      # Names in order of addition
+        self.nameSet = set()
+        self.counters = dict()          # Dictionary mapping name stems to the last suffix tried by 'fresh'
+        for name in names:
+            self.append(name)
+
+    def append(self, name: str):
+        if name not in self.nameSet:
+            self.nameSet.add(name)
+            self.names.append(name)
+
+    def fresh(self, base: str) -> str:
+        """
+            Adds and returns a name not yet in the namespace derived from 'base' (by its trailing number).
+            Suffixes tried for a stem (the base without its trailing number) are never tried again,
+            so generating n names costs O(n) overall even when many bases share a stem.
+        """
+
+        stemLength = len(base.rstrip('0123456789'))
+        stem = base[:stemLength]
+        number = int(base[stemLength:]) if stemLength != len(base) else 0
+
+        number = max(number, self.counters.get(stem, 0))
+        while True:
+            number += 1
+            name = stem + str(number)
+            if name not in self.nameSet:
+                break
+        self.counters[stem] = number
+
+        self.append(name)
+        return name
+
+    def copy(self):
+        return Namespace(self.names)
+
+    def __contains__(self, name):
+        return name in self.nameSet
+
+    def __getitem__(self, idx):
+        return self.names[idx]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
 
 # A class encapsulating the information in a compiled c file (.asm).
 class FileData:
@@ -7,6 +197,10 @@ class FileData:
     # In this class when the term 'line(s)' is used the meaning is
     #   an array of strings originally separated by whitespace.
 
+    # Encoding used for decoding the words of lines (lossless for any bytes):
+    ENCODING = 'utf-8'
+    ENCODING_ERRORS = 'surrogateescape'
+
     # A class encapsulating the information in a 'text' segment
     class TextSegment:
 
@@ -15,13 +209,15 @@ class FileData:
 
             # A class representing the properties of an argument in an instruction
             class Argument:
+                __slots__ = ('isPointer', 'includes', 'form')
+
                 def __init__(self, arg: str):
                     self.isPointer: bool = False    # Whether argument is of pointer type
-                    self.includes: List[int] = []   # Array of indices of registers included in argument
+                    self.includes: int = 0          # Bitmask of indices of registers included in argument
 
                     # TODO: correctly implement this!
                     # Parse argument:
-                    if 'PTR' in arg:
+                    if 'PTR' in arg or '[' in arg:
                         self.isPointer = True
                         arg = arg[arg.rfind('['): arg.rfind(']') + 1]
 
@@ -37,215 +233,155 @@ class FileData:
                                 if appearanceIdx > 0 and \
                                         arg[appearanceIdx-1] in validNeighbors and \
                                         arg[appearanceIdx+nameLen] in validNeighbors:
-                                    self.includes.append(unitIdx)
+                                    self.includes |= 1 << unitIdx
                                     break
                                 appearanceIdx = arg.find(name, appearanceIdx + nameLen)
 
-                            if unitIdx in self.includes:
+                            if self.includes >> unitIdx & 1:
                                 break
 
+                    # Operand form used as key in the semantics table (anything that's neither is an immediate/symbol)
+                    if self.isPointer:
+                        self.form = FileData.TextSegment.Instruction.FORM_MEM
+                    elif self.includes != 0:
+                        self.form = FileData.TextSegment.Instruction.FORM_REG
+                    else:
+                        self.form = FileData.TextSegment.Instruction.FORM_IMM
+
+
 
+            # Instructions are immutable (the line is a tuple and the analysis is never changed after construction),
+            # so techniques share them freely instead of copying and build new ones for altered lines.
+            __slots__ = ('line', 'uses', 'changes', 'includes')
 
             def __init__(self, line):
-                self.line = copy.deepcopy(line)
-                self.changes = [False for _ in range(FileData.TextSegment.Instruction.NUM_UNITS)]
-                self.uses = copy.deepcopy(self.changes)
+                self.line = tuple(line)
+
+                # Bitmasks of units (bit i <=> unit of index i) used/changed/included by the instruction.
+                # Equal lines share the same (cached) analysis result:
+                cached = FileData.TextSegment.Instruction.analysisCache.get(self.line)
+                if cached is None:
+                    self.uses, self.changes, self.includes = FileData.TextSegment.Instruction.analyze(self.line)
+                    FileData.TextSegment.Instruction.analysisCache.put(self.line, self)
+                else:
+                    self.uses, self.changes, self.includes = cached.uses, cached.changes, cached.includes
+
+            @staticmethod
+            def interned(line):
+                # Alternative constructor returning the cached instruction of 'line' if there is one (so equal parsed-
+                # lines share a single object), otherwise a new one which is cached (see 'AnalysisCache')
+                line = tuple(line)
+                ins = FileData.TextSegment.Instruction.analysisCache.get(line)
+                if ins is None:
+                    ins = FileData.TextSegment.Instruction.fromAnalysis(
+                        line, *FileData.TextSegment.Instruction.analyze(line))
+                    FileData.TextSegment.Instruction.analysisCache.put(line, ins)
+                return ins
+
+            @staticmethod
+            def fromAnalysis(line, uses: int, changes: int, includes: int):
+                # Alternative constructor given the analysis of 'line' (e.g. loaded by 'binaryIR'), skips analyzing it
+                ins = object.__new__(FileData.TextSegment.Instruction)
+                ins.line = tuple(line)
+                ins.uses, ins.changes, ins.includes = uses, changes, includes
+                return ins
+
+            @staticmethod
+            def analyze(line) -> (int, int, int):
+                """
+                    Analyzes the given line and returns a tuple of bitmasks of units (bit i <=> unit of index i)-
+                    (uses, changes, includes) of the instruction.
+                    The line is looked up in the semantics table;
+                    all unsupported instructions (or operand forms) will be assumed to change and use everything.
+                """
 
-                # Test against instructions we support and set 'changes' and 'uses' accordingly:
-                # All unsupported instructions will be assumed to change and use everything.
                 if len(line) == 0:
-                    return
+                    return 0, 0, 0
 
                 ins = line[0]
 
                 if ins in FileData.TextSegment.Instruction.CONTROL_FLOW_MNEMONICS:
-                    self.changeAll()
-                    self.useAll()
-
-                elif ins in FileData.TextSegment.Instruction.INSTRUCTIONS_NO_ARGS:
-                    if ins == 'cdq':
-                        self.uses[self.RAX_IDX] = True
-                        self.changes[self.RDX_IDX] = True
-
-                elif ins in FileData.TextSegment.Instruction.INSTRUCTIONS_ONE_ARG:
-                    arg = FileData.TextSegment.Instruction.Argument(' '.join(line[1:]))
-
-                    if ins == 'pop':
-                        self.uses[self.RSP_IDX] = True
-                        self.changes[self.RSP_IDX] = True
-                        self.changes[self.MEM] = True
-                        self.uses[self.MEM] = True
-
-                        if arg.isPointer:
-                            for unit in arg.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg.includes:
-                                self.changes[unit] = True
-
-                    elif ins == 'push':
-                        self.uses[self.RSP_IDX] = True
-                        self.changes[self.RSP_IDX] = True
-                        self.changes[self.MEM] = True
-                        self.uses[self.MEM] = True
-
-                        for unit in arg.includes:
-                            self.uses[unit] = True
-
-                    elif ins == 'inc' or ins == 'dec':
-                        self.changes[self.PF_IDX] = True
-                        self.changes[self.AF_IDX] = True
-                        self.changes[self.ZF_IDX] = True
-                        self.changes[self.SF_IDX] = True
-                        self.changes[self.OF_IDX] = True
-
-                        if arg.isPointer:
-                            self.uses[self.MEM] = True
-                            self.changes[self.MEM] = True
-                            for unit in arg.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg.includes:
-                                self.changes[unit] = True
-                                self.uses[unit] = True
-
-                elif ins in FileData.TextSegment.Instruction.INSTRUCTIONS_TWO_ARGS:
-                    linePart1, linePart2 = (' '.join(line[1:])).split(',')
-                    arg1 = FileData.TextSegment.Instruction.Argument(linePart1)
-                    arg2 = FileData.TextSegment.Instruction.Argument(linePart2)
-                    if ins == 'mov':
-                        if arg1.isPointer:
-                            self.changes[self.MEM] = True
-                            for unit in arg1.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg1.includes:
-                                self.changes[unit] = True
-
-                        if arg2.isPointer:
-                            self.uses[self.MEM] = True
-                            for unit in arg2.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg2.includes:
-                                self.uses[unit] = True
-
-                    elif ins == 'add' or ins == 'sub' or ins == 'xor' or ins == 'and' or ins == 'or':
-                        self.changes[self.PF_IDX] = True
-                        self.changes[self.CF_IDX] = True
-                        self.changes[self.AF_IDX] = True
-                        self.changes[self.ZF_IDX] = True
-                        self.changes[self.SF_IDX] = True
-                        self.changes[self.OF_IDX] = True
-
-                        if arg1.isPointer:
-                            self.changes[self.MEM] = True
-                            self.uses[self.MEM] = True
-                            for unit in arg1.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg1.includes:
-                                self.changes[unit] = True
-                                self.uses[unit] = True
-
-                        if arg2.isPointer:
-                            self.uses[self.MEM] = True
-                            for unit in arg2.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg2.includes:
-                                self.uses[unit] = True
-
-                    elif ins == 'cmp':
-                        self.changes[self.PF_IDX] = True
-                        self.changes[self.CF_IDX] = True
-                        self.changes[self.AF_IDX] = True
-                        self.changes[self.ZF_IDX] = True
-                        self.changes[self.SF_IDX] = True
-                        self.changes[self.OF_IDX] = True
-
-                        if arg1.isPointer:
-                            self.uses[self.MEM] = True
-                            for unit in arg1.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg1.includes:
-                                self.uses[unit] = True
-
-                        if arg2.isPointer:
-                            self.uses[self.MEM] = True
-                            for unit in arg2.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg2.includes:
-                                self.uses[unit] = True
-
-                    elif ins == 'test':
-                        self.changes[self.PF_IDX] = True
-                        self.changes[self.CF_IDX] = True
-                        self.changes[self.AF_IDX] = True
-                        self.changes[self.ZF_IDX] = True
-                        self.changes[self.SF_IDX] = True
-                        self.changes[self.OF_IDX] = True
-
-                        if arg1.isPointer:
-                            self.uses[self.MEM] = True
-                            for unit in arg1.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg1.includes:
-                                self.uses[unit] = True
-
-                        if arg2.isPointer:
-                            self.uses[self.MEM] = True
-                            for unit in arg2.includes:
-                                self.uses[unit] = True
-                        else:
-                            for unit in arg2.includes:
-                                self.uses[unit] = True
-
-
-                    elif ins == 'lea':
-                        self.uses[self.MEM] = True
-
-                        for unit in arg1.includes:
-                            self.changes[unit] = True
-
-                        for unit in arg2.includes:
-                            self.uses[unit] = True
-
-
-
-                else:   # unsupported instruction, assume 'the worst'.
-                    self.changeAll()
-                    self.useAll()
-
-                # Array of units included in instruction regardless of what they do
-                self.includes = [unit for unit in range(FileData.TextSegment.Instruction.NUM_UNITS)
-                                 if self.uses[unit] or self.changes[unit]]
-
-            def changeAll(self):
-                # Utility methode for assigning true to all flags of change.
-                # Useful for instructions which we assume change everything like memory assignment.
-                for i in range(FileData.TextSegment.Instruction.NUM_UNITS):
-                    self.changes[i] = True
-
-            def useAll(self):
-                # Utility methode for assigning true to all flags of use.
-                # Useful for instructions which we assume uses everything like calling another function.
-                for i in range(FileData.TextSegment.Instruction.NUM_UNITS):
-                    self.uses[i] = True
-
-            # Arrays of instructions grouped by amount og arguments they take:
-            INSTRUCTIONS_NO_ARGS = ['cdq']
-            INSTRUCTIONS_ONE_ARG = ['pop', 'push', 'inc']
-            INSTRUCTIONS_TWO_ARGS = ['mov', 'add', 'sub', 'lea', 'xor', 'cmp', 'test', 'and', 'or']
-
-            # Array of control flow instruction mnemonics we assume change and use everything:
-            CONTROL_FLOW_MNEMONICS = [
+                    return FileData.TextSegment.Instruction.ALL_UNITS_MASK, \
+                           FileData.TextSegment.Instruction.ALL_UNITS_MASK, \
+                           FileData.TextSegment.Instruction.ALL_UNITS_MASK
+
+                args = [FileData.TextSegment.Instruction.Argument(part) for part in ' '.join(line[1:]).split(',')] \
+                    if len(line) > 1 else []
+
+                semantics = FileData.TextSegment.Instruction.SEMANTICS.get((ins, tuple(arg.form for arg in args)))
+                if semantics is None:   # unsupported instruction, assume 'the worst'.
+                    return FileData.TextSegment.Instruction.ALL_UNITS_MASK, \
+                           FileData.TextSegment.Instruction.ALL_UNITS_MASK, \
+                           FileData.TextSegment.Instruction.ALL_UNITS_MASK
+
+                uses, changes, operandMasks = semantics
+                for arg, (useMask, changeMask) in zip(args, operandMasks):
+                    uses |= arg.includes & useMask
+                    changes |= arg.includes & changeMask
+
+                return uses, changes, uses | changes
+
+            def __copy__(self):
+                return self     # Immutable, nothing to copy
+
+            def __deepcopy__(self, memo):
+                return self     # Immutable, nothing to copy
+
+            def usesUnit(self, unit: int) -> bool:
+                return self.uses >> unit & 1 == 1
+
+            def changesUnit(self, unit: int) -> bool:
+                return self.changes >> unit & 1 == 1
+
+            def dependsOn(self, other) -> bool:
+                """
+                    Whether the order of this instruction and 'other' matters, i.e. one of them changes a unit
+                    the other includes (single intersection of the masks).
+                """
+                return (self.changes & other.includes) != 0 or (self.includes & other.changes) != 0
+
+            def nextUseBefore(self, nextUse: int) -> int:
+                """
+                    Given 'nextUse', the bitmask of units whose next occurrence after this instruction is a use,
+                    returns the same bitmask for the point right before this instruction:
+                    units this instruction uses are set, units it only changes are cleared and the rest are kept.
+                """
+                return self.uses | (nextUse & ~self.changes)
+
+            def freeBefore(self, free: int) -> int:
+                """
+                    Given 'free', the bitmask of units whose next occurrence after this instruction only changes them,
+                    returns the same bitmask for the point right before this instruction (see 'getFreeMasks'):
+                    units this instruction only changes are set, units it uses are cleared and the rest are kept.
+                """
+                return (free | self.changes) & ~self.uses
+
+            @staticmethod
+            def unitsOf(mask: int) -> [int]:
+                # Utility function for listing the indices of the units set in 'mask' (in ascending order).
+                units = []
+                while mask:
+                    lowest = mask & -mask
+                    units.append(lowest.bit_length() - 1)
+                    mask ^= lowest
+                return units
+
+            @staticmethod
+            def maskOf(units) -> int:
+                # Utility function for building the bitmask of the given unit indices.
+                mask = 0
+                for unit in units:
+                    mask |= 1 << unit
+                return mask
+
+            # Cache of the analyzed instructions of distinct lines (see 'AnalysisCache'):
+            analysisCache = AnalysisCache()
+
+            # Set of control flow instruction mnemonics we assume change and use everything:
+            CONTROL_FLOW_MNEMONICS = frozenset([
                 'call', 'ret', 'jmp', 'je', 'jne', 'jg', 'jge', 'ja', 'jae', 'jl', 'jle',
                 'jb', 'jbe', 'jo', 'jno', 'jz', 'jnz', 'js', 'jns', 'jcxz', 'jecxz', 'jrcxz',
-                'loop', 'loope', 'loopne', 'loopnz', 'loopz', 'ret']
+                'loop', 'loope', 'loopne', 'loopnz', 'loopz', 'ret'])
 
             # Number of registers (or other memory units we may track):
             NUM_UNITS = 15
@@ -271,6 +407,18 @@ class FileData:
             # Memory
             MEM = 14
 
+            # Bitmasks of units (bit i <=> unit of index i):
+            RAX_MASK = 1 << RAX_IDX
+            RDX_MASK = 1 << RDX_IDX
+            RBP_MASK = 1 << RBP_IDX
+            RSP_MASK = 1 << RSP_IDX
+            CF_MASK = 1 << CF_IDX
+            MEM_MASK = 1 << MEM
+            REGISTERS_MASK = (1 << (RSP_IDX + 1)) - 1                 # All registers
+            FLAGS_MASK = (1 << (OF_IDX + 1)) - (1 << CF_IDX)          # All flags (CF, PF, AF, ZF, SF, OF)
+            FLAGS_PAZSO_MASK = FLAGS_MASK & ~(1 << CF_IDX)            # All flags but CF
+            ALL_UNITS_MASK = (1 << NUM_UNITS) - 1
+
             # Dictionary mapping register index to portion names:
             registerNames = dict()
             registerNames[RAX_IDX] =   ['eax', 'ax', 'ah', 'al']
@@ -289,6 +437,94 @@ class FileData:
                 for name in names:
                     registerIndex[name] = idx
 
+            # Operand forms:
+            FORM_REG = 'reg'
+            FORM_MEM = 'mem'
+            FORM_IMM = 'imm'
+
+            # Operand roles: 'r' read, 'w' written, 'rw' read and written, 'a' address only (registers are read-
+            # but memory isn't accessed, e.g. the source of 'lea'). Possible forms of operand of each role:
+            ROLE_FORMS = {
+                'r': (FORM_REG, FORM_MEM, FORM_IMM),
+                'w': (FORM_REG, FORM_MEM),
+                'rw': (FORM_REG, FORM_MEM),
+                'a': (FORM_REG, FORM_MEM),
+            }
+
+            # Dictionary describing the supported instructions, each element in form of
+            #   [mnemonic: [(operand roles, implicitly used units, implicitly changed units), ...]]
+            # with one tuple per supported amount of arguments.
+            # Units an instruction changes only in some cases (e.g. RDX by the byte forms of 'mul') are listed-
+            # as used too, so they're never taken to be free before it.
+            # Supporting another instruction only takes adding it here.
+            SEMANTICS_SPEC = {
+                'nop':      [((), 0, 0)],
+                'cdq':      [((), RAX_MASK, RDX_MASK)],
+                'cwd':      [((), RAX_MASK, RDX_MASK)],
+                'cbw':      [((), RAX_MASK, RAX_MASK)],
+                'cwde':     [((), RAX_MASK, RAX_MASK)],
+                'leave':    [((), RBP_MASK | MEM_MASK, RSP_MASK | RBP_MASK)],
+                'pop':      [(('w',), RSP_MASK | MEM_MASK, RSP_MASK | MEM_MASK)],
+                'push':     [(('r',), RSP_MASK | MEM_MASK, RSP_MASK | MEM_MASK)],
+                'inc':      [(('rw',), 0, FLAGS_PAZSO_MASK)],
+                'dec':      [(('rw',), 0, FLAGS_PAZSO_MASK)],
+                'neg':      [(('rw',), 0, FLAGS_MASK)],
+                'not':      [(('rw',), 0, 0)],
+                'mul':      [(('r',), RAX_MASK | RDX_MASK, RAX_MASK | RDX_MASK | FLAGS_MASK)],
+                'div':      [(('r',), RAX_MASK | RDX_MASK, RAX_MASK | RDX_MASK | FLAGS_MASK)],
+                'idiv':     [(('r',), RAX_MASK | RDX_MASK, RAX_MASK | RDX_MASK | FLAGS_MASK)],
+                'imul':     [(('r',), RAX_MASK | RDX_MASK, RAX_MASK | RDX_MASK | FLAGS_MASK),
+                             (('rw', 'r'), 0, FLAGS_MASK),
+                             (('w', 'r', 'r'), 0, FLAGS_MASK)],
+                'mov':      [(('w', 'r'), 0, 0)],
+                'movzx':    [(('w', 'r'), 0, 0)],
+                'movsx':    [(('w', 'r'), 0, 0)],
+                'xchg':     [(('rw', 'rw'), 0, 0)],
+                'lea':      [(('w', 'a'), MEM_MASK, 0)],    # Conservatively assumed to use memory
+                'add':      [(('rw', 'r'), 0, FLAGS_MASK)],
+                'sub':      [(('rw', 'r'), 0, FLAGS_MASK)],
+                'adc':      [(('rw', 'r'), CF_MASK, FLAGS_MASK)],
+                'sbb':      [(('rw', 'r'), CF_MASK, FLAGS_MASK)],
+                'xor':      [(('rw', 'r'), 0, FLAGS_MASK)],
+                'and':      [(('rw', 'r'), 0, FLAGS_MASK)],
+                'or':       [(('rw', 'r'), 0, FLAGS_MASK)],
+                'shl':      [(('rw', 'r'), 0, FLAGS_MASK)],
+                'sal':      [(('rw', 'r'), 0, FLAGS_MASK)],
+                'shr':      [(('rw', 'r'), 0, FLAGS_MASK)],
+                'sar':      [(('rw', 'r'), 0, FLAGS_MASK)],
+                'cmp':      [(('r', 'r'), 0, FLAGS_MASK)],
+                'test':     [(('r', 'r'), 0, FLAGS_MASK)],
+            }
+
+            # Mnemonics that leave the flags unchanged when their count (CL) is 0, so the flags are used as well:
+            COUNTED_MNEMONICS = frozenset(['shl', 'sal', 'shr', 'sar'])
+
+            # Precomputed semantics table built from 'SEMANTICS_SPEC', each element in form of
+            #   [(mnemonic, operand forms): (used units, changed units, operand masks)]
+            # where 'operand masks' holds per operand a pair of (use mask, change mask)-
+            # to be intersected with the registers the operand includes.
+            SEMANTICS = dict()
+            for mnemonic, variants in SEMANTICS_SPEC.items():
+                for roles, implicitUses, implicitChanges in variants:
+                    for operandForms in itertools.product(*map(ROLE_FORMS.get, roles)):
+                        effectUses, effectChanges = implicitUses, implicitChanges
+                        if mnemonic in COUNTED_MNEMONICS and operandForms[-1] == FORM_REG:
+                            effectUses |= FLAGS_MASK
+                        operandMasks = []
+                        for role, form in zip(roles, operandForms):
+                            if form == FORM_MEM:    # Registers of an address are only read
+                                if 'r' in role:
+                                    effectUses |= MEM_MASK
+                                if 'w' in role:
+                                    effectChanges |= MEM_MASK
+                                operandMasks.append((ALL_UNITS_MASK, 0))
+                            else:
+                                operandMasks.append((0 if role == 'w' else ALL_UNITS_MASK,
+                                                     ALL_UNITS_MASK if 'w' in role else 0))
+                        SEMANTICS[(mnemonic, operandForms)] = (effectUses, effectChanges, tuple(operandMasks))
+            del mnemonic, variants, roles, implicitUses, implicitChanges, operandForms, \
+                effectUses, effectChanges, operandMasks, role, form
+
         def __init__(self):
             """Default constructor"""
 
@@ -297,53 +533,206 @@ class FileData:
             # Dictionary of processes in segment
             self.processes: Dict[str, FileData.TextSegment.Instruction] = dict()
 
-            self.labels: List[str] = []  # Array of labels used in this specific text segment-
+            self.labels = Namespace()   # Labels used in this specific text segment-
             # (as opposed to labels in 'FileData')
 
     def __init__(self, file = None):
 
         """
-        Constructor of 'FileData' object given file. Uses 'initialize' to parse the file contents.
+        Constructor of 'FileData' object given file.
+        The file is memory mapped and only the text segments are tokenized (see 'parseBuffer'),
+        other segments are kept as raw byte ranges ('RawLines') which 'saveFile' copies straight through.
+        The mapping (and the file) is closed once parsing is done, the raw lines are copied out of it beforehand.
         """
 
-        def cutComments(line: [str]):
-            """
-                Utility function for cutting right-trailing comments of lines
-                Assumes ';' of comments would be separated by whitespace, and-
-                Assumes no ';' exists in contexts other than comments (suc as string)
-            """
-            # TODO: fix 2nd assumption of function
-
-            res = []
-            for part in line:
-                if part != ';':
-                    res.append(part)
-                else:
-                    break
-            return res
-
         self.functions = dict()  # Dictionary mapping function names to
                                  # corresponding parent 'TextSegment' objects index in 'textSegments' array
 
+        # Lines which no technique alters are 'RawLines' when parsed from a file (arrays of lines otherwise):
         self.data: List[str] = []                    # Array of lines belonging to data segments
         self.textSegments: List[FileData.TextSegment] = []    # Array of text segments in file
         self.miscSegments = dict()                   # Dictionary of miscellaneous segments [name:lines]
         self.segmentlessLines: List[str] = []    # Array of all the lines (typically in the beginning of the file)-
                                                  # belonging to no particular segemnt
 
-        self.labels: List[str] = []  # Array of labels used in entire file (as opposed to labels in 'TextSegment')
+        self.labels = Namespace()   # Labels used in entire file (as opposed to labels in 'TextSegment')
+
+        self.sourcePath = file       # Location of the parsed file (None if not parsed from a file)
+
+        self.growthLimits: Dict[str, int] = dict()  # Dictionary mapping process names to the maximal number of-
+                                                    # instructions techniques may grow them to (see 'growthPlanner'),-
+                                                    # data lines inlining adds for a process are deducted from its limit
+
+        self.cycleLimits = dict()   # Dictionary mapping process names to limits on the estimated cycles techniques-
+                                    # may slow them down to (see 'costModel.CycleLimit')
 
         if file is None:
             return
 
-        lines = []
-        with open(file) as f:
-            # Sanitize empty lines and comments
-            lines = [cutComments(line.split())
-                     for line in f.read().splitlines() if
-                     len(line) != 0 and len(line.split()) != 0 and line[0] != ';']
+        with open(file, 'rb') as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:      # Empty files can't be mapped
+                buffer = b''
+
+        try:
+            self.parseBuffer(buffer)
+            self.detachRawLines()
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+    def detachRawLines(self):
+        # Copies all 'RawLines' of the object out of the buffer they were parsed from (see 'RawLines.detach')
+        for lines in itertools.chain((self.segmentlessLines, self.data), self.miscSegments.values()):
+            if isinstance(lines, RawLines):
+                lines.detach()
+
+    @staticmethod
+    def cutComments(line: [str]):
+        """
+            Utility function for cutting right-trailing comments of lines
+            Assumes ';' of comments would be separated by whitespace, and-
+            Assumes no ';' exists in contexts other than comments (suc as string)
+        """
+        # TODO: fix 2nd assumption of function
+
+        res = []
+        for part in line:
+            if part != ';':
+                res.append(part)
+            else:
+                break
+        return res
+
+    @staticmethod
+    def tokenizeLine(line: str):
+        """
+            Utility function for sanitizing a raw line of the file into a 'line' (array of words without comments).
+            Returns None for empty lines and lines that are entirely comments.
+        """
+        if len(line) == 0 or len(line.split()) == 0 or line[0] == ';':
+            return None
+        return FileData.cutComments(line.split())
+
+    # Regular expression matching the lines (after cutting comments) {name SEGMENT}, {name ENDS} and {END}-
+    # used for finding segment boundaries without tokenizing the lines in between.
+    BOUNDARY_PATTERN = re.compile(
+        rb'^(?!;)[ \t]*(?:(\S+)[ \t]+(SEGMENT|ENDS)|END)(?:[ \t]+;(?:[ \t].*)?)?[ \t\r]*$', re.MULTILINE)
+
+    def parseBuffer(self, buffer):
+        """
+            Pseudo-Constructor of 'FileData' object given the contents of a file (bytes or memory mapped file).
+            Segment boundaries are found with 'BOUNDARY_PATTERN', lines of text segments are tokenized and parsed-
+            (see 'parseTextLine') and all other lines are stored as 'RawLines' byte ranges of 'buffer'.
+        """
+
+        def lineEnd(pos):
+            # Utility function returning the position of the beginning of the line following 'pos'
+            end = buffer.find(b'\n', pos)
+            return len(buffer) if end == -1 else end + 1
+
+        segmentless = RawLines(buffer)
+        self.segmentlessLines = segmentless
+        self.data = RawLines(buffer)
+
+        currLines = segmentless     # Raw lines of the current segment (segment-less code when not in a segment)
+        currSegment = None          # Name of current segment being parsed
+        regionStart = 0             # Position of the first line of the current region of raw lines
+        pos = 0
+
+        while True:
+            match = FileData.BOUNDARY_PATTERN.search(buffer, pos)
+            if match is None:
+                currLines.addSpan(regionStart, len(buffer))
+                break
+
+            name, kind = match.group(1), match.group(2)
+            nextLine = lineEnd(match.end())
+
+            if currSegment is None:                             # Segment-less code
+                if kind is None:                                # End of file
+                    currLines.addSpan(regionStart, match.start())
+                    break
+                elif kind == b'SEGMENT':                        # Start of new segment
+                    currLines.addSpan(regionStart, match.start())
+                    currSegment = name.decode(FileData.ENCODING, FileData.ENCODING_ERRORS)
+
+                    if currSegment == '_TEXT':                  # Text segments are parsed line by line
+                        self.textSegments.append(FileData.TextSegment())
+                        nextLine = self.parseTextSegment(buffer, nextLine, len(self.textSegments) - 1)
+                        currSegment = None
+                    elif currSegment == '_DATA':
+                        currLines = self.data
+                    else:
+                        if currSegment not in self.miscSegments:
+                            self.miscSegments[currSegment] = RawLines(buffer)
+                        currLines = self.miscSegments[currSegment]
+
+                    if currSegment is None:
+                        currLines = segmentless
+                    regionStart = nextLine
+
+            elif kind == b'ENDS' and (currSegment != '_DATA' or name == b'_DATA'):   # End of segment
+                currLines.addSpan(regionStart, match.start())
+                currSegment = None
+                currLines = segmentless
+                regionStart = nextLine
+
+            pos = nextLine
+
+    def parseTextSegment(self, buffer, pos: int, textSegmentIdx: int) -> int:
+        """
+            Parses the lines of the text segment of index 'textSegmentIdx' starting at position 'pos' of 'buffer'.
+            Returns the position following the end of the segment.
+        """
+
+        processName = None
+        while pos < len(buffer):
+            end = buffer.find(b'\n', pos)
+            end = len(buffer) if end == -1 else end + 1
+            line = FileData.tokenizeLine(
+                bytes(buffer[pos:end]).decode(FileData.ENCODING, FileData.ENCODING_ERRORS).rstrip('\r\n'))
+            pos = end
+
+            if line is not None:
+                inSegment, processName = self.parseTextLine(textSegmentIdx, processName, line)
+                if not inSegment:
+                    break
+
+        return pos
 
-        self.initialize(lines)
+    def parseTextLine(self, textSegmentIdx: int, processName, line: [str]):
+        """
+            Parses a line inside the text segment of index 'textSegmentIdx'.
+            arg 'processName': name of process being parsed (None if not inside a process)
+
+            returns: tuple of (whether still inside the text segment, name of process being parsed after the line)
+        """
+
+        if processName is not None:
+            if line == [processName, 'ENDP']:           # End of process
+                return True, None
+
+            self.textSegments[textSegmentIdx].processes[processName].append(
+                FileData.TextSegment.Instruction.interned([part for part in line if part != 'SHORT'])
+            )
+            if len(line) == 1 and line[0][-1:] == ':':  # A label
+                labelName = line[0][:-1]
+                self.textSegments[textSegmentIdx].labels.append(labelName)
+                self.labels.append(labelName)
+
+        else:                                               # Not inside process
+            if line == ['_TEXT', 'ENDS']:                   # End of text segment
+                return False, None
+            elif len(line) == 2 and line[1] == 'PROC':      # Start of process
+                processName = line[0]
+                self.textSegments[textSegmentIdx].processes[processName] = []
+                self.functions[processName] = textSegmentIdx
+            else:                                           # Data in current text segment
+                self.textSegments[textSegmentIdx].data[line[0]] = line[2]       # E.g. {num = 5}
+
+        return True, processName
 
     def initialize(self, lines: [[str]]):
         """
@@ -353,7 +742,6 @@ class FileData:
 
         currSegment = None          # Current segment being parsed
         textSegmentIdx = -1         # Index/count of current text segment being parsed (should there be one)
-        inProcess = False           # Whether or not within a text segment we are currently parsing a process
         processName = None          # name of process being parsed (should there be one)
 
         for line in lines:
@@ -376,35 +764,14 @@ class FileData:
                     self.data.append(line)
 
             elif currSegment == '_TEXT':                        # Text (code) segment
-                if inProcess:
-                    if line == [processName, 'ENDP']:           # End of process
-                        inProcess = False
-                        processName = None
-                    else:
-
-                        self.textSegments[textSegmentIdx].processes[processName].append(
-                            FileData.TextSegment.Instruction([part for part in line if part != 'SHORT'])
-                        )
-                        if len(line) == 1 and line[0][-1:] == ':':  # A label
-                            labelName = line[0][:-1]
-                            self.textSegments[textSegmentIdx].labels.append(labelName)
-                            self.labels.append(labelName)
-
-                else:                                               # Not inside process
-                    if line == ['_TEXT', 'ENDS']:                   # End of text segment
-                        currSegment = None
-                    elif len(line) == 2 and line[1] == 'PROC':      # Start of process
-                        inProcess = True
-                        processName = line[0]
-                        self.textSegments[textSegmentIdx].processes[processName] = []
-                        self.functions[processName] = textSegmentIdx
-                    else:                                           # Data in current text segment
-                        self.textSegments[textSegmentIdx].data[line[0]] = line[2]       # E.g. {num = 5}
+                inSegment, processName = self.parseTextLine(textSegmentIdx, processName, line)
+                if not inSegment:
+                    currSegment = None
 
             else:   # Miscellaneous segment
                 if currSegment not in self.miscSegments:
-                    self.miscSegments[currSegment] = [line]
-                elif len(line) == 2 and line[1] == 'ENDS':
+                    self.miscSegments[currSegment] = []
+                if len(line) == 2 and line[1] == 'ENDS':
                     currSegment = None
                 else:
                     self.miscSegments[currSegment].append(line)
@@ -417,7 +784,7 @@ class FileData:
         """
 
         # Adding segmentless code:
-        lines = self.segmentlessLines[:]
+        lines = list(self.segmentlessLines)
 
         # Adding miscellaneous segments:
         for name, miscLines in self.miscSegments.items():
@@ -450,10 +817,91 @@ class FileData:
 
         return lines
 
-    def saveFile(self, location: str):
-        lines = self.getLines()
-        with open(location, 'w+') as file:
-            for line in lines:
-                for word in line:
-                    file.write(word + ' ')
-                file.write('\n')
+    # Size of the buffer through which files are written:
+    WRITE_BUFFER_SIZE = 1 << 20
+
+    @staticmethod
+    def joinLines(lines) -> bytes:
+        # Utility function for serializing 'lines' into a single chunk (words separated by spaces, one line per row)
+        return ''.join([' '.join(line) + ' \n' if len(line) != 0 else '\n' for line in lines]).encode(
+            FileData.ENCODING, FileData.ENCODING_ERRORS)
+
+    def iterChunks(self):
+        """
+            Generator of the serialized contents of the object as chunks of bytes, segment by segment-
+            (so the complete list of lines is never built). Raw lines are yielded as views of their buffer.
+        """
+
+        def chunksOf(lines):
+            if isinstance(lines, RawLines):
+                view = memoryview(lines.buffer)
+                for start, end in lines.spans:
+                    yield view[start:end]
+            else:
+                yield FileData.joinLines(lines)
+
+        # Segmentless code:
+        yield from chunksOf(self.segmentlessLines)
+
+        # Miscellaneous segments:
+        for name, miscLines in self.miscSegments.items():
+            yield FileData.joinLines([[name, 'SEGMENT']])
+            yield from chunksOf(miscLines)
+            yield FileData.joinLines([[name, 'ENDS']])
+
+        # Data segment:
+        yield FileData.joinLines([['_DATA', 'SEGMENT']])
+        yield from chunksOf(self.data)
+        yield FileData.joinLines([['_DATA', 'ENDS']])
+
+        # Text segments:
+        for ts in self.textSegments:
+            yield FileData.joinLines([['_TEXT', 'SEGMENT']] +
+                                     [[dataName, '=', dataValue] for dataName, dataValue in ts.data.items()])
+            for procName, procInstructions in ts.processes.items():
+                yield FileData.joinLines([[procName, 'PROC']] +
+                                         [ins.line for ins in procInstructions] +
+                                         [[procName, 'ENDP']])
+            yield FileData.joinLines([['_TEXT', 'ENDS']])
+
+        yield FileData.joinLines([['END']])     # End of file
+
+    def writeTo(self, stream):
+        """
+            Writes the serialized contents of the object to 'stream', which may be binary (e.g. a file opened with-
+            'wb' or io.BytesIO) or text (e.g. sys.stdout or io.StringIO). The stream is flushed but not closed.
+        """
+
+        if isinstance(stream, io.TextIOBase):
+            if hasattr(stream, 'buffer'):       # Text stream over a binary one, write through the binary one
+                stream.flush()
+                self.writeTo(stream.buffer)
+            else:
+                for chunk in self.iterChunks():
+                    stream.write(bytes(chunk).decode(FileData.ENCODING, FileData.ENCODING_ERRORS))
+                stream.flush()
+            return
+
+        if isinstance(stream, io.RawIOBase):    # Unbuffered, write through a buffer of our own
+            buffered = io.BufferedWriter(stream, FileData.WRITE_BUFFER_SIZE)
+            self.writeTo(buffered)
+            buffered.detach()
+            return
+
+        for chunk in self.iterChunks():
+            stream.write(chunk)
+        stream.flush()
+
+    def saveFile(self, location):
+        """
+            Saves the object to 'location', which is either a path or a stream (see 'writeTo').
+            Raw lines are copied straight through as parsed.
+        """
+
+        if not isinstance(location, (str, bytes, os.PathLike)):
+            self.writeTo(location)
+            return
+
+        # The file is written aside and then replaces 'location', so the parsed file itself may be overwritten
+        with atomicWrite(location, buffering=FileData.WRITE_BUFFER_SIZE) as file:
+            self.writeTo(file)
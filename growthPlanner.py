@@ -0,0 +1,176 @@
+from collections import Counter
+from fileData import *
+from callGraph import CallGraph
+
+__all__ = ['INLINING_OVERHEAD', 'JUNK_LINE_BYTES', 'RENAME_MARGIN', 'countReturns', 'getInliningGrowth', 'GrowthBudget',
+           'GrowthPlan']
+
+# Lines every inlined call adds besides the callee's body (see 'inlineBody'): the stack stub, the return label-
+# and the stack fix after it.
+INLINING_OVERHEAD = 3
+
+JUNK_LINE_BYTES = 16    # Upper bound on the serialized length of a junk line (see 'getJunkDistribution')
+RENAME_MARGIN = 24      # Upper bound on the bytes renaming adds to a line (fresh names get numeric suffixes)
+
+
+def getInliningGrowth(numInstructions: int, numReturns: int) -> int:
+    # Upper bound on the instructions inlining a body adds in place of the call to it- every 'ret' of the body-
+    # may become two lines (see 'inlineBody').
+    return numInstructions + numReturns + INLINING_OVERHEAD - 1
+
+
+def countReturns(instructions) -> int:
+    # Utility function counting the 'ret' instructions in the array 'instructions'
+    return sum(1 for ins in instructions if len(ins.line) != 0 and ins.line[0] == 'ret')
+
+
+class GrowthBudget:
+    """
+        Limits on the size of the file the techniques produce (None means unlimited).
+        Sizes are in lines of the text segments- instructions plus the data lines inlining copies along with bodies.
+
+        arg 'maxLines': maximal number of text segment lines in the resulting file
+        arg 'maxBytes': maximal size of the resulting file (converted to lines by the longest line possible)
+        arg 'maxProcedureLines': maximal number of lines any single procedure may grow to
+    """
+
+    def __init__(self, maxLines: int = None, maxBytes: int = None, maxProcedureLines: int = None):
+        self.maxLines = maxLines
+        self.maxBytes = maxBytes
+        self.maxProcedureLines = maxProcedureLines
+
+
+class GrowthPlan:
+    """
+        Prediction of how much the techniques grow every procedure of a 'FileData' object, computed before any-
+        technique is applied (all predictions are upper bounds).
+        Intended usage: call the 'add...' method of every technique in pipeline order, then 'limit' with a budget-
+        and put 'limits' in 'FileData.growthLimits' so the techniques cap their expansions accordingly.
+    """
+
+    def __init__(self, fd: FileData, graph: CallGraph = None):
+        # arg 'graph': call graph of 'fd' if already computed
+        self.graph = graph if graph is not None else CallGraph(fd)
+
+        self.segmentOf: Dict[str, int] = dict(fd.functions)
+        self.initialSizes: Dict[str, int] = dict()     # Dictionary mapping procedures to their instruction count
+        self.returns: Dict[str, int] = dict()          # Dictionary mapping procedures to their 'ret' count
+        self.calls: Dict[str, Counter] = dict()        # Dictionary mapping procedures to call counts per callee
+        for procName, segmentIdx in fd.functions.items():
+            instructions = fd.textSegments[segmentIdx].processes[procName]
+            self.initialSizes[procName] = len(instructions)
+            self.returns[procName] = countReturns(instructions)
+            callees = (CallGraph.getCallee(ins.line) for ins in instructions)
+            self.calls[procName] = Counter(callee for callee in callees if callee in fd.functions)
+
+        self.sizes: Dict[str, int] = dict(self.initialSizes)   # Predicted instruction counts
+        self.addedData: Dict[str, int] = {procName: 0 for procName in self.initialSizes}   # Predicted data lines-
+                                                                                   # inlining adds for each procedure
+        self.segmentData: List[int] = [len(ts.data) for ts in fd.textSegments]     # Predicted data lines per segment
+        self.initialData = sum(self.segmentData)
+
+        self.limits: Dict[str, int] = dict()   # Result of 'limit' (see 'FileData.growthLimits')
+        self.maxLines = None                    # Maximal number of text segment lines allowed by the budget
+
+        # Sizes for converting byte budgets, every text segment line is at most 'lineBytes' long:
+        self.fixedBytes = GrowthPlan.getFixedBytes(fd)
+        self.lineBytes = max([len(FileData.joinLines([ins.line])) for ts in fd.textSegments
+                              for procInstructions in ts.processes.values() for ins in procInstructions] +
+                             [len(FileData.joinLines([[name, '=', value]])) for ts in fd.textSegments
+                              for name, value in ts.data.items()] + [0]) + RENAME_MARGIN
+
+    @staticmethod
+    def getFixedBytes(fd: FileData) -> int:
+        # Utility function computing the size of everything in the serialized file besides text segment lines
+
+        def sizeOf(lines):
+            return lines.rawSize() if isinstance(lines, RawLines) else len(FileData.joinLines(lines))
+
+        size = sizeOf(fd.segmentlessLines) + sizeOf(fd.data) + len(FileData.joinLines(
+            [['_DATA', 'SEGMENT'], ['_DATA', 'ENDS'], ['END']]))
+        for name, miscLines in fd.miscSegments.items():
+            size += sizeOf(miscLines) + len(FileData.joinLines([[name, 'SEGMENT'], [name, 'ENDS']]))
+        for ts in fd.textSegments:
+            size += len(FileData.joinLines([['_TEXT', 'SEGMENT'], ['_TEXT', 'ENDS']]))
+            for procName in ts.processes:
+                size += len(FileData.joinLines([[procName, 'PROC'], [procName, 'ENDP']]))
+
+        return size
+
+    def addJunkCode(self, junkSize: int):
+        # Junk code inserts at most 'junkSize' lines before every instruction
+        for procName, size in self.sizes.items():
+            self.sizes[procName] = size * (1 + junkSize)
+        self.lineBytes = max(self.lineBytes, JUNK_LINE_BYTES)
+
+    def addFunctionInlining(self):
+        # Mirrors 'functionInlining': every function's body is expanded bottom-up and instantiated at each call site
+        expandedSizes = dict()
+        expandedData = dict()       # Data lines copied along with every instantiation of the expanded body
+        expandedCalls = dict()      # Calls left in the expanded body (those that aren't inlined)
+        addedSegmentData = [0] * len(self.segmentData)
+
+        for funcName in self.graph.bottomUpOrder():
+            size = self.sizes[funcName]
+            data = 0
+            calls = Counter()
+            for calleeName, count in self.calls[funcName].items():
+                if self.graph.isRecursiveCall(funcName, calleeName):
+                    calls[calleeName] += count
+                    continue
+
+                size += count * getInliningGrowth(expandedSizes[calleeName], self.returns[calleeName])
+                data += count * expandedData[calleeName]
+                for name, calleeCount in expandedCalls[calleeName].items():
+                    calls[name] += count * calleeCount
+
+            expandedSizes[funcName] = size
+            expandedData[funcName] = self.segmentData[self.segmentOf[funcName]] + data
+            expandedCalls[funcName] = calls
+            self.addedData[funcName] += data
+            addedSegmentData[self.segmentOf[funcName]] += data
+
+        self.sizes = expandedSizes
+        self.calls = expandedCalls
+        self.segmentData = [data + added for data, added in zip(self.segmentData, addedSegmentData)]
+
+    def predictedLines(self, procName: str = None) -> int:
+        # Predicted number of lines of procedure 'procName' (of all text segments if None)
+        if procName is None:
+            return sum(self.sizes.values()) + sum(self.segmentData)
+        return self.sizes[procName] + self.addedData[procName]
+
+    def initialLines(self) -> int:
+        return sum(self.initialSizes.values()) + self.initialData
+
+    def limit(self, budget: GrowthBudget):
+        """
+            Computes 'limits' so the techniques never exceed 'budget'.
+            Procedures predicted to exceed 'maxProcedureLines' are capped by it, then if the file is predicted to-
+            exceed the total budget, the growth it allows is split between procedures in proportion to their-
+            predicted growth. A procedure is never limited below its initial size.
+        """
+
+        self.maxLines = budget.maxLines
+        if budget.maxBytes is not None:
+            byteLines = max(0, budget.maxBytes - self.fixedBytes) // self.lineBytes
+            self.maxLines = byteLines if self.maxLines is None else min(self.maxLines, byteLines)
+
+        predicted = {procName: self.predictedLines(procName) for procName in self.sizes}
+        if budget.maxProcedureLines is not None:
+            for procName, lines in predicted.items():
+                predicted[procName] = min(lines, max(self.initialSizes[procName], budget.maxProcedureLines))
+
+        if self.maxLines is not None and sum(predicted.values()) + self.initialData > self.maxLines:
+            allowedGrowth = max(0, self.maxLines - self.initialLines())
+            totalGrowth = sum(lines - self.initialSizes[procName] for procName, lines in predicted.items())
+            for procName, lines in (predicted.items() if totalGrowth != 0 else ()):
+                growth = lines - self.initialSizes[procName]
+                predicted[procName] = self.initialSizes[procName] + allowedGrowth * growth // totalGrowth
+
+        self.limits = {procName: lines for procName, lines in predicted.items()
+                       if lines < self.predictedLines(procName)}
+
+    def withinBudget(self) -> bool:
+        # Whether the limits guarantee the budget (not the case if the file exceeds it to begin with)
+        return self.maxLines is None or self.initialLines() <= self.maxLines
@@ -0,0 +1,264 @@
+import hashlib
+import json
+from usefulFunctions import *
+from callGraph import CallGraph
+
+STATE_VERSION = 4   # Bumped whenever the format of state files (or the results stored in them) changes
+
+
+def procedureDigests(fd: FileData) -> Dict[str, str]:
+    """
+        Utility function hashing what the result of every process in 'fd' depends on, besides its callees:
+        its instructions, the data of its segment (inlining copies them along with bodies) and its limits.
+    """
+
+    digests = dict()
+    for ts in fd.textSegments:
+        segmentKey = repr(list(ts.data.items()))
+        for procName, procInstructions in ts.processes.items():
+            cycleLimit = fd.cycleLimits.get(procName)
+            limits = (fd.growthLimits.get(procName), cycleLimit.maxCycles if cycleLimit is not None else None)
+            hasher = hashlib.sha256(repr((procName, segmentKey, limits)).encode(
+                FileData.ENCODING, FileData.ENCODING_ERRORS))
+            for ins in procInstructions:
+                hasher.update(FileData.joinLines([ins.line]))
+            digests[procName] = hasher.hexdigest()
+
+    return digests
+
+
+def definedLabels(lines) -> [str]:
+    # Utility function listing the labels defined by 'lines' (e.g. {$LN3@main:})
+    return [line[0][:-1] for line in lines if len(line) == 1 and line[0][-1:] == ':']
+
+
+def referencedNames(lines, namePattern) -> set:
+    # Utility function collecting the data names matched by 'namePattern' in the arguments of 'lines'
+    names = set()
+    if namePattern is not None:
+        for line in lines:
+            for part in line[1:]:
+                names.update(namePattern.findall(part))
+    return names
+
+
+class IncrementalState:
+    """
+        Results of the last application of techniques to a file per procedure, so re-applying them after an edit-
+        only transforms the procedures the edit affects (see 'apply'). Stored as JSON (see 'load' and 'save').
+
+        A procedure's fingerprint covers its own body, segment data and limits along with those of every-
+        function it calls transitively (inlining copies their bodies) and the applied techniques, so any change-
+        that could alter its result marks it dirty. Dirty procedures are transformed, the rest are spliced from-
+        the stored results. Per-procedure randomness doesn't depend on the rest of the file (see-
+        'Techniques.applyTo'), so the result is identical to transforming the entire file.
+        Inlining names the labels and data of the bodies it copies from namespaces of the entire file, so when-
+        it's applied the entire file is transformed (see 'applyEntirely') and only the fingerprints are of use.
+    """
+
+    def __init__(self):
+        self.config = None      # Key of the techniques the results were produced by (see 'configOf')
+
+        # Dictionary mapping procedure names to tuples of (fingerprint, array of resulting lines,-
+        # array of (name, value) of the data the procedure added to its segment):
+        self.procedures = dict()
+
+    @staticmethod
+    def load(location: str):
+        # Loads the state saved at 'location', an empty state if there's none (or it's of another version)
+        state = IncrementalState()
+        try:
+            with open(location) as f:
+                contents = json.load(f)
+        except FileNotFoundError:
+            return state
+
+        if contents.get('version') != STATE_VERSION:
+            return state
+
+        state.config = contents['config']
+        state.procedures = {procName: (fingerprint, [tuple(line) for line in lines], [tuple(item) for item in data])
+                            for procName, (fingerprint, lines, data) in contents['procedures'].items()}
+        return state
+
+    def save(self, location: str):
+        # Saves the state to 'location' atomically (a temporary file is renamed into place)
+        with atomicWrite(location, 'w') as f:
+            json.dump({'version': STATE_VERSION, 'config': self.config, 'procedures': self.procedures}, f)
+
+    @staticmethod
+    def configOf(techniques) -> str:
+        return hashlib.sha256(repr((STATE_VERSION, techniques.identity())).encode()).hexdigest()
+
+    @staticmethod
+    def fingerprints(fd: FileData, config: str, graph: CallGraph = None) -> Dict[str, str]:
+        """
+            Fingerprint of every process of 'fd' given the key 'config' of the applied techniques (see class doc).
+            arg 'graph': call graph of 'fd', None if results don't depend on callees (no inlining is applied)
+        """
+
+        digests = procedureDigests(fd)
+
+        fingerprints = dict()
+        for procName in digests:
+            closure = IncrementalState.closureOf(graph, [procName])
+            key = repr((config, procName, sorted((name, digests[name]) for name in closure)))
+            fingerprints[procName] = hashlib.sha256(
+                key.encode(FileData.ENCODING, FileData.ENCODING_ERRORS)).hexdigest()
+
+        return fingerprints
+
+    @staticmethod
+    def closureOf(graph: CallGraph, procNames) -> set:
+        # Utility function collecting the procedures 'procNames' along with all the functions they call transitively-
+        # (none if 'graph' is None)
+        if graph is None:
+            return set(procNames)
+
+        closure = set()
+        stack = list(procNames)
+        while len(stack) != 0:
+            procName = stack.pop()
+            if procName not in closure:
+                closure.add(procName)
+                stack.extend(graph.callees.get(procName, ()))
+        return closure
+
+    def apply(self, fd: FileData, techniques, fused: bool = True, workers: int = 1, metrics=None,
+              analyses=None) -> FileData:
+        """
+            Applies 'techniques' (a seeded 'Techniques' object) to the procedures of 'fd' whose fingerprint changed-
+            since the state was last updated, splices the stored results of the rest and updates the state.
+            Labels and data the transformed procedures add are renamed wherever they clash with spliced ones.
+            Alters 'fd' and returns the result, the arguments are passed to 'Techniques.applyTo'.
+            When inlining is applied the entire file is transformed instead (see class doc).
+        """
+
+        if techniques.seed is None:
+            raise ValueError('incremental application requires a seed (results are random otherwise)')
+
+        config = IncrementalState.configOf(techniques)
+        if config != self.config:       # Nothing stored is of use
+            self.config = config
+            self.procedures = dict()
+
+        graph = None
+        if techniques.TECHNIQUE_FUNCTION_INLINING in techniques.pipeline:
+            graph = analyses.file('callGraph', fd) if analyses is not None else CallGraph(fd)
+        fingerprints = IncrementalState.fingerprints(fd, config, graph)
+        dirty = {procName for procName, fingerprint in fingerprints.items()
+                 if self.procedures.get(procName, (None,))[0] != fingerprint}
+        transformed = dirty if graph is None else set(fingerprints)
+        spliced = [procName for procName in fingerprints if procName not in dirty]
+
+        if metrics is not None:
+            metrics.emit('incremental', procedures=len(fingerprints), dirty=len(dirty), transformed=len(transformed))
+
+        if graph is not None:
+            return self.applyEntirely(fd, techniques, fingerprints, fused, workers, metrics, analyses)
+
+        # Labels of the result, spliced ones are kept as they are:
+        splicedLabels = {label for procName in spliced for label in definedLabels(self.procedures[procName][1])}
+        labels = Namespace(itertools.chain(fd.labels, sorted(splicedLabels)))
+
+        result = None
+        if len(transformed) != 0:
+            # Transforming a copy of 'fd' holding only the needed procedures, names of the spliced ones are taken-
+            # so fresh labels avoid them:
+            partial = FileData()
+            partial.sourcePath = fd.sourcePath      # Seeds are derived from the file name
+            partial.labels = labels.copy()
+            partial.growthLimits = dict(fd.growthLimits)
+            partial.cycleLimits = dict(fd.cycleLimits)
+            partial.segmentlessLines = fd.segmentlessLines
+            partial.data = fd.data
+            for segmentIdx, ts in enumerate(fd.textSegments):
+                partialSeg = FileData.TextSegment()
+                partialSeg.data = dict(ts.data)
+                partialSeg.labels = ts.labels.copy()
+                for procName, procInstructions in ts.processes.items():
+                    if procName in transformed:
+                        partialSeg.processes[procName] = procInstructions
+                        partial.functions[procName] = segmentIdx
+                partial.textSegments.append(partialSeg)
+
+            result = techniques.applyTo(partial, fused, workers, metrics, analyses)
+            for procName in dirty:
+                resultInstructions = result.textSegments[fd.functions[procName]].processes[procName]
+                for label in definedLabels(ins.line for ins in resultInstructions):
+                    labels.append(label)
+
+        for segmentIdx, ts in enumerate(fd.textSegments):
+            # Data of the segment, spliced ones are kept as they are:
+            segData = dict(ts.data)
+            for procName in ts.processes:
+                if procName not in dirty:
+                    for dataName, dataValue in self.procedures[procName][2]:
+                        segData.setdefault(dataName, dataValue)
+            splicedData = dict(segData)
+
+            resultSeg = result.textSegments[segmentIdx] if result is not None else None
+            addedData = {dataName: dataValue for dataName, dataValue in resultSeg.data.items()
+                         if dataName not in ts.data} if resultSeg is not None else dict()
+            dataNames = Namespace(itertools.chain(segData, addedData))
+            addedPattern = getNamePattern(addedData)
+
+            newData = dict(ts.data)
+            for procName in ts.processes:
+                if procName not in dirty:
+                    fingerprint, lines, procData = self.procedures[procName]
+                    ts.processes[procName] = [FileData.TextSegment.Instruction(line) for line in lines]
+                    newData.update(procData)
+                    continue
+
+                instructions = resultSeg.processes[procName]
+                labelRenames = {label: labels.fresh(label) for label in
+                                definedLabels(ins.line for ins in instructions) if label in splicedLabels}
+                nameRenames = dict()
+                procData = []
+                for dataName in sorted(referencedNames((ins.line for ins in instructions), addedPattern)):
+                    dataValue = addedData[dataName]
+                    if splicedData.get(dataName, dataValue) != dataValue:
+                        nameRenames[dataName] = dataNames.fresh(dataName)
+                    procData.append((nameRenames.get(dataName, dataName), dataValue))
+
+                if len(labelRenames) != 0 or len(nameRenames) != 0:
+                    namePattern = getNamePattern(nameRenames)
+                    renamedInstructions = []
+                    for ins in instructions:
+                        newLine = renameLine(ins.line, labelRenames, namePattern, nameRenames)
+                        # Unaltered instructions are shared
+                        renamedInstructions.append(ins if newLine is ins.line else
+                                                   FileData.TextSegment.Instruction(newLine))
+                    instructions = renamedInstructions
+
+                ts.processes[procName] = instructions
+                newData.update(procData)
+                self.procedures[procName] = (fingerprints[procName], [ins.line for ins in instructions], procData)
+
+            ts.data = newData
+
+        fd.labels = labels
+        for procName in [procName for procName in self.procedures if procName not in fingerprints]:
+            del self.procedures[procName]      # Procedures removed from the file
+
+        return fd
+
+    def applyEntirely(self, fd: FileData, techniques, fingerprints: Dict[str, str], fused: bool = True,
+                      workers: int = 1, metrics=None, analyses=None) -> FileData:
+        # Applies 'techniques' to the entire 'fd' and replaces the state by the results of all its procedures-
+        # (given their 'fingerprints'), the rest of the arguments are passed to 'Techniques.applyTo'
+        result = techniques.applyTo(fd, fused, workers, metrics, analyses)
+
+        self.procedures = dict()
+        for ts, resultSeg in zip(fd.textSegments, result.textSegments):
+            addedData = {dataName: dataValue for dataName, dataValue in resultSeg.data.items()
+                         if dataName not in ts.data}
+            addedPattern = getNamePattern(addedData)
+            for procName, instructions in resultSeg.processes.items():
+                lines = [ins.line for ins in instructions]
+                procData = [(dataName, addedData[dataName])
+                            for dataName in sorted(referencedNames(lines, addedPattern))]
+                self.procedures[procName] = (fingerprints[procName], lines, procData)
+
+        return result
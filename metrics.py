@@ -0,0 +1,207 @@
+import json
+import time
+import tracemalloc
+from fileData import *
+from costModel import *
+
+__all__ = ['countInstructions', 'procedureSizes', 'Metrics']
+
+
+def countInstructions(fd: FileData) -> int:
+    # Utility function counting the instructions of all the processes in 'fd'
+    return sum(len(procInstructions) for ts in fd.textSegments for procInstructions in ts.processes.values())
+
+
+def procedureSizes(fd: FileData) -> Dict[str, int]:
+    # Utility function mapping every process in 'fd' to its number of instructions
+    return {procName: len(procInstructions) for ts in fd.textSegments
+            for procName, procInstructions in ts.processes.items()}
+
+
+class Metrics:
+    """
+        Collector of performance metrics of applying techniques to files (see 'applyTechniques').
+        Every measurement is emitted to 'sink' as a record (a JSON serializable dictionary) with an 'event' key:
+            'stage':     wall and CPU time and instruction counts in and out of a stage (parsing, planning, a-
+                         technique or saving), per-procedure techniques sharded across processes are one stage
+            'procedure': instruction counts in and out of a single procedure in a stage (if 'perProcedure')
+            'file':      totals of a file, including the analysis cache hits and misses and the peak memory-
+                         allocated while processing it (if 'traceMemory')
+            'cache':     whether the result of a file was found in the output cache (see 'OutputCache')
+            'analyses':  hits and misses of the analysis results shared between techniques (see 'AnalysisManager')
+            'incremental': numbers of procedures, of dirty ones and of transformed ones (dirty ones and their-
+                         callees) when applying techniques incrementally (see 'IncrementalState')
+            'cost':      estimated cycles of running every procedure once before and after a stage and the-
+                         overhead after it in percent of the parsed file (see 'CostModel'), and the own cycles of-
+                         every procedure if 'perProcedure' (if 'estimateCycles')
+        Instrumented code only calls the collector when one is given, so there's no overhead otherwise.
+        CPU time is of the current process (work done by pool workers isn't included).
+
+        arg 'sink': function called with every record (None to collect them in 'records')
+        arg 'perProcedure': whether to emit the instruction counts of every procedure in every stage
+        arg 'traceMemory': whether to trace the peak memory with 'tracemalloc' (slows processing down considerably)
+        arg 'estimateCycles': whether to estimate the cycles before and after every stage (see 'CostModel')
+    """
+
+    def __init__(self, sink=None, perProcedure: bool = False, traceMemory: bool = False,
+                 estimateCycles: bool = False):
+        self.records = []
+        self.sink = sink if sink is not None else self.records.append
+        self.perProcedure = perProcedure
+        self.traceMemory = traceMemory
+        self.estimateCycles = estimateCycles
+        self.fileCycles = None          # Estimated cycles of the file being processed as parsed (see 'emitCost')
+
+        self.file = None                # Location of the file being processed
+        self.fileStart = None           # Tuple of (wall time, CPU time, analysis cache stats) at start of the file
+        self.stopTracing = False        # Whether 'tracemalloc' was started by this object
+
+        # Accumulated measurements of per-procedure stages, see 'startProcedureStages'
+        self.procedureStages = []
+        self.procedureCosts = None      # 'CostModel' object of the file the stages are applied to
+
+    @staticmethod
+    def jsonLinesSink(stream):
+        # Returns a sink writing every record to the text stream 'stream' as a line of JSON
+        def sink(record):
+            stream.write(json.dumps(record) + '\n')
+        return sink
+
+    def emit(self, event: str, **fields):
+        record = {'event': event, 'file': self.file}
+        record.update(fields)
+        self.sink(record)
+
+    def startFile(self, file: str):
+        self.file = file
+        self.fileCycles = None
+        if self.traceMemory:
+            self.stopTracing = not tracemalloc.is_tracing()
+            if self.stopTracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        self.fileStart = (time.perf_counter(), time.process_time(),
+                          FileData.TextSegment.Instruction.analysisCache.stats())
+
+    def endFile(self, instructionsIn: int = None, instructionsOut: int = None):
+        # Emits the totals of the file started by 'startFile' (instruction counts are None if it wasn't parsed)
+        wallStart, cpuStart, cacheStart = self.fileStart
+        cacheEnd = FileData.TextSegment.Instruction.analysisCache.stats()
+        hits = cacheEnd['hits'] - cacheStart['hits']
+        misses = cacheEnd['misses'] - cacheStart['misses']
+
+        fields = dict(wall=time.perf_counter() - wallStart, cpu=time.process_time() - cpuStart,
+                      instructionsIn=instructionsIn, instructionsOut=instructionsOut,
+                      cacheHits=hits, cacheMisses=misses,
+                      cacheHitRate=hits / (hits + misses) if hits + misses != 0 else 0.0,
+                      cacheSize=cacheEnd['size'])
+
+        if self.traceMemory:
+            fields['peakMemory'] = tracemalloc.get_traced_memory()[1]
+            if self.stopTracing:
+                tracemalloc.stop()
+
+        self.emit('file', **fields)
+        self.file = None
+
+    def startStage(self, name: str, fd: FileData = None):
+        """
+            Starts measuring a stage named 'name' applied to 'fd' (None if there's no input, e.g. parsing).
+
+        returns: state to pass to 'endStage'
+        """
+
+        sizes = procedureSizes(fd) if fd is not None and self.perProcedure else None
+        count = countInstructions(fd) if fd is not None else 0
+        model = CostModel(fd) if fd is not None and self.estimateCycles else None
+        return name, count, sizes, model, time.perf_counter(), time.process_time()
+
+    def endStage(self, state, fd: FileData = None):
+        # Emits the measurements of the stage started by 'startStage' given its output 'fd'
+        wallEnd, cpuEnd = time.perf_counter(), time.process_time()
+        name, count, sizes, model, wallStart, cpuStart = state
+
+        self.emit('stage', stage=name, wall=wallEnd - wallStart, cpu=cpuEnd - cpuStart,
+                  instructionsIn=count, instructionsOut=countInstructions(fd) if fd is not None else 0)
+
+        if self.perProcedure and fd is not None:
+            for procName, size in procedureSizes(fd).items():
+                self.emit('procedure', stage=name, procedure=procName,
+                          instructionsIn=sizes.get(procName, 0) if sizes is not None else 0, instructionsOut=size)
+
+        if self.estimateCycles and fd is not None:
+            modelOut = CostModel(fd)
+            self.emitCost(name, model.total() if model is not None else None, modelOut.total(),
+                          {procName: (model.ownCycles.get(procName, 0) if model is not None else 0, cycles)
+                           for procName, cycles in modelOut.ownCycles.items()})
+
+    def emitCost(self, name: str, cyclesIn: float, cyclesOut: float, procedures: Dict[str, tuple] = None):
+        """
+            Emits the estimated cycles before and after the stage 'name' (see 'CostModel'), 'cyclesIn' is None-
+            for stages without an input (parsing).
+            arg 'procedures': dictionary mapping procedures to their own cycles before and after the stage
+        """
+
+        if self.fileCycles is None:     # The first estimate is the baseline of the file
+            self.fileCycles = cyclesOut
+        if cyclesIn is None:
+            return
+
+        self.emit('cost', stage=name, cyclesIn=cyclesIn, cyclesOut=cyclesOut,
+                  overhead=100 * (cyclesOut / self.fileCycles - 1) if self.fileCycles != 0 else 0.0)
+
+        if self.perProcedure:
+            for procName, (procIn, procOut) in (procedures or dict()).items():
+                self.emit('cost', stage=name, procedure=procName, cyclesIn=procIn, cyclesOut=procOut)
+
+    def startProcedureStages(self, names: [str], fd: FileData = None):
+        """
+            Starts measuring per-procedure stages named 'names' applied to 'fd' whose calls are made through-
+            'runProcedureStage' (in any order), measurements are accumulated per stage until 'endProcedureStages'.
+            Stages don't alter calls, so the estimated cycles of the file change by the own cycles of every-
+            procedure weighted by the times it runs (see 'CostModel').
+        """
+
+        # Array per stage of [name, wall time, CPU time, instructions in, instructions out, counts per procedure,-
+        # change of the estimated cycles, own cycles in and out per procedure]
+        self.procedureStages = [[name, 0.0, 0.0, 0, 0, dict() if self.perProcedure else None, 0.0,
+                                 dict() if self.perProcedure else None] for name in names]
+        self.procedureCosts = CostModel(fd) if fd is not None and self.estimateCycles else None
+
+    def runProcedureStage(self, stageIdx: int, stage, procName: str, instructions, limit, rng, **kwargs):
+        # Calls the per-procedure stage 'stage' (see 'Techniques.stages') with keyword arguments 'kwargs' measuring-
+        # it, returns its result
+        wallStart, cpuStart = time.perf_counter(), time.process_time()
+        result = stage(instructions, limit, rng, **kwargs)
+        wallEnd, cpuEnd = time.perf_counter(), time.process_time()
+
+        measurements = self.procedureStages[stageIdx]
+        measurements[1] += wallEnd - wallStart
+        measurements[2] += cpuEnd - cpuStart
+        measurements[3] += len(instructions)
+        measurements[4] += len(result)
+        if measurements[5] is not None:
+            measurements[5][procName] = (len(instructions), len(result))
+        if self.procedureCosts is not None:
+            cyclesIn, cyclesOut = procedureCycles(instructions), procedureCycles(result)
+            measurements[6] += self.procedureCosts.runs.get(procName, 1.0) * (cyclesOut - cyclesIn)
+            if measurements[7] is not None:
+                measurements[7][procName] = (cyclesIn, cyclesOut)
+
+        return result
+
+    def endProcedureStages(self):
+        cycles = self.procedureCosts.total() if self.procedureCosts is not None else None
+        for name, wall, cpu, instructionsIn, instructionsOut, procedures, addedCycles, procedureCosts in \
+                self.procedureStages:
+            self.emit('stage', stage=name, wall=wall, cpu=cpu,
+                      instructionsIn=instructionsIn, instructionsOut=instructionsOut)
+            for procName, (procIn, procOut) in (procedures or dict()).items():
+                self.emit('procedure', stage=name, procedure=procName,
+                          instructionsIn=procIn, instructionsOut=procOut)
+            if cycles is not None:
+                self.emitCost(name, cycles, cycles + addedCycles, procedureCosts)
+                cycles += addedCycles
+        self.procedureStages = []
+        self.procedureCosts = None
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import shutil
+from fileData import atomicWrite
+
+CACHE_VERSION = 4   # Bumped whenever the output of the techniques changes for the same input
+
+ENTRY_SUFFIX = '.asm'
+
+
+class OutputCache:
+    """
+        On-disk cache of obfuscated files, shared safely between concurrent processes.
+        Entries are keyed by a hash of everything the result depends on (see 'keyOf') and written atomically-
+        (to a temporary file renamed into place), so a reader never sees a partial entry.
+        Least recently used entries are evicted once the cache exceeds 'maxBytes'.
+
+        arg 'directory': directory of the cache (created if missing)
+        arg 'maxBytes': maximal total size of the entries
+    """
+
+    DEFAULT_MAX_BYTES = 1 << 30
+
+    def __init__(self, directory: str, maxBytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def keyOf(file: str, techniques) -> str:
+        """
+            Key of the result of applying 'techniques' (a 'Techniques' object) to 'file': a hash of the contents-
+            of the file, its name (seeds are derived from it), the applied pipeline, 'junkSize', the budget and seed.
+        """
+
+        hasher = hashlib.sha256()
+        hasher.update(repr((CACHE_VERSION, os.path.basename(file), techniques.identity())).encode())
+
+        with open(file, 'rb') as f:
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+
+        return hasher.hexdigest()
+
+    def entryPath(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def fetch(self, key: str, location: str) -> bool:
+        """
+            Copies the entry of 'key' (if there is one) to 'location', marking it as recently used.
+
+        returns: whether there was an entry
+        """
+
+        entry = self.entryPath(key)
+        try:
+            os.utime(entry)
+            OutputCache.copyAtomically(entry, location)
+        except FileNotFoundError:   # Missing or evicted by another process meanwhile
+            return False
+
+        return True
+
+    def store(self, key: str, location: str):
+        # Adds the file at 'location' as the entry of 'key', then evicts entries if the cache is too big
+        OutputCache.copyAtomically(location, self.entryPath(key))
+        self.evict()
+
+    @staticmethod
+    def copyAtomically(source: str, destination: str):
+        # Utility function copying 'source' to 'destination' atomically (see 'fileData.atomicWrite')
+        with atomicWrite(destination) as tmp, open(source, 'rb') as f:
+            shutil.copyfileobj(f, tmp, 1 << 20)
+
+    def entries(self) -> [(float, int, str)]:
+        # Array of (last use time, size, path) of all the entries, least recently used first
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:   # Evicted by another process meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Removes least recently used entries until the cache fits in 'maxBytes'
+        entries = self.entries()
+        totalSize = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if totalSize <= self.maxBytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:   # Evicted by another process meanwhile
+                pass
+            totalSize -= size
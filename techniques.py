@@ -1,4 +1,19 @@
+import functools
+import itertools
+import multiprocessing
+import os
+import random
+from array import array
 from usefulFunctions import *
+from callGraph import CallGraph
+from controlFlow import ControlFlowGraph, loopDepths
+from growthPlanner import *
+from costModel import *
+from metrics import *
+from outputCache import OutputCache
+from incremental import IncrementalState
+from binaryIR import *
+from analysisManager import AnalysisManager
 
 class Techniques:
     """
@@ -13,123 +28,335 @@ class Techniques:
 
     NUM_TECHNIQUES = 3
 
+    # Analyses every technique consumes and the file analyses it preserves (see 'AnalysisManager'), procedure-
+    # analyses are kept for every procedure a technique leaves unchanged. Junk code never adds or reorders calls-
+    # (its control flow analysis is needed only for loop-aware placement, see 'analysesOf').
+    TECHNIQUE_ANALYSES = {
+        TECHNIQUE_FUNCTION_INLINING: (['callGraph'], []),
+        TECHNIQUE_JUNK_CODE: (['liveness'], ['callGraph']),
+        TECHNIQUE_PERMUTE_LINES: (['dependencies'], []),
+    }
+
     def __init__(self, applies_functionInlining = False, applies_junkCode = False,
                  applies_permuteLines = False, junkSize = 2,
                  pipeline = [TECHNIQUE_JUNK_CODE, TECHNIQUE_FUNCTION_INLINING, TECHNIQUE_PERMUTE_LINES,
-                             TECHNIQUE_JUNK_CODE, TECHNIQUE_FUNCTION_INLINING, TECHNIQUE_PERMUTE_LINES]):
+                             TECHNIQUE_JUNK_CODE, TECHNIQUE_FUNCTION_INLINING, TECHNIQUE_PERMUTE_LINES],
+                 budget: GrowthBudget = None, seed: int = None, maxOverhead: float = None,
+                 junkLoopScale: float = 1.0, junkSkipsInnermostLoops: bool = False):
         """
         Constructor method that specifies which technique instance will imply applying.
         argument 'junkSize': a measurement of how much junk code will be injected.
         argument 'pipeline': an ordered list of technique indices to apply.
+        argument 'budget': limits on the size of the result (see 'GrowthBudget'), None for unlimited.
+        argument 'seed': seed of the job (see 'applyTo'), None to draw one from the 'random' module on every use.
+        argument 'maxOverhead': maximal estimated slowdown of every procedure in percent (see 'planCycles'),-
+                                None for unlimited.
+        argument 'junkLoopScale': fraction of the junk code kept per level of loop nesting (see 'junkCodeProcedure').
+        argument 'junkSkipsInnermostLoops': whether no junk code is injected into innermost loops.
         """
 
+        self.junkSize = junkSize
+        self.junkLoopScale = junkLoopScale
+        self.junkSkipsInnermostLoops = junkSkipsInnermostLoops
+        self.budget = budget
+        self.seed = seed
+        self.maxOverhead = maxOverhead
+
         appliesFunc = [None for _ in range(Techniques.NUM_TECHNIQUES)]
         appliesFunc[Techniques.TECHNIQUE_FUNCTION_INLINING] = [applies_functionInlining, functionInlining]
-        appliesFunc[Techniques.TECHNIQUE_JUNK_CODE] = [applies_junkCode, getJunkCodeFunction(junkSize)]
+        appliesFunc[Techniques.TECHNIQUE_JUNK_CODE] = [
+            applies_junkCode, getJunkCodeFunction(junkSize, junkLoopScale, junkSkipsInnermostLoops)]
         appliesFunc[Techniques.TECHNIQUE_PERMUTE_LINES] = [applies_permuteLines, permuteLines]
 
+        # Per-procedure implementation of every technique (None for techniques needing the entire file):
+        procedureFunc = [None for _ in range(Techniques.NUM_TECHNIQUES)]
+        procedureFunc[Techniques.TECHNIQUE_JUNK_CODE] = functools.partial(
+            junkCodeProcedure, junkSize=junkSize, loopScale=junkLoopScale, skipsInnermostLoops=junkSkipsInnermostLoops)
+        procedureFunc[Techniques.TECHNIQUE_PERMUTE_LINES] = permuteProcedure
+
         self.techniqueFunctions = []    # Array of functions of techniques sorted in correct order
+        self.pipeline = []              # Array of the indices of the applied techniques in the same order
+        self.stages = []                # Array of (technique function, per-procedure function) in the same order
 
         for t in pipeline:
             applies, func = appliesFunc[t]
             if applies:
                 self.techniqueFunctions.append(func)
+                self.pipeline.append(t)
+                self.stages.append((func, procedureFunc[t]))
+
+    def applyTo(self, fd: FileData, fused: bool = True, workers: int = 1, metrics: Metrics = None,
+                analyses: AnalysisManager = None) -> FileData:
+        """
+            Applies the techniques to 'fd' and returns the result.
+            Consecutive per-procedure techniques run together (see 'applyProcedureStages'), only techniques-
+            needing the entire file (inlining) act as barriers between them.
+            Every per-procedure technique draws from its own 'random.Random' seeded by the job seed, the file name,-
+            the procedure name and the technique's position in the pipeline, so the result depends on nothing else.
+
+        arg 'fused': whether every procedure goes through consecutive per-procedure techniques back to back-
+                     while its instructions are hot in cache (the result is the same either way)
+        arg 'workers': number of processes to shard procedures across in fused mode (the result is the same)
+        arg 'metrics': collector of the metrics of every technique (see 'Metrics'), None for no instrumentation
+        arg 'analyses': analysis results of 'fd' to reuse and update (see 'AnalysisManager'), None to start afresh
+        """
+
+        analyses = analyses if analyses is not None else AnalysisManager()
+        jobSeed = self.seed if self.seed is not None else random.getrandbits(64)
+        fileName = os.path.basename(fd.sourcePath) if fd.sourcePath is not None else ''
+
+        pool = None     # Pool of worker processes, started once procedures are first sharded across them
+
+        def getPool() -> multiprocessing.Pool:
+            nonlocal pool
+            if pool is None:
+                pool = multiprocessing.Pool(workers)
+            return pool
+
+        try:
+            for isPerProcedure, stages in itertools.groupby(enumerate(self.stages),
+                                                            key=lambda stage: stage[1][1] is not None):
+                stages = list(stages)
+                requirements = [self.analysesOf(self.pipeline[position]) for position, _ in stages]
+                if isPerProcedure:
+                    fd = applyProcedureStages(fd, [procedureFunc for _, (_, procedureFunc) in stages],
+                                              [(jobSeed, fileName, position) for position, _ in stages],
+                                              fused, getPool if fused and workers > 1 else None, metrics,
+                                              [func.__name__ for _, (func, _) in stages],
+                                              analyses, [required for required, _ in requirements])
+                    analyses.invalidate(set.intersection(*(set(preserved) for _, preserved in requirements)))
+                else:
+                    for (_, (func, _)), (required, preserved) in zip(stages, requirements):
+                        metricsState = metrics.startStage(func.__name__, fd) if metrics is not None else None
+                        fd = func(fd, **{name: analyses.file(name, fd) for name in required})
+                        analyses.invalidate(preserved)
+                        if metrics is not None:
+                            metrics.endStage(metricsState, fd)
+                analyses.retain(fd)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        return fd
+
+    def analysesOf(self, technique: int) -> ([str], [str]):
+        # Analyses 'technique' consumes and the file analyses it preserves as configured (see 'TECHNIQUE_ANALYSES')
+        required, preserved = Techniques.TECHNIQUE_ANALYSES[technique]
+        if technique == Techniques.TECHNIQUE_JUNK_CODE and (self.junkLoopScale != 1 or self.junkSkipsInnermostLoops or
+                                                            self.maxOverhead is not None):
+            required = required + ['controlFlow']
+        return required, preserved
+
+    def identity(self) -> tuple:
+        # Tuple of everything (besides the file) the result of applying the techniques depends on given a seed
+        budget = sorted(vars(self.budget).items()) if self.budget is not None else None
+        return tuple(self.pipeline), self.junkSize, budget, self.seed, self.maxOverhead, self.junkLoopScale, \
+            self.junkSkipsInnermostLoops
+
+    def planGrowth(self, fd: FileData, analyses: AnalysisManager = None) -> GrowthPlan:
+        """
+            Predicts how much applying the techniques grows 'fd' and limits the growth to 'budget' (if given).
+            Doesn't alter 'fd', put the plan's 'limits' in 'fd.growthLimits' to enforce them.
+            arg 'analyses': analysis results of 'fd' to reuse and update (see 'AnalysisManager')
+        """
+
+        plan = GrowthPlan(fd, analyses.file('callGraph', fd) if analyses is not None else None)
+        for t in self.pipeline:
+            if t == Techniques.TECHNIQUE_JUNK_CODE:
+                plan.addJunkCode(self.junkSize)
+            elif t == Techniques.TECHNIQUE_FUNCTION_INLINING:
+                plan.addFunctionInlining()
+
+        if self.budget is not None:
+            plan.limit(self.budget)
+
+        return plan
+
+    def planCycles(self, fd: FileData, analyses: AnalysisManager = None) -> Dict[str, CycleLimit]:
+        """
+            Limits on the estimated cycles of every procedure of 'fd' keeping its slowdown within 'maxOverhead'-
+            percent (see 'CostModel'). Put them in 'fd.cycleLimits' to enforce them: techniques that insert-
+            instructions skip insertions that would exceed them.
+            arg 'analyses': analysis results of 'fd' to reuse and update (see 'AnalysisManager')
+        """
 
+        model = CostModel(fd, analyses.file('callGraph', fd) if analyses is not None else None)
+        return model.limits(self.maxOverhead)
 
-def functionInlining(fd : FileData) -> FileData:
 
+def inlineBody(body, segData: dict, segDataNames: Namespace, segLabels: Namespace, fileLabels: Namespace,
+               returnLabelBase: str):
     """
-        Anti disassembly technique implementation that inlines all function calls in given 'FileData' object (once).
-        Warning: recursive functions with inner calls>1 increase very fast! (a_n = a_0^(2^n))
+        Utility function instantiating an (expanded) function body in place of a call to it.
+
+    arg 'body': tuple of (instructions, data dictionary, labels) of the function (see 'functionInlining')
+    arg 'segData', 'segDataNames': data of the segment the body is inserted into and their names, updated in place
+    arg 'segLabels', 'fileLabels': labels of the segment and of the file, updated in place
+    arg 'returnLabelBase': name from which the label replacing the function's returns is derived
+
+    returns: array of instructions replacing the call
+    """
+
+    instructions, data, labels = body
+
+    # Insert data (renaming on conflict):
+    nameRenames = dict()
+    for dataName, dataValue in data.items():
+        newName = dataName
+        if newName in segDataNames:
+            newName = segDataNames.fresh(dataName)
+            nameRenames[dataName] = newName
+        else:
+            segDataNames.append(newName)
+
+        segData[newName] = dataValue
+
+    # Fix label conflicts (every call site gets its own copies of the labels):
+    labelRenames = dict()
+    for label in labels:
+        newName = fileLabels.fresh(label)
+        segLabels.append(newName)
+        labelRenames[label] = newName
+
+    # Remove return lines:
+    returnLabel = fileLabels.fresh(returnLabelBase)
+    segLabels.append(returnLabel)
+
+    isCallerCleanUp: bool = False   # Whether the callee is cleaning the stack.
+                                    # We assume {ret imm} form indicates such a convention.
+
+    namePattern = getNamePattern(nameRenames)
+    newInstructions = [FileData.TextSegment.Instruction(['sub', 'esp,', '4'])]  # Stub in place of {push eip} of call
+    for ins in instructions:
+        line = ins.line
+        if len(line) != 0 and line[0] == 'ret':
+            if len(line) == 2 and line[1] != '0':
+                # E.g. 'ret 8' <=> {return and pop 8 bytes from stack}
+                newInstructions.append(FileData.TextSegment.Instruction(['add', 'esp,', line[1]]))
+                isCallerCleanUp = True
+            newInstructions.append(FileData.TextSegment.Instruction(['jmp', returnLabel]))
+        else:
+            newLine = renameLine(line, labelRenames, namePattern, nameRenames)
+            # Unaltered instructions are shared
+            newInstructions.append(ins if newLine is line else FileData.TextSegment.Instruction(newLine))
+
+    newInstructions.append(FileData.TextSegment.Instruction([returnLabel + ':']))     # The label itself
+    if not isCallerCleanUp:                 # Removing stub {pop eip} of ret
+        newInstructions.append(FileData.TextSegment.Instruction(['add', 'esp,', '4']))
+
+    return newInstructions
+
+
+def functionInlining(fd : FileData, callGraph: CallGraph = None) -> FileData:
+
     """
+        Anti disassembly technique implementation that inlines all function calls in given 'FileData' object.
+        Functions are expanded bottom-up over the call graph (see 'CallGraph') so calls are inlined transitively-
+        and every function's fully expanded body is computed once and reused by all of its call sites.
+        Calls within recursive cycles are never inlined, a call into a cycle (from outside it) inlines one level of it.
+        arg 'callGraph': call graph of 'fd' if already computed
+    """
+
+    graph = callGraph if callGraph is not None else CallGraph(fd)
+
+    def returnLabelBase(labels):
+        return 'Co01Secr3tLabel' if len(labels) == 0 else labels[0]
+
+    def inlinableCallee(callerName, line):
+        # Name of the function 'line' calls if the call should be inlined (None otherwise)
+        calleeName = CallGraph.getCallee(line)
+        if calleeName is None or calleeName not in fd.functions or graph.isRecursiveCall(callerName, calleeName):
+            return None
+        return calleeName
 
+    def expand(procName, instructions, data, dataNames, labels, fileLabels):
+        """
+            Utility function inlining the calls in 'instructions' of procedure 'procName' (within its limits).
+            A call is skipped if inlining it would make the procedure exceed its limit (see 'FileData.growthLimits')-
+            or its limit on estimated cycles (see 'FileData.cycleLimits').
+
+        returns: tuple of (new array of instructions, number of data lines added to 'data')
+        """
+
+        limit = fd.growthLimits.get(procName)
+        size = len(instructions)    # Upper bound on the lines of the procedure so far (see 'getInliningGrowth')
+        cycleLimit = fd.cycleLimits.get(procName)
+        if cycleLimit is not None:
+            cycles = cycleLimit.cyclesOf(instructions)     # Estimated cycles of the procedure so far
+            depths = loopDepths(instructions)
+            inliningCycles = dict()     # Dictionary mapping callees to the estimated cycles inlining them adds
+        numData = len(data)
+        newInstructions = []
+        for idx, ins in enumerate(instructions):
+            calleeName = inlinableCallee(procName, ins.line)
+            if calleeName is not None and (limit is not None or cycleLimit is not None):
+                bodyInstructions, bodyData, _ = expandedBodies[calleeName]
+                growth = getInliningGrowth(len(bodyInstructions), bodyReturns[calleeName]) + len(bodyData)
+                addedCycles = 0
+                if cycleLimit is not None:
+                    if calleeName not in inliningCycles:
+                        inliningCycles[calleeName] = cycleLimit.inliningCycles(calleeName, bodyInstructions,
+                                                                               bodyReturns[calleeName])
+                    addedCycles = inliningCycles[calleeName] * LOOP_WEIGHT ** depths[idx]
+                if (limit is not None and size + growth > limit) or \
+                        (cycleLimit is not None and cycles + addedCycles > cycleLimit.maxCycles):
+                    calleeName = None
+                else:
+                    size += growth
+                    if cycleLimit is not None:
+                        cycles += addedCycles
+
+            if calleeName is None:
+                newInstructions.append(ins)
+            else:
+                newInstructions.extend(inlineBody(expandedBodies[calleeName], data, dataNames, labels,
+                                                  fileLabels, returnLabelBase(fileLabels)))
+
+        return newInstructions, len(data) - numData
+
+    # Expanding function bodies bottom-up, each body is a tuple of (instructions, data dictionary, labels).
+    # Labels of expanded bodies are placeholders, unique among themselves and the file's labels-
+    # since every call site renames them anyway.
+    scratchLabels = fd.labels.copy()
+    expandedBodies = dict()
+    bodyReturns = dict()    # Dictionary mapping functions to the number of 'ret' lines in their expanded body
+    for funcName in graph.bottomUpOrder():
+        funcSeg = fd.textSegments[fd.functions[funcName]]
+        bodyData = dict(funcSeg.data)
+        bodyLabels = Namespace(funcSeg.labels)
+        bodyInstructions, _ = expand(funcName, funcSeg.processes[funcName], bodyData, Namespace(bodyData),
+                                     bodyLabels, scratchLabels)
+        expandedBodies[funcName] = (bodyInstructions, bodyData, list(bodyLabels))
+        bodyReturns[funcName] = countReturns(bodyInstructions)
+
+    # Lines and instructions are never altered in place, so everything left unchanged is shared with 'fd'-
+    # and only the containers are copied.
     tmpFileData = FileData()
-    tmpFileData.labels = fd.labels[:]
-    tmpFileData.miscSegments = copy.deepcopy(fd.miscSegments)
-    tmpFileData.segmentlessLines = fd.segmentlessLines[:]
-    tmpFileData.data = copy.deepcopy(fd.data)
+    tmpFileData.labels = fd.labels.copy()
+    tmpFileData.miscSegments = dict(fd.miscSegments)
+    tmpFileData.segmentlessLines = fd.segmentlessLines
+    tmpFileData.data = fd.data
+    tmpFileData.sourcePath = fd.sourcePath
+    tmpFileData.growthLimits = dict(fd.growthLimits)
+    tmpFileData.cycleLimits = dict(fd.cycleLimits)
 
     for t in fd.textSegments:
         tmpSeg = FileData.TextSegment()        # Temporary segment for storing changes
-        tmpSeg.data = copy.deepcopy(t.data)
-        tmpSeg.labels = t.labels[:]
+        tmpSeg.data = dict(t.data)
+        tmpSeg.labels = t.labels.copy()
+        dataNames = Namespace(tmpSeg.data)     # Names of data in 'tmpSeg', for generating fresh ones
 
         tmpFunctions = []       # Array of functions processed in current segment, used to fix 'functions' dict
 
         for procName, procInstructions in t.processes.items():
             tmpFunctions.append(procName)
-            tmpProcLines = []
-            for instruction in procInstructions:
-                line = instruction.line
-                if line[0] == 'call':                       # Calling another function which we might inline
-                    funcName = line[1]
-                    if funcName in fd.functions:            # If function is defined locally then we can inline it
-                        funcSeg = fd.textSegments[fd.functions[funcName]]
-                        funcLines = [ins.line for ins in funcSeg.processes[funcName]]
-                        tmpFuncLines = funcLines[:]         # Temporary array for storing lines after alterations
-
-                        # Insert data:
-                        for dataName, dataValue in funcSeg.data.items():
-                            newName = dataName
-                            isChanged = False
-                            if newName in tmpSeg.data:
-                                isChanged = True
-                                newName = increaseName(newName, len(tmpSeg.data.keys())-1)  # Trying to avoid conflict
-                                while newName in tmpSeg.data:   # Name conflict
-                                    newName = increaseName(newName)
-
-                            tmpSeg.data[newName] = dataValue
-
-                            if isChanged:
-                                tmpFuncLines = [swapNames(line = funcLine, oldName = dataName, newName = newName)
-                                                for funcLine in tmpFuncLines]
-
-                        # Fix label conflicts:
-                        for label in funcSeg.labels:
-                            newName = tmpFileData.labels[len(tmpFileData.labels)-1]
-                            while newName in tmpFileData.labels:
-                                newName = increaseName(newName)
-
-                            tmpSeg.labels.append(newName)
-                            tmpFileData.labels.append(newName)
-                            tmpFuncLines = [swapLabels(line = funcLine, oldName = label, newName = newName)
-                                            for funcLine in tmpFuncLines]
-
-                        # Remove return lines:
-                        newName = 'Co01Secr3tLabel' if len(tmpFileData.labels) == 0 else tmpFileData.labels[0]
-                        while newName in tmpFileData.labels:
-                            newName = increaseName(newName)
-
-                        tmpSeg.labels.append(newName)
-                        tmpFileData.labels.append(newName)
-
-                        isCallerCleanUp: bool = False   # Whether the callee is cleaning the stack.
-                                                        # We assume {ret imm} form indicates such a convention.
-
-                        tmpFuncLines2 = [['sub', 'esp,', '4']]   # Adding a stub in place of {push eip} of call
-                        for funcLine in tmpFuncLines:
-                            if funcLine[0] == 'ret':
-                                if len(funcLine) == 2 and funcLine[1] != '0':
-                                    # E.g. 'ret 8' <=> {return and pop 8 bytes from stack}
-                                    tmpFuncLines2.append(['add', 'esp,', funcLine[1]])
-                                    isCallerCleanUp = True
-                                tmpFuncLines2.append(['jmp', newName])
-                            else:
-                                tmpFuncLines2.append(funcLine)
-
-                        tmpFuncLines2.append([newName+':'])     # The label itself
-
-                        # Insert function:
-                        tmpProcLines.extend(tmpFuncLines2)
-                        if not isCallerCleanUp:                 # Removing stub {pop eip} of ret
-                            tmpProcLines.append(['add', 'esp,', '4'])
-
-                    else:
-                        tmpProcLines.append(line)
-                else:
-                    tmpProcLines.append(line)
+            # Array of instructions (original ones are reused when a line isn't altered):
+            tmpProcInstructions, numData = expand(procName, procInstructions, tmpSeg.data, dataNames,
+                                                  tmpSeg.labels, tmpFileData.labels)
+            if procName in tmpFileData.growthLimits:    # Data lines count against the limit of the procedure
+                tmpFileData.growthLimits[procName] -= numData
 
-            tmpSeg.processes[procName] = [(FileData.TextSegment.Instruction(tmpLine)) for tmpLine in tmpProcLines]
+            tmpSeg.processes[procName] = tmpProcInstructions
 
         tmpFileData.textSegments.append(tmpSeg)
         index = len(tmpFileData.textSegments) - 1
@@ -139,9 +366,86 @@ def functionInlining(fd : FileData) -> FileData:
     return tmpFileData
 
 
-def getJunkCodeFunction(junkSize=2):
+def junkCodeProcedure(procInstructions, limit: int = None, rng: random.Random = random, junkSize: int = 2,
+                      liveness: array = None, cycleLimit: CycleLimit = None, loopScale: float = 1.0,
+                      skipsInnermostLoops: bool = False, controlFlow: ControlFlowGraph = None):
+    """
+        Utility function adding junk code to a single procedure (see 'getJunkCodeFunction').
+        Inside loops junk runs on every iteration, so at loop depth d at most junkSize * loopScale ** d lines-
+        (rounded down) are inserted before an instruction, none inside innermost loops if 'skipsInnermostLoops'.
+
+    arg 'procInstructions': array of the procedure's instructions
+    arg 'limit': maximal number of instructions the procedure may grow to (None if unlimited)
+    arg 'rng': source of randomness ('random.Random' object, or the 'random' module itself)
+    arg 'liveness': result of 'getFreeMasks' for the procedure if already computed
+    arg 'cycleLimit': limit on the estimated cycles of the procedure (None if unlimited), junk that would-
+                      exceed it isn't inserted
+    arg 'controlFlow': 'ControlFlowGraph' of the procedure if already computed
+
+    returns: new array of instructions
+    """
 
-    def junkCode(fd: FileData) -> FileData:
+    # canChange[i] = bitmask of units we can insert changes to before instruction i (see 'getFreeMasks')
+    canChange = liveness if liveness is not None else getFreeMasks(procInstructions)
+
+    # Number of junk lines the procedure's growth limit still allows (None if unlimited):
+    spare = None if limit is None else max(0, limit - len(procInstructions))
+
+    loopAware = loopScale != 1 or skipsInnermostLoops
+    if controlFlow is None and (loopAware or cycleLimit is not None):
+        controlFlow = ControlFlowGraph(procInstructions)
+    tracker = CycleTracker(cycleLimit, procInstructions, controlFlow.depths) if cycleLimit is not None else None
+
+    # Junk is drawn in batches: the number of junk lines before every instruction where registers can change,-
+    # then the lines themselves from the pool of each bitmask (see 'JunkPool'). Lines beyond the limit are discarded.
+    registersMask = FileData.TextSegment.Instruction.REGISTERS_MASK
+    positions = [idx for idx in range(len(procInstructions)) if canChange[idx] & registersMask != 0] \
+        if spare != 0 else []
+    counts = rng.choices(range(junkSize + 1), k=len(positions))
+    if loopAware:
+        maxCounts = dict()      # Dictionary mapping loop depths to the maximal number of junk lines at them
+        for countIdx, idx in enumerate(positions):
+            depth = controlFlow.depths[idx]
+            if skipsInnermostLoops and controlFlow.innermost[idx]:
+                counts[countIdx] = 0
+            elif depth != 0:
+                if depth not in maxCounts:
+                    maxCounts[depth] = int(junkSize * loopScale ** depth)
+                counts[countIdx] = min(counts[countIdx], maxCounts[depth])
+
+    positionPools = [getJunkPool(canChange[idx]) for idx in positions]
+    totals = dict()     # Dictionary mapping every 'JunkPool' object used to the number of lines drawn from it
+    for pool, count in zip(positionPools, counts):
+        totals[pool] = totals.get(pool, 0) + count
+    drawn = {pool: iter(pool.sample(total, rng)) for pool, total in totals.items()}
+
+    # New list of instructions after adding junk code
+    tmpInstructions: List[FileData.TextSegment.Instruction] = []
+    prevIdx = 0
+    for idx, pool, count in zip(positions, positionPools, counts):
+        tmpInstructions.extend(procInstructions[prevIdx:idx])   # Adding original instructions
+        if tracker is not None:
+            tracker.advance(procInstructions[prevIdx:idx])
+        prevIdx = idx
+
+        outcomes = list(itertools.islice(drawn[pool], count))
+        if spare is not None:
+            outcomes = outcomes[:spare]
+        instrs = [ins for ins in outcomes if ins is not None]
+        if tracker is not None and len(instrs) != 0 and not tracker.insert(instrs, idx, procInstructions[idx]):
+            instrs = []
+        if spare is not None:
+            spare -= len(instrs)
+        tmpInstructions.extend(instrs)
+
+    tmpInstructions.extend(procInstructions[prevIdx:])
+
+    return tmpInstructions
+
+
+def getJunkCodeFunction(junkSize=2, loopScale=1.0, skipsInnermostLoops=False):
+
+    def junkCode(fd: FileData, rng: random.Random = random) -> FileData:
         """
             Anti disassembly technique implementation that adds junk code to given 'FileData' object.
             This function adds 'junkSize' lines that change a register in every place possible (per each register).
@@ -150,155 +454,164 @@ def getJunkCodeFunction(junkSize=2):
 
         for tsIdx, ts in enumerate(fd.textSegments):
             for procName, procInstructions in ts.processes.items():
-
-                # The following is a utility matrix such that-
-                #   isNextUse[reg][i] = is the next occurrence of reg is the process an instruction that uses reg.
-                # This is useful for determining where a junk instruction that changes reg can be inserted-
-                # only if the next occurrence is not a use of reg (as opposed to an instruction that only changes reg).
-                registerRange = 14   # testing on x32
-                matrixWidth = len(procInstructions)
-                isNextUse = [[True for __ in range(matrixWidth + 1)] for _ in range(registerRange + 1)]
-
-                # Calculating matrix values:
-                for idx, ins in enumerate(reversed(procInstructions)):
-                    for regIdx in range(registerRange + 1):
-                        occurred = False
-
-                        if ins.uses[regIdx]:  # Is used in this line
-                            occurred = True
-                            isNextUse[regIdx][matrixWidth-idx-1] = True
-
-                        if not occurred and ins.changes[regIdx]:  # Is only changed in this line
-                            occurred = True
-                            isNextUse[regIdx][matrixWidth-idx-1] = False
-
-                        if not occurred:  # Otherwise the next is same as proceeding instruction
-                            isNextUse[regIdx][matrixWidth-idx-1] = isNextUse[regIdx][matrixWidth-idx]
-
-                # New list of instructions after adding junk code
-                tmpInstructions: List[FileData.TextSegment.Instruction] = []
-                for idx, ins in enumerate(procInstructions):
-                    canChange = []
-                    regChangeFlag = False
-                    for regIdx in range(registerRange + 1):
-                        if not isNextUse[regIdx][idx]:  # I.e. can we insert changes to reg before current instruction
-                            canChange.append(regIdx)
-                            if regIdx <= 7:
-                                regChangeFlag = True
-
-                    if regChangeFlag:
-                        numJunk = random.randint(0, junkSize)
-                        instrs = []
-                        for _ in range(numJunk):
-                            instrs += getJunkInstruction(canChange)
-                        tmpInstructions.extend(instrs)
-
-                    tmpInstructions.append(ins)  # Adding original instruction
-
-                fd.textSegments[tsIdx].processes[procName] = copy.deepcopy(tmpInstructions)
+                fd.textSegments[tsIdx].processes[procName] = junkCodeProcedure(
+                    procInstructions, fd.growthLimits.get(procName), rng, junkSize,
+                    cycleLimit=fd.cycleLimits.get(procName), loopScale=loopScale,
+                    skipsInnermostLoops=skipsInnermostLoops)
 
         return fd
 
     return junkCode
 
 
-def permuteLines(fd: FileData) -> FileData:
+PERMUTATION_ATTEMPTS = 3     # Orders drawn for a procedure before giving up on exceeding no cycle limit
+
+
+def permuteProcedure(procInstructions, limit: int = None, rng: random.Random = random,
+                     dependencies: DependencyGraph = None, cycleLimit: CycleLimit = None):
+    # Utility function permuting the order-invariant instructions of a single procedure (see 'permuteLines')-
+    # given its dependency graph if already computed. Instructions are shared, they are immutable.
+    # Permuting inserts nothing (so 'limit' doesn't apply) but may bring dependent instructions together, so with-
+    # a 'cycleLimit' the first of 'PERMUTATION_ATTEMPTS' orders within it is taken (the original order if none is)
+    graph = dependencies if dependencies is not None else DependencyGraph(procInstructions)
+    for _ in range(PERMUTATION_ATTEMPTS if cycleLimit is not None else 1):
+        permuted = [procInstructions[ins] for ins in graph.randomTopologicalOrder(rng)]
+        if cycleLimit is None or cycleLimit.cyclesOf(permuted) <= cycleLimit.maxCycles:
+            return permuted
+    return procInstructions
+
+
+def permuteLines(fd: FileData, rng: random.Random = random) -> FileData:
     """
             Anti disassembly technique implementation that
             permutes all order-invariant instructions in given 'FileData' object.
     """
 
-    # Enumeration of states of chunks of a unit, more details in inner loop.
-    UNIT_STATE_EMPTY = 0
-    UNIT_STATE_USES = 1
-    UNIT_STATE_CHANGES = 2
-    UNIT_STATE_LAST_CHANGE = 3
-    UNIT_STATE_USES_AND_CHANGES = 4
-
     for tsIdx, ts in enumerate(fd.textSegments):
         for procName, procInstructions in ts.processes.items():
-            tmpProcInstructions = []
-
-            # This matrix represents for each unit the groups of instructions that as far as the unit cares-
-            #   are order-invariant. Looks like~ unitChunks[unit] = [{instruction1, instruction5}, {instruction13},...].
-            # Where chunks are { a bunch of uses }, { a bunch of changes },
-            # { single change (cannot be moved relative to previous changes or next group of uses) }, { uses }...
-            # unitChunks[unit] will be treated as stack
-
-            unitChunks = [[] for _ in range(FileData.TextSegment.Instruction.NUM_UNITS)]
-
-            # Array of previous states per unit
-            unitState = [UNIT_STATE_EMPTY for _ in range(FileData.TextSegment.Instruction.NUM_UNITS)]
-
-            numInstructions = len(procInstructions)
-
-            # Computing unitChunks
-            for idx, procInstruction in enumerate(reversed(procInstructions)):
-                for unit in procInstruction.includes:
-                    if procInstruction.changes[unit]:
-                        if procInstruction.uses[unit]:
-                            unitChunks[unit].append(set([numInstructions-idx-1]))
-                            unitState[unit] = UNIT_STATE_USES_AND_CHANGES
-
-                        elif unitState[unit] == UNIT_STATE_EMPTY or  unitState[unit] == UNIT_STATE_USES or  \
-                                unitState[unit] == UNIT_STATE_USES_AND_CHANGES:
-                            unitChunks[unit].append(set([numInstructions-idx-1]))
-                            unitState[unit] = UNIT_STATE_LAST_CHANGE
-
-                        elif unitState[unit] == UNIT_STATE_LAST_CHANGE:
-                            unitChunks[unit].append(set([numInstructions - idx - 1]))
-                            unitState[unit] = UNIT_STATE_CHANGES
-
-                        else:   # Join a chnages group
-                            unitChunks[unit][-1].add(numInstructions - idx - 1)
-                            unitState[unit] = UNIT_STATE_CHANGES
-
-                    else:   # Must be in uses:
-                        if unitState[unit] == UNIT_STATE_USES:  # Join uses group
-                            unitChunks[unit][-1].add(numInstructions-idx-1)
-
-                        else:   # create new uses group
-                            unitChunks[unit].append(set([numInstructions - idx - 1]))
-                            unitState[unit] = UNIT_STATE_USES
-
-            availableInstructions = ListDict(range(numInstructions))
-            notReady = [0 for _ in range(numInstructions)]  # notReady[ins] = how many units are not ready fo ins
-
-            # Loop over all chunks of units that are not the first chunk and update notReady
-            for unit in range(FileData.TextSegment.Instruction.NUM_UNITS):
-                for chunk in unitChunks[unit][:-1]:
-                    for ins in chunk:
-                        if notReady[ins] == 0:
-                            availableInstructions.remove_item(ins)   # At least 'unit' isn't ready for 'ins'
-                        notReady[ins] += 1
-
-            # Adding in available commands at random:
-            while len(availableInstructions) != 0:
-                ins = availableInstructions.choose_random_item()
-                availableInstructions.remove_item(ins)
-                chosenInstruction = copy.deepcopy(procInstructions[ins])
-
-                tmpProcInstructions.append(chosenInstruction)    # Adding chosen instruction
-
-                # Updating units chunks:
-                for unit in chosenInstruction.includes:
-                    unitChunks[unit][-1].remove(ins)
-
-                    # If we removed last instructions in chunk then unit is ready for next chunk-
-                    if len(unitChunks[unit][-1]) == 0:
-                        unitChunks[unit].pop()
-                        if len(unitChunks[unit]) != 0:
-                            for readyIns in unitChunks[unit][-1]:
-                                notReady[readyIns] -= 1
-                                if notReady[readyIns] == 0:     # Now every unit is ready
-                                    availableInstructions.add_item(readyIns)
-
-            fd.textSegments[tsIdx].processes[procName] = tmpProcInstructions
+            fd.textSegments[tsIdx].processes[procName] = permuteProcedure(procInstructions, rng=rng)
+
+    return fd
+
+
+PARALLEL_MIN_INSTRUCTIONS = 1 << 14    # Smaller files aren't worth sharding across processes
+CHUNK_INSTRUCTIONS = 1 << 12           # Procedures are sent to workers in chunks of about this many instructions
+
+
+def applyStagesToProcedures(stages, procedures):
+    """
+        Worker function applying per-procedure stages to a chunk of procedures (see 'applyProcedureStages').
+        Procedures are passed and returned as compact payloads of lines instead of instruction objects.
+
+    arg 'procedures': array of (array of seeds per stage, growth limit, cycle limit, array of line tuples)-
+                      per procedure
+
+    returns: array per procedure of the resulting lines, each an index of an original line or a new line tuple
+    """
+
+    results = []
+    for seeds, limit, cycleLimit, lines in procedures:
+        instructions = [FileData.TextSegment.Instruction(line) for line in lines]
+        positions = {id(ins): idx for idx, ins in enumerate(instructions)}
+        for stage, seed in zip(stages, seeds):
+            instructions = stage(instructions, limit, random.Random(seed), cycleLimit=cycleLimit)
+        results.append([positions.get(id(ins), ins.line) for ins in instructions])
+
+    return results
+
+
+def applyProcedureStages(fd: FileData, stages, stageIdentities, fused: bool = True, getPool = None,
+                         metrics: Metrics = None, names: [str] = None, analyses: AnalysisManager = None,
+                         requirements: [[str]] = None) -> FileData:
+    """
+        Applies per-procedure techniques (see 'Techniques.stages') to every procedure of 'fd' in place.
+        Every stage of every procedure gets its own random stream (see 'deriveSeed'), so the result doesn't depend-
+        on the order in which procedures and stages are visited, nor on how they are split between processes.
+
+    arg 'stages': array of functions mapping (procedure instructions, growth limit, 'random.Random') to new-
+                  procedure instructions, taking the procedure's cycle limit (see 'FileData.cycleLimits') as-
+                  the keyword argument 'cycleLimit'
+    arg 'stageIdentities': array per stage of a tuple identifying it, from which (with the procedure name)-
+                           the seeds are derived
+    arg 'fused': whether to stream every procedure through all stages back to back (as opposed to stage by stage)
+    arg 'getPool': function returning the 'multiprocessing.Pool' to shard the procedures across in fused mode,-
+                   only called if there are enough instructions to be worth it (None to work in process)
+    arg 'metrics', 'names': collector of metrics (see 'Metrics') and the names of the stages to report them by-
+                            (stages sharded across processes are reported together)
+    arg 'analyses', 'requirements': analysis results to reuse (see 'AnalysisManager') and the names of the-
+                                    procedure analyses every stage takes as keyword arguments (in process only)
+    """
+
+    procedures = [(ts, procName) for ts in fd.textSegments for procName in ts.processes]
+
+    def seedsOf(procName):
+        return [deriveSeed(*identity, procName) for identity in stageIdentities]
+
+    numInstructions = sum(len(ts.processes[procName]) for ts, procName in procedures)
+    if fused and getPool is not None and numInstructions >= PARALLEL_MIN_INSTRUCTIONS:
+        metricsState = metrics.startStage('+'.join(names), fd) if metrics is not None else None
+
+        # Splitting procedures (in order) into chunks of about the same number of instructions:
+        chunks = [[]]
+        chunkInstructions = 0
+        for ts, procName in procedures:
+            instructions = ts.processes[procName]
+            if chunkInstructions >= CHUNK_INSTRUCTIONS:
+                chunks.append([])
+                chunkInstructions = 0
+            chunks[-1].append((seedsOf(procName), fd.growthLimits.get(procName), fd.cycleLimits.get(procName),
+                               [ins.line for ins in instructions]))
+            chunkInstructions += len(instructions)
+
+        results = getPool().starmap(applyStagesToProcedures, [(stages, chunk) for chunk in chunks])
+        procedureResults = (result for chunkResults in results for result in chunkResults)
+        for (ts, procName), result in zip(procedures, procedureResults):
+            instructions = ts.processes[procName]
+            ts.processes[procName] = [instructions[line] if isinstance(line, int) else
+                                      FileData.TextSegment.Instruction(line) for line in result]
+
+        if metrics is not None:
+            metrics.endStage(metricsState, fd)
+
+        return fd
+
+    if metrics is not None:
+        metrics.startProcedureStages(names, fd)
+
+    def runStage(stageIdx, procName, instructions, seed):
+        stage, limit, rng = stages[stageIdx], fd.growthLimits.get(procName), random.Random(seed)
+
+        def analyzedStage(instructions, limit, rng):
+            # The stage along with the analyses it takes, so metrics charge their cost to it
+            kwargs = {name: analyses.procedure(name, procName, instructions)
+                      for name in requirements[stageIdx]} if analyses is not None else dict()
+            return stage(instructions, limit, rng, cycleLimit=fd.cycleLimits.get(procName), **kwargs)
+
+        if metrics is None:
+            return analyzedStage(instructions, limit, rng)
+        return metrics.runProcedureStage(stageIdx, analyzedStage, procName, instructions, limit, rng)
+
+    if fused:
+        for ts, procName in procedures:
+            instructions = ts.processes[procName]
+            for stageIdx, seed in enumerate(seedsOf(procName)):
+                instructions = runStage(stageIdx, procName, instructions, seed)
+            ts.processes[procName] = instructions
+    else:
+        for stageIdx, identity in enumerate(stageIdentities):
+            for ts, procName in procedures:
+                ts.processes[procName] = runStage(stageIdx, procName, ts.processes[procName],
+                                                  deriveSeed(*identity, procName))
+
+    if metrics is not None:
+        metrics.endProcedureStages()
 
     return fd
 
 
-def applyTechniques(file: str, newLocation: str, techniques: Techniques):
+def applyTechniques(file: str, newLocation: str, techniques: Techniques, fused: bool = True, workers: int = 1,
+                    metrics: Metrics = None, cache: OutputCache = None, incrementalState: str = None,
+                    irLocation: str = None):
 
     """
         Function to apply given techniques to a file and save the result.
@@ -306,10 +619,82 @@ def applyTechniques(file: str, newLocation: str, techniques: Techniques):
         arg 'file': the location of the file to which to apply the techniques
         arg 'newLocation': the location to which to save the resulting file
         arg 'techniques': instance of 'Techniques' object specifying which techniques to apply
+        arg 'fused': whether to stream every procedure through consecutive per-procedure techniques at once-
+                     (see 'Techniques.applyTo')
+        arg 'workers': number of processes to shard the procedures of the file across
+        arg 'metrics': collector of the metrics of every stage (see 'Metrics'), None for no instrumentation
+        arg 'cache': cache of results to reuse (see 'OutputCache'), only used when 'techniques' has a seed-
+                     (results are random otherwise) and 'newLocation' is a path
+        arg 'incrementalState': location of the state of the last application to the file (see 'IncrementalState'),-
+                                only procedures changed since then are transformed, None to transform the whole file
+        arg 'irLocation': location of the binary IR of the file, loaded instead of parsing the file when up to date-
+                          and saved otherwise (see 'parseWithIR'), None to always parse the file
     """
 
-    fd = FileData(file)
-    for technique in techniques.techniqueFunctions:
-        fd = technique(fd)
+    if metrics is not None:
+        metrics.startFile(file)
+
+    cacheKey = None
+    if cache is not None and techniques.seed is not None and isinstance(newLocation, (str, os.PathLike)):
+        cacheKey = OutputCache.keyOf(file, techniques)
+        isHit = cache.fetch(cacheKey, newLocation)
+        if metrics is not None:
+            metrics.emit('cache', hit=isHit)
+        if isHit:     # Skipping parsing and the techniques altogether
+            if metrics is not None:
+                metrics.endFile()
+            return
+
+    state = IncrementalState.load(incrementalState) if incrementalState is not None else None
+
+    def parse():
+        return parseWithIR(file, irLocation) if irLocation is not None else FileData(file)
+
+    analyses = AnalysisManager()    # Shared by planning and all the techniques
+
+    def transform(fd):
+        if state is None:
+            return techniques.applyTo(fd, fused, workers, metrics, analyses)
+        return state.apply(fd, techniques, fused, workers, metrics, analyses)
+
+    def runStep(name, step, fd=None):
+        # Applies 'step' to 'fd' (calls it with no arguments if 'fd' is None) and returns the resulting 'FileData'-
+        # object, measured as stage 'name' when metrics are enabled
+        if metrics is None:
+            return step() if fd is None else step(fd)
+        metricsState = metrics.startStage(name, fd)
+        fd = step() if fd is None else step(fd)
+        metrics.endStage(metricsState, fd)
+        return fd
+
+    def planGrowth(fd):
+        fd.growthLimits = techniques.planGrowth(fd, analyses).limits
+        return fd
+
+    def planCycles(fd):
+        fd.cycleLimits = techniques.planCycles(fd, analyses)
+        return fd
+
+    def save(fd):
+        fd.saveFile(newLocation)
+        return fd
+
+    fd = runStep('parse', parse)
+    instructionsIn = countInstructions(fd) if metrics is not None else None
+    if techniques.budget is not None:   # Capping expansions before doing any work
+        fd = runStep('planGrowth', planGrowth, fd)
+    if techniques.maxOverhead is not None:
+        fd = runStep('planCycles', planCycles, fd)
+
+    fd = transform(fd)      # Techniques measure their own stages
+    fd = runStep('saveFile', save, fd)
+
+    if metrics is not None:
+        metrics.emit('analyses', **analyses.stats())
+        metrics.endFile(instructionsIn, countInstructions(fd))
+
+    if state is not None:
+        state.save(incrementalState)
 
-    fd.saveFile(newLocation)
+    if cacheKey is not None:
+        cache.store(cacheKey, newLocation)
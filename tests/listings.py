@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+from benchmarks.listingGenerator import ListingParameters, writeListing
+
+
+class ListingTestCase(unittest.TestCase):
+    """
+        Base of the test cases working on a generated listing: before every test a listing generated with-
+        'PARAMETERS' and 'SEED' is written to 'location', in the temporary directory 'directory' which is removed-
+        after the test (along with anything else the test wrote to it).
+    """
+
+    PARAMETERS = ListingParameters(procedures=8, instructions=60)
+    SEED = 1
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = self.pathOf('listing.asm')
+        writeListing(self.location, self.PARAMETERS, self.SEED)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def pathOf(self, name: str) -> str:
+        # Location of the file 'name' in the temporary directory of the test
+        return os.path.join(self.directory.name, name)
+
+    @staticmethod
+    def contentsOf(location: str) -> bytes:
+        with open(location, 'rb') as f:
+            return f.read()
@@ -0,0 +1,62 @@
+import contextlib
+import io
+import os
+import shutil
+import unittest
+import batchInterface
+from benchmarks.listingGenerator import ListingParameters
+from tests.listings import ListingTestCase
+
+
+class TestBatchInterface(ListingTestCase):
+    """
+        The command line refuses inputs that would be saved to the same file, and processing files in parallel-
+        gives the same results as processing them one at a time.
+    """
+
+    PARAMETERS = ListingParameters(procedures=4, instructions=40, callDensity=0.02)
+    SEED = 5
+
+    def runCommand(self, *argv) -> (int, str):
+        # Runs the command line with the arguments 'argv', returns its exit code and error output
+        errors = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(errors):
+            code = batchInterface.main(list(argv))
+        return code, errors.getvalue()
+
+    def copyListing(self, *path) -> str:
+        location = self.pathOf(os.path.join(*path))
+        os.makedirs(os.path.dirname(location), exist_ok=True)
+        shutil.copyfile(self.location, location)
+        return location
+
+    def testCollisionsAreRejected(self):
+        inputs = self.pathOf('inputs')
+        self.copyListing('inputs', 'a.asm')
+        other = self.copyListing('other', 'a.asm')
+        output = self.pathOf('output')
+
+        code, errors = self.runCommand(inputs, other, '-o', output, '--junk', '--seed', '1', '-w', '1')
+        self.assertEqual(code, 1)
+        self.assertIn('would be saved to the same file', errors)
+        self.assertFalse(os.path.exists(output))
+
+    def testWorkersMatchSerial(self):
+        inputs = self.pathOf('inputs')
+        for path in [('a.asm',), ('b.asm',), ('nested', 'a.asm')]:     # The tree is mirrored, so no collision
+            self.copyListing('inputs', *path)
+
+        results = []
+        for workers in ('1', '3'):
+            output = self.pathOf('output' + workers)
+            code, errors = self.runCommand(inputs, '-o', output, '--junk', '--inline', '--permute', '--seed', '2',
+                                           '-w', workers)
+            self.assertEqual((code, errors), (0, ''))
+            results.append({path: self.contentsOf(os.path.join(output, path))
+                            for path in ('a_nudnik.asm', 'b_nudnik.asm', os.path.join('nested', 'a_nudnik.asm'))})
+
+        self.assertEqual(results[0], results[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import os
+import unittest
+from techniques import *
+from benchmarks.listingGenerator import ListingParameters
+from tests.listings import ListingTestCase
+
+
+class TestBinaryIR(ListingTestCase):
+    """
+        A file loaded from its IR must hold the same lines and analyses as the parsed file, so the techniques-
+        produce the same result from either.
+    """
+
+    PARAMETERS = ListingParameters(procedures=8, instructions=60, callDensity=0.02)
+    SEED = 4
+
+    def setUp(self):
+        super().setUp()
+        self.irLocation = self.pathOf('listing.asm' + IR_SUFFIX)
+
+    def testLoadedMatchesParsed(self):
+        parsed = FileData(self.location)
+        saveIR(parsed, self.irLocation, os.stat(self.location))
+        loaded = loadIR(self.irLocation, os.stat(self.location))
+
+        self.assertEqual(loaded.sourcePath, parsed.sourcePath)
+        self.assertEqual(loaded.functions, parsed.functions)
+        self.assertEqual(len(loaded.textSegments), len(parsed.textSegments))
+        for loadedSeg, parsedSeg in zip(loaded.textSegments, parsed.textSegments):
+            self.assertEqual(loadedSeg.data, parsedSeg.data)
+            self.assertEqual(list(loadedSeg.processes), list(parsedSeg.processes))
+            for procName, instructions in parsedSeg.processes.items():
+                self.assertEqual([(ins.line, ins.uses, ins.changes, ins.includes) for ins in instructions],
+                                 [(tuple(ins.line), ins.uses, ins.changes, ins.includes)
+                                  for ins in loadedSeg.processes[procName]])
+
+        saved, resaved = io.BytesIO(), io.BytesIO()
+        parsed.saveFile(saved)
+        loaded.saveFile(resaved)
+        self.assertEqual(saved.getvalue(), resaved.getvalue())
+
+    def testTechniquesMatchOverIR(self):
+        fromText = io.BytesIO()
+        Techniques(True, True, True, seed=3).applyTo(FileData(self.location)).saveFile(fromText)
+
+        parseWithIR(self.location, self.irLocation)     # Saves the IR
+        fromIR = io.BytesIO()
+        Techniques(True, True, True, seed=3).applyTo(parseWithIR(self.location, self.irLocation)).saveFile(fromIR)
+        self.assertEqual(fromText.getvalue(), fromIR.getvalue())
+
+    def testOutdatedIRIsRejected(self):
+        saveIR(FileData(self.location), self.irLocation, os.stat(self.location))
+        with open(self.location, 'a') as f:
+            f.write('\n')
+        with self.assertRaises(ValueError):
+            loadIR(self.irLocation, os.stat(self.location))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from fileData import FileData
+from controlFlow import *
+
+NESTED_LOOPS = '''
+    push ebp
+    mov ebp, esp
+    xor ecx, ecx
+$LN1@main:
+    xor edx, edx
+$LN2@main:
+    add eax, edx
+    inc edx
+    cmp edx, 10
+    jl $LN2@main
+    inc ecx
+    cmp ecx, 10
+    jl $LN1@main
+    mov edx, 5
+$LN3@main:
+    dec edx
+    jne $LN3@main
+    jmp $LN5@main
+$LN4@main:
+    inc eax
+$LN5@main:
+    pop ebp
+    ret 0
+'''
+
+# Two blocks jumping to each other, both entered from the first block (neither dominates the other):
+IRREDUCIBLE_CYCLE = '''
+    cmp eax, 0
+    je $LA@main
+$LB@main:
+    inc eax
+$LA@main:
+    dec eax
+    jne $LB@main
+    ret 0
+'''
+
+
+def instructionsOf(text: str) -> list:
+    # Utility function parsing the lines of 'text' into instructions (as the body of a procedure)
+    lines = (FileData.tokenizeLine(rawLine) for rawLine in text.strip('\n').splitlines())
+    return [FileData.TextSegment.Instruction(line) for line in lines]
+
+
+class TestControlFlowGraph(unittest.TestCase):
+    """
+        Blocks, dominators and natural loops of small procedures, and the loop depths of the lines inserted-
+        before every line (see 'ControlFlowGraph').
+    """
+
+    def testNestedLoops(self):
+        graph = ControlFlowGraph(instructionsOf(NESTED_LOOPS))
+        self.assertEqual(graph.starts, [0, 3, 5, 10, 13, 14, 17, 18, 20])
+        self.assertEqual(graph.successors, [[1], [2], [2, 3], [1, 4], [5], [5, 6], [8], [8], []])
+
+        # The block after 'jmp' is unreachable, so it has no dominator:
+        self.assertEqual(graph.idoms, [0, 0, 1, 2, 3, 4, 5, None, 6])
+        self.assertTrue(graph.dominates(1, 3))
+        self.assertFalse(graph.dominates(2, 1))
+        self.assertFalse(graph.dominates(7, 8))
+
+        self.assertEqual(graph.loops, {1: {1, 2, 3}, 2: {2}, 5: {5}})
+        self.assertEqual(graph.depths, [0, 0, 0, 0, 1, 1, 2, 2, 2, 2, 1, 1, 1, 0, 0, 1, 1, 0, 0, 0, 0, 0, 0])
+        self.assertEqual([idx for idx, innermost in enumerate(graph.innermost) if innermost], [6, 7, 8, 9, 15, 16])
+
+    def testIrreducibleCycle(self):
+        graph = ControlFlowGraph(instructionsOf(IRREDUCIBLE_CYCLE))
+        self.assertEqual(graph.idoms, [0, 0, 0, 2])
+        self.assertEqual(graph.loops, dict())
+        self.assertEqual(loopDepths(instructionsOf(IRREDUCIBLE_CYCLE)), [0] * 8)
+
+    def testEmptyProcedure(self):
+        graph = ControlFlowGraph([])
+        self.assertEqual((graph.starts, graph.idoms, graph.loops, graph.depths), ([], [], dict(), []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from techniques import *
+from benchmarks.listingGenerator import ListingParameters
+from tests.listings import ListingTestCase
+
+
+class TestOverheadBudget(ListingTestCase):
+    """
+        With 'maxOverhead' the estimated cycles of every procedure, including the procedures it calls, grow by-
+        at most that percentage (see 'Techniques.planCycles').
+    """
+
+    PARAMETERS = ListingParameters(procedures=10, instructions=80, callDensity=0.03, branchDensity=0.1)
+    SEED = 9
+
+    def slowdowns(self, techniques: Techniques) -> Dict[str, float]:
+        # Applies 'techniques' to the listing, returns the relative slowdown of every procedure
+        newLocation = self.pathOf('result.asm')
+        applyTechniques(self.location, newLocation, techniques)
+        before, after = CostModel(FileData(self.location)).cycles, CostModel(FileData(newLocation)).cycles
+        return {procName: after[procName] / cycles - 1 for procName, cycles in before.items()}
+
+    def testWithinBudget(self):
+        for maxOverhead in (5, 20):
+            for kwargs in (dict(pipeline=[Techniques.TECHNIQUE_JUNK_CODE]), dict()):     # Junk only, default pipeline
+                for seed in range(3):
+                    with self.subTest(maxOverhead=maxOverhead, seed=seed, **kwargs):
+                        techniques = Techniques(True, True, True, seed=seed, junkSize=4, maxOverhead=maxOverhead,
+                                                **kwargs)
+                        slowdowns = self.slowdowns(techniques)
+                        self.assertLessEqual(max(slowdowns.values()), maxOverhead / 100 + 1e-9)
+
+    def testBudgetBinds(self):
+        # Without a budget the same techniques slow procedures down well beyond it
+        slowdowns = self.slowdowns(Techniques(True, True, True, seed=0, junkSize=4))
+        self.assertGreater(max(slowdowns.values()), 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
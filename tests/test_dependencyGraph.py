@@ -0,0 +1,68 @@
+import random
+import unittest
+from techniques import *
+from benchmarks.listingGenerator import ListingParameters, generateProcedure
+from tests.listings import ListingTestCase
+
+
+def dataFlow(instructions, order) -> (dict, list):
+    """
+        Utility function tracing the data flow of 'instructions' run in 'order' (array of their indices).
+        returns: tuple of (dictionary mapping every instruction to the writers of the units it uses, array of the-
+                 last writer of every unit), writers given by index (None for the procedure's input)
+    """
+
+    lastWriters = [None] * FileData.TextSegment.Instruction.NUM_UNITS
+    readers = dict()
+    for idx in order:
+        ins = instructions[idx]
+        readers[idx] = tuple(lastWriters[unit] for unit in FileData.TextSegment.Instruction.unitsOf(ins.uses))
+        for unit in FileData.TextSegment.Instruction.unitsOf(ins.changes):
+            lastWriters[unit] = idx
+    return readers, lastWriters
+
+
+class TestDependencyGraph(ListingTestCase):
+    """
+        Every order of the dependency graph must keep the order of the chunks of every unit: each instruction-
+        reads the units it uses from the same writers, the last writer of each unit is the same and instructions-
+        using and changing everything (labels, jumps, calls) stay in place.
+    """
+
+    PARAMETERS = ListingParameters(procedures=6, instructions=150, callDensity=0.02)
+    SEED = 2
+
+    def assertOrdersKeepDataFlow(self, instructions, seeds=range(5)):
+        graph = DependencyGraph(instructions)
+        original = list(range(len(instructions)))
+        expected = dataFlow(instructions, original)
+        allUnits = FileData.TextSegment.Instruction.ALL_UNITS_MASK
+        for seed in seeds:
+            order = graph.randomTopologicalOrder(random.Random(seed))
+            self.assertEqual(sorted(order), original)
+            self.assertEqual(dataFlow(instructions, order), expected)
+            for position, idx in enumerate(order):
+                if instructions[idx].uses == allUnits and instructions[idx].changes == allUnits:
+                    self.assertEqual(position, idx)
+
+    def testStraightLineCode(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                self.assertOrdersKeepDataFlow(generateProcedure(300, random.Random(seed)))
+
+    def testGeneratedListing(self):
+        fd = FileData(self.location)
+        for ts in fd.textSegments:
+            for procName, instructions in ts.processes.items():
+                with self.subTest(procedure=procName):
+                    self.assertOrdersKeepDataFlow(instructions)
+
+    def testOrdersVary(self):
+        instructions = generateProcedure(200, random.Random(1))
+        graph = DependencyGraph(instructions)
+        orders = {tuple(graph.randomTopologicalOrder(random.Random(seed))) for seed in range(5)}
+        self.assertGreater(len(orders), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
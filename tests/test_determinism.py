@@ -0,0 +1,63 @@
+import io
+import unittest
+from unittest import mock
+import techniques
+from techniques import *
+from benchmarks.listingGenerator import ListingParameters
+from tests.listings import ListingTestCase
+
+
+def transformed(location: str, techniques: Techniques, fused: bool = True, workers: int = 1) -> bytes:
+    # Utility function applying 'techniques' to the listing at 'location', returns the resulting file's contents
+    result = io.BytesIO()
+    techniques.applyTo(FileData(location), fused, workers).saveFile(result)
+    return result.getvalue()
+
+
+class TestPipelineModes(ListingTestCase):
+    """
+        Fused, staged and sharded application of the techniques and repeated runs of the same seed must all-
+        produce the very same file.
+    """
+
+    PARAMETERS = ListingParameters(procedures=12, instructions=80, callDensity=0.02)
+    SEED = 3
+
+    def testFusedMatchesStaged(self):
+        for kwargs in [dict(), dict(maxOverhead=10, junkLoopScale=0.5),
+                       dict(budget=GrowthBudget(None, None, 300), junkSkipsInnermostLoops=True)]:
+            with self.subTest(**{name: repr(value) for name, value in kwargs.items()}):
+                fused = transformed(self.location, Techniques(True, True, True, seed=5, **kwargs), fused=True)
+                staged = transformed(self.location, Techniques(True, True, True, seed=5, **kwargs), fused=False)
+                self.assertEqual(fused, staged)
+
+    def testShardedMatchesSerial(self):
+        serial = transformed(self.location, Techniques(True, True, True, seed=5))
+        # Sharding even this small listing, in several chunks:
+        with mock.patch.object(techniques, 'PARALLEL_MIN_INSTRUCTIONS', 0), \
+                mock.patch.object(techniques, 'CHUNK_INSTRUCTIONS', 200):
+            sharded = transformed(self.location, Techniques(True, True, True, seed=5), workers=2)
+        self.assertEqual(serial, sharded)
+
+    def testSameSeedSameOutput(self):
+        first = transformed(self.location, Techniques(True, True, True, seed=11))
+        second = transformed(self.location, Techniques(True, True, True, seed=11))
+        other = transformed(self.location, Techniques(True, True, True, seed=12))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def testSavedFileRoundTrips(self):
+        # Saving a parsed file and parsing the result back must give the very same file again
+        saved = io.BytesIO()
+        FileData(self.location).saveFile(saved)
+        savedLocation = self.pathOf('saved.asm')
+        with open(savedLocation, 'wb') as f:
+            f.write(saved.getvalue())
+
+        resaved = io.BytesIO()
+        FileData(savedLocation).saveFile(resaved)
+        self.assertEqual(saved.getvalue(), resaved.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
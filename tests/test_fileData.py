@@ -0,0 +1,67 @@
+import io
+import os
+import unittest
+from fileData import *
+from benchmarks.listingGenerator import ListingParameters
+from tests.listings import ListingTestCase
+
+
+class TestFileData(ListingTestCase):
+    """
+        Raw lines of a parsed file no longer depend on its (closed) memory mapping, so a file may be saved over-
+        the file it was parsed from. Saving to any stream writes the same contents as saving to a path.
+    """
+
+    PARAMETERS = ListingParameters(procedures=4, instructions=30)
+    SEED = 2
+
+    def testSavesInPlace(self):
+        asideLocation = self.pathOf('aside.asm')
+        fd = FileData(self.location)
+        self.assertIsInstance(fd.data, RawLines)
+        self.assertIsInstance(fd.data.buffer, bytes)    # Copied out of the mapping
+        fd.saveFile(asideLocation)
+
+        fd.saveFile(self.location)
+        self.assertEqual(self.contentsOf(self.location), self.contentsOf(asideLocation))
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['aside.asm', 'listing.asm'])
+
+        # The object still holds all its lines after its source was replaced:
+        fd.saveFile(self.location)
+        self.assertEqual(self.contentsOf(self.location), self.contentsOf(asideLocation))
+
+    def testEqualLinesShareInstructions(self):
+        fd = FileData(self.location)
+        instructions = [ins for ts in fd.textSegments for procInstructions in ts.processes.values()
+                        for ins in procInstructions]
+        distinct = {ins.line: ins for ins in instructions}
+        self.assertLess(len(distinct), len(instructions))
+        self.assertTrue(all(ins is distinct[ins.line] for ins in instructions))
+
+    def testStreamTargets(self):
+        fd = FileData(self.location)
+        savedLocation = self.pathOf('saved.asm')
+        fd.saveFile(savedLocation)
+        expected = self.contentsOf(savedLocation)
+
+        binary = io.BytesIO()
+        fd.saveFile(binary)
+        self.assertEqual(binary.getvalue(), expected)
+
+        text = io.StringIO()
+        fd.saveFile(text)
+        self.assertEqual(text.getvalue().encode(FileData.ENCODING), expected)
+
+        wrapped = io.BytesIO()
+        wrapper = io.TextIOWrapper(wrapped, FileData.ENCODING)     # Like sys.stdout
+        fd.saveFile(wrapper)
+        self.assertEqual(wrapped.getvalue(), expected)
+
+        rawLocation = self.pathOf('raw.asm')
+        with open(rawLocation, 'wb', buffering=0) as raw:  # Unbuffered
+            fd.saveFile(raw)
+        self.assertEqual(self.contentsOf(rawLocation), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
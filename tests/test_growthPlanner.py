@@ -0,0 +1,55 @@
+import os
+import unittest
+from techniques import *
+from benchmarks.listingGenerator import ListingParameters
+from tests.listings import ListingTestCase
+
+
+class TestGrowthBudget(ListingTestCase):
+    """
+        A 'GrowthBudget' is a hard bound: whatever the seed, the resulting file fits every limit of the budget.
+    """
+
+    PARAMETERS = ListingParameters(procedures=10, instructions=60, callDensity=0.04)
+    SEED = 7
+
+    @staticmethod
+    def textLines(fd: FileData) -> int:
+        # Utility function counting the text segment lines of 'fd' (see 'GrowthBudget')
+        return countInstructions(fd) + sum(len(ts.data) for ts in fd.textSegments)
+
+    def assertWithinBudget(self, budget: GrowthBudget, seeds=range(4)):
+        for seed in seeds:
+            with self.subTest(seed=seed):
+                newLocation = self.pathOf('result.asm')
+                applyTechniques(self.location, newLocation, Techniques(True, True, True, seed=seed, budget=budget))
+                result = FileData(newLocation)
+                if budget.maxLines is not None:
+                    self.assertLessEqual(self.textLines(result), budget.maxLines)
+                if budget.maxBytes is not None:
+                    self.assertLessEqual(os.path.getsize(newLocation), budget.maxBytes)
+                if budget.maxProcedureLines is not None:
+                    for ts in result.textSegments:
+                        for procInstructions in ts.processes.values():
+                            self.assertLessEqual(len(procInstructions), budget.maxProcedureLines)
+
+    def testLimits(self):
+        fd = FileData(self.location)
+        lines = self.textLines(fd)
+        longest = max(len(procInstructions) for ts in fd.textSegments for procInstructions in ts.processes.values())
+        unlimited = self.pathOf('unlimited.asm')
+        applyTechniques(self.location, unlimited, Techniques(True, True, True, seed=0))
+        self.assertGreater(os.path.getsize(unlimited), os.path.getsize(self.location) * 1.5)  # The limits bind
+
+        self.assertWithinBudget(GrowthBudget(maxLines=int(lines * 1.5)))
+        self.assertWithinBudget(GrowthBudget(maxBytes=int(os.path.getsize(self.location) * 1.5)))
+        self.assertWithinBudget(GrowthBudget(maxProcedureLines=int(longest * 1.5)))
+
+    def testNoGrowth(self):
+        # A budget of the original size leaves no room for growth at all
+        fd = FileData(self.location)
+        self.assertWithinBudget(GrowthBudget(maxLines=self.textLines(fd)), seeds=range(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
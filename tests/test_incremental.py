@@ -0,0 +1,61 @@
+import unittest
+from techniques import *
+from benchmarks.listingGenerator import ListingParameters
+from tests.listings import ListingTestCase
+
+
+class TestIncremental(ListingTestCase):
+    """
+        Re-applying techniques incrementally must give the same file as applying them to the entire file-
+        (see 'IncrementalState'), both on the first run and after an edit, with and without inlining.
+    """
+
+    PARAMETERS = ListingParameters(procedures=10, instructions=60, callDensity=0.03)
+    SEED = 6
+
+    def setUp(self):
+        super().setUp()
+        self.stateLocation = self.pathOf('listing.json')
+
+    def results(self, name: str, inlining: bool) -> (bytes, bytes, [dict]):
+        # Applies the techniques to the listing entirely and incrementally, returns both results and the metrics-
+        # records of the incremental run
+        fullLocation = self.pathOf(name + '_full.asm')
+        incrementalLocation = self.pathOf(name + '_incremental.asm')
+        applyTechniques(self.location, fullLocation, Techniques(inlining, True, True, seed=8))
+        metrics = Metrics()
+        applyTechniques(self.location, incrementalLocation, Techniques(inlining, True, True, seed=8), metrics=metrics,
+                        incrementalState=self.stateLocation)
+        return self.contentsOf(fullLocation), self.contentsOf(incrementalLocation), \
+            [record for record in metrics.records if record['event'] == 'incremental']
+
+    def assertMatchesFullApplication(self, inlining: bool):
+        full, incremental, records = self.results('first', inlining)
+        self.assertEqual(full, incremental)
+        self.assertEqual(records[0]['dirty'], records[0]['procedures'])
+
+        # Editing a single procedure, the same name keeps the seeds of the rest
+        with open(self.location) as f:
+            text = f.read()
+        prologue = '_f3\tPROC\n\tpush\tebp\n\tmov\tebp, esp\n'
+        self.assertIn(prologue, text)
+        with open(self.location, 'w', newline='\n') as f:
+            f.write(text.replace(prologue, prologue + '\tmov\teax, ecx\n\tadd\tedx, 3\n'))
+
+        full, incremental, records = self.results('edited', inlining)
+        self.assertEqual(full, incremental)
+        if inlining:    # Callers of the edited procedure are dirty as well
+            self.assertGreaterEqual(records[0]['dirty'], 1)
+            self.assertLess(records[0]['dirty'], records[0]['procedures'])
+        else:
+            self.assertEqual(records[0]['dirty'], 1)
+
+    def testMatchesFullApplication(self):
+        self.assertMatchesFullApplication(False)
+
+    def testMatchesFullApplicationWithInlining(self):
+        self.assertMatchesFullApplication(True)
+
+
+if __name__ == '__main__':
+    unittest.main()
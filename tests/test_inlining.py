@@ -0,0 +1,117 @@
+import collections
+import io
+import unittest
+from techniques import *
+from controlFlow import JUMP_MNEMONICS
+from benchmarks.listingGenerator import ListingParameters
+from tests.listings import ListingTestCase
+
+RECURSIVE_LISTING = '''_TEXT\tSEGMENT
+_x$ = 8
+_f\tPROC
+\tpush\tebp
+\tmov\tebp, esp
+\tmov\teax, DWORD PTR _x$[ebp]
+\ttest\teax, eax
+\tje\tSHORT $LN1@f
+\tdec\teax
+\tpush\teax
+\tcall\t_f
+\tadd\tesp, 4
+$LN1@f:
+\tpop\tebp
+\tret\t0
+_f\tENDP
+_TEXT\tENDS
+_TEXT\tSEGMENT
+_x$ = 12
+_main\tPROC
+\tpush\tebp
+\tmov\tebp, esp
+\tpush\tDWORD PTR _x$[ebp]
+\tcall\t_f
+\tadd\tesp, 4
+\tpush\tDWORD PTR _x$[ebp]
+\tcall\t_f
+\tadd\tesp, 4
+\tpop\tebp
+\tret\t0
+_main\tENDP
+_TEXT\tENDS
+END
+'''
+
+
+class TestFunctionInlining(ListingTestCase):
+    """
+        Inlining expands calls transitively and gives every inlined copy of a label or clashing data name a fresh-
+        name (see 'Namespace'), so no name is defined twice and every jump stays within its procedure.
+    """
+
+    PARAMETERS = ListingParameters(procedures=12, instructions=40, callDensity=0.08, callDepth=3,
+                                   branchDensity=0.15)
+    SEED = 3
+
+    def assertNamesConsistent(self, fd: FileData):
+        definitions = collections.Counter()
+        for ts in fd.textSegments:
+            for procName, instructions in ts.processes.items():
+                labels = {ins.line[0][:-1] for ins in instructions if len(ins.line) == 1 and ins.line[0][-1:] == ':'}
+                definitions.update(labels)
+                for ins in instructions:
+                    if len(ins.line) == 2 and ins.line[0] in JUMP_MNEMONICS:
+                        self.assertIn(ins.line[1], labels, procName)
+        self.assertEqual([label for label, count in definitions.items() if count > 1], [])
+
+    def testNamespaceFresh(self):
+        names = Namespace(['$LN1', '$LN2', '_x$'])
+        self.assertEqual(names.fresh('$LN1'), '$LN3')
+        self.assertEqual(names.fresh('$LN1'), '$LN4')
+        self.assertEqual(names.fresh('_x$'), '_x$1')
+        self.assertIn('_x$1', names)
+        self.assertEqual(len(names), 6)
+
+    def testRenamesWithoutCollisions(self):
+        fd = FileData(self.location)
+        self.assertNamesConsistent(fd)
+        self.assertGreater(sum(1 for ts in fd.textSegments for instructions in ts.processes.values()
+                               for ins in instructions if CallGraph.getCallee(ins.line) is not None), 0)
+
+        result = functionInlining(fd)
+        self.assertNamesConsistent(result)
+        # Calls are inlined transitively, so no call to a function of the file is left:
+        for ts in result.textSegments:
+            for procName, instructions in ts.processes.items():
+                self.assertEqual([ins.line for ins in instructions if CallGraph.getCallee(ins.line) in fd.functions],
+                                 [], procName)
+
+        # The result survives saving and parsing again:
+        saved = io.BytesIO()
+        result.saveFile(saved)
+        savedLocation = self.pathOf('inlined.asm')
+        with open(savedLocation, 'wb') as f:
+            f.write(saved.getvalue())
+        self.assertNamesConsistent(FileData(savedLocation))
+
+    def testRecursiveCallsKept(self):
+        location = self.pathOf('recursive.asm')
+        with open(location, 'w') as f:
+            f.write(RECURSIVE_LISTING)
+
+        result = functionInlining(FileData(location))
+        self.assertNamesConsistent(result)
+        main = result.textSegments[1].processes['_main']
+        recursive = result.textSegments[0].processes['_f']
+        self.assertEqual(sum(1 for ins in recursive if ins.line == ('call', '_f')), 1)
+        # Each call site gets one level of the cycle, with copies of its label and data of its own:
+        self.assertEqual(sum(1 for ins in main if ins.line == ('call', '_f')), 2)
+        self.assertEqual(sum(1 for ins in main if ins.line[:1] == ('dec',)), 2)
+        data = result.textSegments[1].data
+        renamed = [name for name in data if name != '_x$']
+        self.assertEqual((data['_x$'], [data[name] for name in renamed]), ('12', ['8', '8']))
+        self.assertEqual(sorted(ins.line[-1] for ins in main if ins.line[:1] == ('mov',) and '_x$' in ins.line[-1]),
+                         sorted('{}[ebp]'.format(name) for name in renamed))
+
+
+if __name__ == '__main__':
+    unittest.main()
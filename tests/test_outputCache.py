@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from outputCache import OutputCache
+from fileData import atomicWrite
+
+
+class TestOutputCache(unittest.TestCase):
+    """
+        Entries of 'OutputCache' are written atomically and the least recently used ones are evicted once the cache-
+        exceeds its size.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = OutputCache(os.path.join(self.directory.name, 'cache'), maxBytes=250)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def writeFile(self, name: str, contents: bytes) -> str:
+        location = os.path.join(self.directory.name, name)
+        with open(location, 'wb') as f:
+            f.write(contents)
+        return location
+
+    def testEvictsLeastRecentlyUsed(self):
+        for idx, key in enumerate(('a', 'b', 'c')):
+            self.cache.store(key, self.writeFile(key, bytes([idx]) * 100))
+            os.utime(self.cache.entryPath(key), (idx, idx))     # Distinct use times regardless of the clock
+
+        # Storing 'c' exceeded the size, so 'a' (the least recently used entry) is gone:
+        self.assertFalse(os.path.exists(self.cache.entryPath('a')))
+        self.assertLessEqual(self.cache.size(), 250)
+
+        fetched = os.path.join(self.directory.name, 'fetched')
+        self.assertTrue(self.cache.fetch('b', fetched))     # Marks 'b' as recently used
+        with open(fetched, 'rb') as f:
+            self.assertEqual(f.read(), bytes([1]) * 100)
+        self.assertFalse(self.cache.fetch('a', fetched))
+
+        self.cache.store('d', self.writeFile('d', b'd' * 100))
+        self.assertTrue(os.path.exists(self.cache.entryPath('b')))
+        self.assertFalse(os.path.exists(self.cache.entryPath('c')))
+
+    def testAtomicWrite(self):
+        location = self.writeFile('target', b'original')
+
+        with self.assertRaises(RuntimeError):
+            with atomicWrite(location) as f:
+                f.write(b'partial')
+                raise RuntimeError
+        with open(location, 'rb') as f:
+            self.assertEqual(f.read(), b'original')     # Untouched by the failed write
+
+        with atomicWrite(location, 'w') as f:
+            f.write('replaced')
+        with open(location, 'rb') as f:
+            self.assertEqual(f.read(), b'replaced')
+
+        # No temporary files are left behind either way:
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['cache', 'target'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,178 +1,372 @@
+import hashlib
 import random
+import re
+from array import array
 from fileData import *
 
-# Utility function for changing names to avoid conflicts
-def increaseName(name: str, boost=1) -> str:
-    l = len(name)
-    if l == 0:
-        return '0'
-
-    i = 0                   # Length of number at end of name
-    t = 0                   # Length of trialing zeros to the left
-    while i+t < l-1 and (ord(name[l-1 - (i+t)]) - ord('0')) in range(0, 10):
-        if name[l-1 - (i+t)] == '0':  # Trailing zero
-            t += 1
-        else:
-            i += t + 1
-            t = 0
 
-    if i == 0:              # No number was found at end of name
-        return name + '1'
+def renameLine(line, labelRenames: dict, namePattern, nameRenames: dict):
+    """
+        Utility function replacing label and data names in a line of code in a single pass.
+
+    arg 'line': the line of code in which to search for replacements
+    arg 'labelRenames': dictionary mapping old label names to new ones (replaced as whole words and label definitions)
+    arg 'namePattern': compiled pattern matching the old data names (see 'getNamePattern'), None if there are none
+    arg 'nameRenames': dictionary mapping old data names to new ones (replaced inside arguments, e.g. {_x$[ebp]})
+
+    returns: the line after the swaps (the same object if nothing was swapped)
+    """
 
-    num = 0
-    for j in name[l - i:]:
-        num *= 10
-        num += ord(j) - ord('0')
+    if len(line) == 1 and line[0][-1:] == ':':       # A label
+        newName = labelRenames.get(line[0][:-1])
+        return line if newName is None else [newName + ':']
 
-    return name[:l - i] + str(num+boost)
+    newLine = None
+    for idx, part in enumerate(line):
+        newPart = labelRenames.get(part, part)
+        if namePattern is not None and idx != 0:
+            newPart = namePattern.sub(lambda match: nameRenames[match.group(0)], newPart)
+        if newPart is not part:
+            if newLine is None:
+                newLine = list(line)
+            newLine[idx] = newPart
 
+    return line if newLine is None else newLine
 
-def swapNames(line, oldName, newName):
+
+def getNamePattern(names):
+    # Utility function compiling the pattern matching any of 'names' as whole operand parts (between the start or-
+    # end of an argument and one of '+-*[],')
+    if len(names) == 0:
+        return None
+    alternatives = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    return re.compile(r'(?<![^+\-*\[\],])(?:' + alternatives + r')(?![^+\-*\[\],])')
+
+
+def getFreeMasks(instructions) -> array:
     """
-        Utility function to replace old names with new ones in a line of code.
+        Utility function computing for each point of a process the bitmask of units that are free to clobber-
+        right before it, i.e. units whose next occurrence in the process is an instruction that only changes them-
+        (as opposed to an instruction that uses them). Past the end of the process nothing is free.
 
-    arg 'line': the line of code in which to search for replacements
-    arg oldName: the old name of the variable
-    arg newName: the newName of the variable
+    arg 'instructions': the instructions of the process
 
-    returns: the line after the swaps (if any)
+    returns: array such that array[i] = bitmask of units free to clobber before instructions[i]
     """
 
-    neighbors = ['+', '-', '*', '[', ']', ',', ' ']
+    # Single backward sweep, one word operation per instruction (see 'Instruction.freeBefore'):
+    numInstructions = len(instructions)
+    freeMasks = array('H', [0]) * numInstructions     # NUM_UNITS bits fit in an unsigned short
+    free = 0
+    for idx in range(numInstructions - 1, -1, -1):
+        ins = instructions[idx]
+        free = ins.freeBefore(free)
+        freeMasks[idx] = free
 
-    length = len(oldName)
-    line = ' '.join(line)
-    i = line.find(oldName)
-    newLine = ''
-    while i != -1:
-        if i > 0 and line[i-1] in neighbors and line[i+length] in neighbors:
-            newLine += line[:i] + newName
-            line = line[i + length:]
-        else:
-            newLine += line[:i+length]
-            line = line[i+length:]
-        i = line.find(oldName)
+    return freeMasks
 
-    newLine += line[:]
-    return newLine.split()
 
+class DependencyGraph:
+    """
+        Compactly stored DAG of the order dependencies between the instructions of a process.
+        Nodes 0..numInstructions-1 are the instructions, nodes from numInstructions on are 'barriers'-
+        standing between two groups of instructions (every instruction of the 1st group must come before every-
+        instruction of the 2nd one) so such groups cost |group1|+|group2| edges instead of |group1|*|group2|.
+        Edges are stored as adjacency arrays: the targets of node v are targets[offsets[v]:offsets[v+1]].
+    """
 
-def swapLabels(line, oldName, newName):
+    __slots__ = ('numInstructions', 'numNodes', 'offsets', 'targets', 'inDegree')
+
+    # Enumeration of states of chunks of a unit, more details in constructor.
+    UNIT_STATE_EMPTY = 0
+    UNIT_STATE_USES = 1
+    UNIT_STATE_CHANGES = 2
+    UNIT_STATE_LAST_CHANGE = 3
+    UNIT_STATE_USES_AND_CHANGES = 4
+
+    def __init__(self, instructions):
+        # For each unit the instructions are split into chunks that as far as the unit cares are order-invariant-
+        # { a bunch of changes }, { single change (cannot be moved relative to previous changes or next group of uses) },
+        # { a bunch of uses }, { single use and change }... and every chunk depends on the chunk before it.
+        # Chunks are built scanning backwards, per unit 'currChunk' is the chunk being built and 'laterChunk'-
+        # the one after it, so when a new chunk starts both are complete and the edges between them are added.
+
+        numUnits = FileData.TextSegment.Instruction.NUM_UNITS
+        numInstructions = len(instructions)
+        self.numInstructions = numInstructions
+
+        sources = array('l')
+        destinations = array('l')
+        numNodes = numInstructions
+
+        def connect(earlier, later):
+            nonlocal numNodes
+            if len(earlier) == 0 or len(later) == 0:
+                return
+            if len(earlier) == 1 or len(later) == 1:
+                for src in earlier:
+                    for dst in later:
+                        sources.append(src)
+                        destinations.append(dst)
+            else:
+                barrier = numNodes
+                numNodes += 1
+                for src in earlier:
+                    sources.append(src)
+                    destinations.append(barrier)
+                for dst in later:
+                    sources.append(barrier)
+                    destinations.append(dst)
+
+        unitState = [DependencyGraph.UNIT_STATE_EMPTY for _ in range(numUnits)]
+        currChunk = [[] for _ in range(numUnits)]
+        laterChunk = [[] for _ in range(numUnits)]
+
+        def startChunk(unit, idx):
+            connect(currChunk[unit], laterChunk[unit])
+            laterChunk[unit] = currChunk[unit]
+            currChunk[unit] = [idx]
+
+        for idx in range(numInstructions - 1, -1, -1):
+            ins = instructions[idx]
+            for unit in FileData.TextSegment.Instruction.unitsOf(ins.includes):
+                state = unitState[unit]
+                if ins.changesUnit(unit):
+                    if ins.usesUnit(unit):
+                        startChunk(unit, idx)
+                        unitState[unit] = DependencyGraph.UNIT_STATE_USES_AND_CHANGES
+
+                    elif state == DependencyGraph.UNIT_STATE_EMPTY or state == DependencyGraph.UNIT_STATE_USES or \
+                            state == DependencyGraph.UNIT_STATE_USES_AND_CHANGES:
+                        startChunk(unit, idx)
+                        unitState[unit] = DependencyGraph.UNIT_STATE_LAST_CHANGE
+
+                    elif state == DependencyGraph.UNIT_STATE_LAST_CHANGE:
+                        startChunk(unit, idx)
+                        unitState[unit] = DependencyGraph.UNIT_STATE_CHANGES
+
+                    else:   # Join a changes group
+                        currChunk[unit].append(idx)
+
+                else:   # Must be in uses:
+                    if state == DependencyGraph.UNIT_STATE_USES:    # Join uses group
+                        currChunk[unit].append(idx)
+
+                    else:   # create new uses group
+                        startChunk(unit, idx)
+                        unitState[unit] = DependencyGraph.UNIT_STATE_USES
+
+        for unit in range(numUnits):
+            connect(currChunk[unit], laterChunk[unit])
+
+        # Converting the edge list to adjacency arrays (counting sort by source):
+        self.numNodes = numNodes
+        self.offsets = array('l', [0]) * (numNodes + 1)
+        self.inDegree = array('l', [0]) * numNodes
+        for src in sources:
+            self.offsets[src + 1] += 1
+        for dst in destinations:
+            self.inDegree[dst] += 1
+        for node in range(numNodes):
+            self.offsets[node + 1] += self.offsets[node]
+
+        self.targets = array('l', [0]) * len(sources)
+        position = self.offsets[:-1]
+        for src, dst in zip(sources, destinations):
+            self.targets[position[src]] = dst
+            position[src] += 1
+
+    def numEdges(self) -> int:
+        return len(self.targets)
+
+    def randomTopologicalOrder(self, rng: random.Random = random) -> [int]:
+        """
+            Returns the instructions (indices) in a uniformly chosen-at-each-step random order respecting the DAG,
+            in O(nodes + edges). Barriers aren't part of the order, they're passed as soon as they're ready.
+
+        arg 'rng': source of randomness ('random.Random' object, or the 'random' module itself)
+        """
+
+        numInstructions = self.numInstructions
+        offsets = self.offsets
+        targets = self.targets
+        inDegree = self.inDegree[:]
+
+        available = ListDict(ins for ins in range(numInstructions) if inDegree[ins] == 0)
+        order = []
+        while len(available) != 0:
+            ins = available.choose_random_item(rng)
+            available.remove_item(ins)
+            order.append(ins)
+
+            passed = [ins]      # Nodes whose outgoing edges are yet to be removed
+            while len(passed) != 0:
+                node = passed.pop()
+                for target in targets[offsets[node]:offsets[node + 1]]:
+                    inDegree[target] -= 1
+                    if inDegree[target] == 0:
+                        if target < numInstructions:
+                            available.add_item(target)
+                        else:       # A barrier, pass it right away
+                            passed.append(target)
+
+        return order
+
+
+def deriveSeed(*identity) -> int:
+    """
+        Utility function deriving a 64 bit seed from 'identity' (e.g. job seed, file, procedure and stage),
+        stable across runs, processes and platforms (unlike 'hash').
     """
-        Utility function to replace old label names with new ones in a line of code.
 
-    arg 'line': the line of code in which to search for replacements
-    arg oldName: the old name of the label
-    arg newName: the newName of the label
+    key = '\0'.join(str(part) for part in identity).encode(FileData.ENCODING, FileData.ENCODING_ERRORS)
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
 
-    returns: the line after the swaps (if any)
+JUNK_IMMEDIATES = range(-64, 65)    # Values of immediate operands of junk instructions (see 'getJunkDistribution')
+
+
+def getJunkDistribution(canChange: int) -> dict:
+    """
+        Utility function computing the exact distribution of the junk line inserted where only the units in the-
+        bitmask 'canChange' may change: mostly a flag changing instruction of two arguments if every flag may-
+        change, else 'inc' or 'dec' if every flag but CF may, else a 'mov', an 'xchg' or nothing at all.
+        returns: dictionary mapping outcomes to their probabilities, an outcome is a tuple of (words of the line,-
+        whether an immediate drawn uniformly from 'JUNK_IMMEDIATES' follows them) or None if nothing is inserted
     """
 
-    if len(line) != 1:          # Too many or too few parts to be a label
-        line = [(newName if part == oldName else part) for part in line]#    if part != 'SHORT']
-        return line
-
-    if line[0][-1:] != ':':     # Incorrect format for a label line
-        return line
-
-    if line[0][:-1] == oldName:
-        return [newName + ':']
-
-    return line
-
-
-def getJunkInstruction(canChange):
-        # Utility function for creating junk instructions that change 'reg' register
-
-        changeFlagsPCAZSO = ['add', 'sub', 'xor', 'and', 'or', 'cmp', 'test']
-        changeFlagsPAZSO_oneArg = ['inc', 'dec']
-
-        # TODO: add support for more intricate instructions (& pass to funct available flags!),-
-        #  and pointer type arguments.
-
-        registerRange = 7
-        smallOptionRegisters = [FileData.TextSegment.Instruction.RSP_IDX, FileData.TextSegment.Instruction.RBP_IDX,
-            FileData.TextSegment.Instruction.RSI_IDX, FileData.TextSegment.Instruction.RDI_IDX]
-
-        registers = [i for i in canChange if i <= registerRange]
-
-        probOnearg = 0.15
-        if all(flagIdx in canChange
-                for flagIdx in [
-                FileData.TextSegment.Instruction.CF_IDX,
-                FileData.TextSegment.Instruction.PF_IDX,
-                FileData.TextSegment.Instruction.AF_IDX,
-                FileData.TextSegment.Instruction.ZF_IDX,
-                FileData.TextSegment.Instruction.SF_IDX,
-                FileData.TextSegment.Instruction.OF_IDX]
-            ) and random.random() > probOnearg:
-            randCommand = random.choice(changeFlagsPCAZSO)
-        elif all(flagIdx in canChange
-                for flagIdx in [
-                FileData.TextSegment.Instruction.PF_IDX,
-                FileData.TextSegment.Instruction.AF_IDX,
-                FileData.TextSegment.Instruction.ZF_IDX,
-                FileData.TextSegment.Instruction.SF_IDX,
-                FileData.TextSegment.Instruction.OF_IDX]
-            ):
-            randCommand = random.choice(changeFlagsPAZSO_oneArg)
-            reg = random.choice(registers)
-
-            nameCeil = 1 if reg in smallOptionRegisters else 3
-            arg = FileData.TextSegment.Instruction.registerNames[reg][random.randint(0, nameCeil)]
-
-            return [FileData.TextSegment.Instruction(
-                [randCommand, arg])]
-        else:
-            probNothing = 0.2   # probability that nothing will be inserted whatsoever
-            probMov = 0.7       # probability that 'mov' command will be used
-            if FileData.TextSegment.Instruction.RSP_IDX not in registers or random.random() > 0.1:
-                if random.random() < probNothing:
-                    return []
-                if random.random() < probNothing + probMov:
-                    randCommand = 'mov'
-                else:
-                    if len(registers) > 1:
-                        reg1, reg2 = random.sample(registers, 2)
-                        arg1 = FileData.TextSegment.Instruction.registerNames[reg1][0]
-                        arg2 = FileData.TextSegment.Instruction.registerNames[reg2][0]
-                        randCommand = 'xchg'
-                        return[FileData.TextSegment.Instruction([randCommand, arg1+',', arg2])]
-                        #return[randCommand, arg1+',', arg2]
-                    else:
-                        return []
+    Instruction = FileData.TextSegment.Instruction
+    changeFlagsPCAZSO = ['add', 'sub', 'xor', 'and', 'or', 'cmp', 'test']
+    changeFlagsPAZSO_oneArg = ['inc', 'dec']
+    smallOptionRegisters = [Instruction.RSP_IDX, Instruction.RBP_IDX, Instruction.RSI_IDX, Instruction.RDI_IDX]
+    registers = Instruction.unitsOf(canChange & Instruction.REGISTERS_MASK)
+    names = Instruction.registerNames
 
-            else:
-                return []
+    # TODO: add support for more intricate instructions (& pass to funct available flags!),-
+    #  and pointer type arguments.
 
-        # The probability the second argument will be a number-
-        #   theres a preference to use numbers since they wont add 'usage' restriction on the otherwise register.
-        probNum = 0.2
+    distribution = dict()
 
+    def add(outcome, probability):
+        if probability > 0:
+            distribution[outcome] = distribution.get(outcome, 0) + probability
 
+    def addTwoArgs(command, probability):
+        # Outcomes of the two argument instructions of 'command', the second argument is an immediate 20% of-
+        # the time (preferred since it adds no use of another register)
         if not registers:
-            return [FileData.TextSegment.Instruction([])]
-        else:
-            reg1 = random.choice(registers)
+            add(((), False), probability)
+            return
 
-        if random.random() < probNum:
-            nameCeil = 1 if reg1 in smallOptionRegisters else 3
-            arg1 = FileData.TextSegment.Instruction.registerNames[reg1][random.randint(0, nameCeil)]
-            arg2 = str(random.randint(-64, 64))
+        for reg1 in registers:
+            regProbability = probability / len(registers)
 
+            nameCeil = 1 if reg1 in smallOptionRegisters else 3
+            for nameIdx in range(nameCeil + 1):
+                add(((command, names[reg1][nameIdx] + ','), True), regProbability * 0.2 / (nameCeil + 1))
+
+            secondRegisters = range(8) if reg1 not in smallOptionRegisters else smallOptionRegisters
+            for reg2 in secondRegisters:
+                nameCeil = 1 if (reg1 in smallOptionRegisters or reg2 in smallOptionRegisters) else 3
+                for nameIdx in range(nameCeil + 1):
+                    add(((command, names[reg1][nameIdx] + ',', names[reg2][nameIdx]), False),
+                        regProbability * 0.8 / len(secondRegisters) / (nameCeil + 1))
+
+    probTwoFlags = 0.85 if canChange & Instruction.FLAGS_MASK == Instruction.FLAGS_MASK else 0
+    for command in changeFlagsPCAZSO:
+        addTwoArgs(command, probTwoFlags / len(changeFlagsPCAZSO))
+
+    probRest = 1 - probTwoFlags
+    if canChange & Instruction.FLAGS_PAZSO_MASK == Instruction.FLAGS_PAZSO_MASK:
+        for command in changeFlagsPAZSO_oneArg:
+            for reg in registers:
+                nameCeil = 1 if reg in smallOptionRegisters else 3
+                for nameIdx in range(nameCeil + 1):
+                    add(((command, names[reg][nameIdx]), False),
+                        probRest / len(changeFlagsPAZSO_oneArg) / len(registers) / (nameCeil + 1))
+    else:
+        probGo = 0.9 if Instruction.RSP_IDX in registers else 1
+        add(None, probRest * (1 - probGo) + probRest * probGo * 0.2)
+        addTwoArgs('mov', probRest * probGo * 0.8 * 0.9)
+
+        probExchange = probRest * probGo * 0.8 * 0.1
+        if len(registers) > 1:
+            numPairs = len(registers) * (len(registers) - 1)
+            for reg1 in registers:
+                for reg2 in registers:
+                    if reg1 != reg2:
+                        add((('xchg', names[reg1][0] + ',', names[reg2][0]), False), probExchange / numPairs)
         else:
+            add(None, probExchange)
+
+    return distribution
+
+
+class JunkTemplate:
+    """
+        A line of junk code, analyzed once and shared by every insertion of it (see 'JunkPool').
+        Lines taking an immediate are analyzed without it (the analysis doesn't depend on its value), so their-
+        instructions of every value are created without analyzing them again.
+    """
+
+    __slots__ = ('words', 'hasImmediate', 'analysis', 'instructions')
+
+    def __init__(self, words, hasImmediate: bool):
+        self.words = words
+        self.hasImmediate = hasImmediate
+        self.analysis = FileData.TextSegment.Instruction.analyze(words + ('0',) if hasImmediate else words)
+        self.instructions = dict()  # Dictionary mapping immediates (None if there is none) to shared instructions
+
+    def instruction(self, immediate=None):
+        ins = self.instructions.get(immediate)
+        if ins is None:
+            line = self.words if immediate is None else self.words + (str(immediate),)
+            ins = self.instructions[immediate] = FileData.TextSegment.Instruction.fromAnalysis(line, *self.analysis)
+        return ins
+
+
+class JunkPool:
+    """
+        The junk instructions for one bitmask of changeable units (see 'getJunkDistribution'), precomputed as-
+        shared templates with cumulative probabilities, so any number of them is-
+        drawn by a couple of batched calls to the random generator.
+    """
+
+    __slots__ = ('templates', 'cumWeights')
+
+    templatesCache = dict()     # Dictionary mapping outcomes to their 'JunkTemplate' objects, shared by all pools
+
+    def __init__(self, canChange: int):
+        distribution = getJunkDistribution(canChange)
+        self.templates = [None if outcome is None else JunkPool.templateOf(outcome) for outcome in distribution]
+        self.cumWeights = list(itertools.accumulate(distribution.values()))
+
+    @staticmethod
+    def templateOf(outcome) -> JunkTemplate:
+        template = JunkPool.templatesCache.get(outcome)
+        if template is None:
+            template = JunkPool.templatesCache[outcome] = JunkTemplate(*outcome)
+        return template
+
+    def sample(self, count: int, rng: random.Random = random) -> list:
+        # Draws 'count' junk instructions independently, None stands for inserting nothing
+        templates = rng.choices(self.templates, cum_weights=self.cumWeights, k=count)
+        numImmediates = sum(1 for template in templates if template is not None and template.hasImmediate)
+        immediates = iter(rng.choices(JUNK_IMMEDIATES, k=numImmediates))
+        return [None if template is None else
+                template.instruction(next(immediates) if template.hasImmediate else None) for template in templates]
 
-            reg2 = random.randint(0, registerRange) if reg1 not in smallOptionRegisters else \
-                random.choice(smallOptionRegisters)
 
-            nameCeil = 1 if (reg1 in smallOptionRegisters or reg2 in smallOptionRegisters) else 3
+junkPools = dict()  # Dictionary mapping bitmasks of changeable registers and flags to their 'JunkPool' objects
 
-            nameIdx = random.randint(0, nameCeil)   # Must be same across both registers to match argument size
-            arg1 = FileData.TextSegment.Instruction.registerNames[reg1][nameIdx]
-            arg2 = FileData.TextSegment.Instruction.registerNames[reg2][nameIdx]
 
-        return [FileData.TextSegment.Instruction(
-            [randCommand, arg1 + ',', arg2])]
+def getJunkPool(canChange: int) -> JunkPool:
+    # Utility function returning the (memoized) 'JunkPool' object of the bitmask 'canChange'
+    key = canChange & (FileData.TextSegment.Instruction.REGISTERS_MASK | FileData.TextSegment.Instruction.FLAGS_MASK)
+    pool = junkPools.get(key)
+    if pool is None:
+        pool = junkPools[key] = JunkPool(key)
+    return pool
 
 
 # Taken from https://stackoverflow.com/questions/15993447/python-data-structure-for-efficient-add-remove-and-random-choice
@@ -200,8 +394,8 @@ class ListDict(object):
             self.items[position] = last_item
             self.item_to_position[last_item] = position
 
-    def choose_random_item(self):
-        return random.choice(self.items)
+    def choose_random_item(self, rng: random.Random = random):
+        return rng.choice(self.items)
 
     def __contains__(self, item):
         return item in self.item_to_position